@@ -0,0 +1,41 @@
+import argparse
+from datetime import date, timedelta
+from pathlib import Path
+
+import polars as pl
+
+#Datos de ejemplo para los modos de varios archivos de input_path: un glob de CSV y un arbol Hive de Parquet
+DATA_DIR= Path(__file__).resolve().parent / 'data'
+
+def frame(inicio: int, filas: int) -> pl.DataFrame: 
+    return pl.DataFrame({
+        'Id': list(range(inicio, inicio+filas)),
+        'Val': [round(i*0.37 % 1, 4) for i in range(inicio, inicio+filas)],
+        'Fecha': [date(2020, 1, 1)+timedelta(days=i) for i in range(inicio, inicio+filas)]
+    })
+
+def shards(filas: int, archivos: int=4) -> None: 
+    #input_path: 'shards/ventas_*.csv'
+    destino= DATA_DIR / 'shards'
+    destino.mkdir(parents=True, exist_ok=True)
+    for i in range(archivos): 
+        frame(inicio=i*filas, filas=filas).with_columns(pl.lit(i % 2 == 0).alias('Flag')).write_csv(destino / f'ventas_{i}.csv')
+
+def hive(filas: int) -> None: 
+    #input_path: 'hive', anio y mes se agregan como columnas desde los directorios
+    n= 0
+    for anio in (2020, 2021): 
+        for mes in (1, 2): 
+            destino= DATA_DIR / 'hive' / f'anio={anio}' / f'mes={mes}'
+            destino.mkdir(parents=True, exist_ok=True)
+            frame(inicio=n*filas, filas=filas).write_parquet(destino / 'part.parquet')
+            n+= 1
+
+if __name__ == '__main__': 
+    parser= argparse.ArgumentParser(description='Genera en data/ unos pocos archivos para probar input_path con glob y particiones Hive')
+    parser.add_argument('--rows', type=int, default=5, help='Filas por archivo')
+    args= parser.parse_args()
+    
+    shards(filas=args.rows)
+    hive(filas=args.rows)
+    print(f'Se generaron los archivos de ejemplo en {DATA_DIR}')
@@ -0,0 +1,77 @@
+import argparse
+import logging
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+import psutil
+
+from .etl.EngineDecision import EngineDecision, CONFIG_PATH
+from .validation.ReadYamlValidation import ReadSchemaValidation
+from .memory_optimizer.Calibration import PeakMemoryMonitor
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+def parse_args(argv: Optional[List[str]]=None) -> argparse.Namespace: 
+    parser= argparse.ArgumentParser(prog='python -m src', description='Pipeline de ingesta a Postgres. Cada corrida puede tener su propio config, entrada y directorio de trabajo')
+    parser.add_argument('--config', type=Path, default=CONFIG_PATH, help='Archivo de configuracion yaml o toml')
+    parser.add_argument('--input', default=None, help='Reemplaza path.input_path: archivo, directorio o glob, relativo a data/ o absoluto')
+    parser.add_argument('--scratch-dir', type=Path, default=None, help='Directorio de la cache de perfiles, la calibracion y el registro de schema de la corrida')
+    parser.add_argument('--workers', type=int, default=None, help='Archivos en paralelo y hilos por archivo Parquet en streaming')
+    parser.add_argument('--env-file', type=Path, default=None, help='Archivo .env con las credenciales de Postgres, tiene prioridad sobre el .env del repositorio')
+    return parser.parse_args(argv)
+
+def overrides(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]: 
+    #Secciones del config que se reemplazan con los argumentos
+    valores= {}
+    if args.input is not None: 
+        valores.setdefault('path', {})['input_path']= args.input
+    if args.scratch_dir is not None: 
+        valores.setdefault('os_configuration', {})['scratch_dir']= str(args.scratch_dir)
+    if args.workers is not None: 
+        valores.setdefault('os_configuration', {}).update({'file_workers': args.workers, 'row_group_workers': args.workers})
+    return valores
+
+def main(argv: Optional[List[str]]=None) -> Dict[str, Any]: 
+    args= parse_args(argv)
+    if args.workers is not None and args.workers < 1: 
+        raise SystemExit('--workers debe ser mayor o igual a 1')
+    if args.env_file is not None: 
+        #load_dotenv no reemplaza variables ya definidas: el .env de la corrida se carga antes que el del repositorio
+        from dotenv import load_dotenv
+        load_dotenv(args.env_file)
+    
+    process = psutil.Process()
+    mem_before = process.memory_info().rss
+    cpu_before = process.cpu_percent(interval=None)
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    
+    with PeakMemoryMonitor() as monitor: 
+        model= ReadSchemaValidation(archivo=args.config, overrides=overrides(args=args)).read_file()
+        EngineDecision(model=model).orquestador_pipeline()
+    
+    elapsed_time = time.perf_counter() - start_time
+    mem_after = process.memory_info().rss
+    mem_used = mem_after - mem_before
+    cpu_after = process.cpu_percent(interval=None)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    metricas= {
+        'tiempo_segundos': elapsed_time,
+        'memoria_rss_bytes': mem_used,
+        'memoria_rss_mb': mem_used / (1024**2),
+        'cpu_percent': cpu_after - cpu_before,
+        'tracemalloc_current_mb': current / (1024**2),
+        'tracemalloc_peak_mb': peak / (1024**2),
+        'memoria_rss_pico_mb': monitor.peak_bytes() / (1024**2)
+    }
+    for metrica, valor in metricas.items(): 
+        print(metrica, valor)
+    return metricas
+
+if __name__ == '__main__': 
+    main()
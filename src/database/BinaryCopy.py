@@ -0,0 +1,168 @@
+import io
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+#Firma, flags y largo de la extension del header del formato binario de COPY
+PGCOPY_HEADER= b'PGCOPY\n\xff\r\n\x00' + (0).to_bytes(4, 'big') + (0).to_bytes(4, 'big')
+PGCOPY_TRAILER= (-1).to_bytes(2, 'big', signed=True)
+
+#Epoch de PostgreSQL (2000-01-01) en microsegundos y dias desde el epoch de unix
+POSTGRES_EPOCH_US= 946_684_800_000_000
+POSTGRES_EPOCH_DAYS= 10_957
+
+#OID del tipo en PostgreSQL -> (tipo de arrow al que se castea, dtype big-endian de numpy)
+PG_FIXED_TYPES= {
+    16: (pa.bool_(), np.dtype('u1')), #boolean
+    21: (pa.int16(), np.dtype('>i2')), #smallint
+    23: (pa.int32(), np.dtype('>i4')), #integer
+    20: (pa.int64(), np.dtype('>i8')), #bigint
+    700: (pa.float32(), np.dtype('>f4')), #real
+    701: (pa.float64(), np.dtype('>f8')), #double precision
+    1082: (pa.date32(), np.dtype('>i4')), #date
+    1114: (pa.timestamp('us'), np.dtype('>i8')), #timestamp
+    1184: (pa.timestamp('us', tz='UTC'), np.dtype('>i8')) #timestamptz
+}
+#text, varchar, bpchar
+PG_TEXT_TYPES= {25, 1043, 1042}
+
+class BinaryCopyEncoder: 
+    def __init__(self, table_name: str, pg_types: Dict[str, int]): 
+        self.table_name= table_name
+        self.pg_types= pg_types
+    
+    @classmethod
+    def from_connection(cls, conn, table_name: str) -> 'BinaryCopyEncoder': 
+        with conn.cursor() as cur: 
+            cur.execute(f'SELECT * FROM {table_name} LIMIT 0')
+            pg_types= {col.name: col.type_code for col in cur.description}
+        return cls(table_name=table_name, pg_types=pg_types)
+    
+    def copy_sql(self, columnas: List[str], table_name: Optional[str]=None) -> str: 
+        columnas_sql= ', '.join(f'"{col}"' for col in columnas)
+        return f'COPY {table_name or self.table_name} ({columnas_sql}) FROM STDIN WITH (FORMAT binary)'
+    
+    def supports(self, schema: pa.Schema) -> bool: 
+        for field in schema: 
+            oid= self.pg_types.get(field.name)
+            if oid is None: 
+                return False
+            
+            tipo= field.type
+            if oid in PG_TEXT_TYPES: 
+                if not (pa.types.is_string(tipo) or pa.types.is_large_string(tipo) or pa.types.is_string_view(tipo)): 
+                    return False
+            elif oid == 16: 
+                if not pa.types.is_boolean(tipo): 
+                    return False
+            elif oid in (21, 23, 20): 
+                if not pa.types.is_integer(tipo): 
+                    return False
+            elif oid in (700, 701): 
+                if not (pa.types.is_floating(tipo) or pa.types.is_integer(tipo)): 
+                    return False
+            elif oid == 1082: 
+                if not pa.types.is_date(tipo): 
+                    return False
+            elif oid in (1114, 1184): 
+                if not pa.types.is_timestamp(tipo): 
+                    return False
+            else: 
+                return False
+        return True
+    
+    @staticmethod
+    def _binary_from_rows(data: np.ndarray, sizes: np.ndarray) -> pa.Array: 
+        offsets= np.zeros(len(sizes)+1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        return pa.Array.from_buffers(
+            pa.large_binary(),
+            len(sizes),
+            [None, pa.py_buffer(offsets), pa.py_buffer(data)]
+        )
+    
+    def _fixed_field(self, columna: pa.Array, oid: int) -> pa.Array: 
+        tipo_arrow, dtype= PG_FIXED_TYPES[oid]
+        ancho= dtype.itemsize
+        n= len(columna)
+        
+        #Cast seguro para enteros (un overflow manda el batch al fallback de CSV),
+        #con perdida permitida para flotantes y unidades de tiempo
+        valores= pc.cast(columna, tipo_arrow, safe=oid in (21, 23, 20))
+        validos= columna.is_valid().to_numpy(zero_copy_only=False)
+        
+        if oid in (1114, 1184): 
+            crudos= pc.fill_null(valores.cast(pa.int64()), 0).to_numpy() - POSTGRES_EPOCH_US
+        elif oid == 1082: 
+            crudos= pc.fill_null(valores.cast(pa.int32()), 0).to_numpy() - POSTGRES_EPOCH_DAYS
+        elif oid == 16: 
+            crudos= pc.fill_null(valores, False).to_numpy(zero_copy_only=False)
+        else: 
+            crudos= pc.fill_null(valores, 0).to_numpy()
+        
+        filas= np.empty((n, 4+ancho), dtype=np.uint8)
+        filas[:, :4]= np.where(validos, ancho, -1).astype('>i4').view(np.uint8).reshape(n, 4)
+        filas[:, 4:]= crudos.astype(dtype).view(np.uint8).reshape(n, ancho)
+        
+        if validos.all(): 
+            return self._binary_from_rows(data=filas.reshape(-1), sizes=np.full(n, 4+ancho, dtype=np.int64))
+        
+        #Los nulos solo llevan el largo -1, sin payload
+        mascara= np.ones((n, 4+ancho), dtype=bool)
+        mascara[~validos, 4:]= False
+        return self._binary_from_rows(data=filas[mascara], sizes=np.where(validos, 4+ancho, 4).astype(np.int64))
+    
+    def _text_field(self, columna: pa.Array) -> pa.Array: 
+        if pa.types.is_string_view(columna.type): 
+            columna= pc.cast(columna, pa.large_string())
+        binario= pc.cast(columna, pa.large_binary())
+        n= len(binario)
+        
+        largos= pc.fill_null(pc.binary_length(binario), -1).to_numpy().astype('>i4')
+        prefijos= self._binary_from_rows(data=largos.view(np.uint8), sizes=np.full(n, 4, dtype=np.int64))
+        
+        return pc.binary_join_element_wise(
+            prefijos,
+            binario,
+            pa.scalar(b'', pa.large_binary()),
+            null_handling='replace',
+            null_replacement=''
+        )
+    
+    def encode(self, table: pa.Table) -> Optional[io.BytesIO]: 
+        if not self.supports(table.schema): 
+            return None
+        
+        campos= [pa.scalar(len(table.columns).to_bytes(2, 'big'), pa.large_binary())]
+        try: 
+            for field, columna in zip(table.schema, table.columns): 
+                oid= self.pg_types[field.name]
+                columna= columna.combine_chunks()
+                if oid in PG_TEXT_TYPES: 
+                    campos.append(self._text_field(columna=columna))
+                else: 
+                    campos.append(self._fixed_field(columna=columna, oid=oid))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e: 
+            logger.warning(f'No se pudo codificar el batch en formato binario, se usara CSV:\n{e}')
+            return None
+        
+        campos.append(pa.scalar(b'', pa.large_binary()))
+        filas= pc.binary_join_element_wise(*campos)
+        
+        #Las filas ya quedan contiguas en el buffer de datos del arreglo resultante
+        offsets= np.frombuffer(filas.buffers()[1], dtype=np.int64)[filas.offset: filas.offset+len(filas)+1]
+        datos= filas.buffers()[2]
+        
+        buff= io.BytesIO()
+        buff.write(PGCOPY_HEADER)
+        if len(filas): 
+            buff.write(memoryview(datos)[offsets[0]:offsets[-1]])
+        buff.write(PGCOPY_TRAILER)
+        buff.seek(0)
+        return buff
@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Iterator, List
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+_FIN= object()
+
+class CopyPipeline: 
+    #Un hilo productor recolecta y codifica el batch N+1 mientras el hilo que llama
+    #manda el batch N a COPY. La cola acotada limita cuantos batches viven en memoria
+    def __init__(self, queue_depth: int=1): 
+        self.queue_depth= max(1, queue_depth)
+        self.cola= queue.Queue(maxsize=self.queue_depth)
+        self.detener= threading.Event()
+    
+    def _put(self, item: Any) -> bool: 
+        while not self.detener.is_set(): 
+            try: 
+                self.cola.put(item, timeout=0.5)
+                return True
+            except queue.Full: 
+                continue
+        return False
+    
+    def _producer(self, batches: Iterator[Any], encode: Callable[[Any], Any]) -> None: 
+        try: 
+            for batch in batches: 
+                item= encode(batch)
+                del batch
+                if not self._put(item): 
+                    return
+            self._put(_FIN)
+        except BaseException as e: 
+            self._put(e)
+    
+    def run(self, batches: Iterator[Any], encode: Callable[[Any], Any], consume: Callable[[Any], None]) -> None: 
+        productor= threading.Thread(
+            target=self._producer,
+            args=(batches, encode),
+            name='copy-pipeline-producer',
+            daemon=True
+        )
+        productor.start()
+        logger.info(f'Pipeline de COPY iniciado con una cola de {self.queue_depth} batches')
+        
+        try: 
+            while True: 
+                item= self.cola.get()
+                if item is _FIN: 
+                    break
+                if isinstance(item, BaseException): 
+                    raise item
+                consume(item)
+                del item
+        finally: 
+            self.detener.set()
+            productor.join()
+    
+    def run_parallel(self, batches: Iterator[Any], encode: Callable[[Any], Any], consumers: List[Callable[[Any], None]]) -> None: 
+        #Varios consumidores toman batches de la misma cola, cada uno con su propia conexion
+        errores= []
+        
+        def _consumer(consume: Callable[[Any], None]) -> None: 
+            try: 
+                while not self.detener.is_set(): 
+                    try: 
+                        item= self.cola.get(timeout=0.5)
+                    except queue.Empty: 
+                        continue
+                    if item is _FIN: 
+                        #Se regresa el fin a la cola para los demas consumidores
+                        self._put(_FIN)
+                        return
+                    if isinstance(item, BaseException): 
+                        raise item
+                    consume(item)
+                    del item
+            except BaseException as e: 
+                errores.append(e)
+                self.detener.set()
+        
+        productor= threading.Thread(
+            target=self._producer, 
+            args=(batches, encode), 
+            name='copy-pipeline-producer', 
+            daemon=True
+        )
+        hilos= [
+            threading.Thread(target=_consumer, args=(consume,), name=f'copy-pipeline-consumer-{i}', daemon=True)
+            for i, consume in enumerate(consumers)
+        ]
+        productor.start()
+        for hilo in hilos: 
+            hilo.start()
+        logger.info(f'Pipeline de COPY iniciado con {len(hilos)} conexiones y una cola de {self.queue_depth} batches')
+        
+        for hilo in hilos: 
+            hilo.join()
+        self.detener.set()
+        productor.join()
+        
+        if errores: 
+            raise errores[0]
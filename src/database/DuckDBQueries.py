@@ -1,7 +1,5 @@
-import duckdb 
 import polars as pl
 import os
-from dotenv import load_dotenv
 from pathlib import Path
 
 import logging 
@@ -19,6 +17,9 @@ class DuckDBPostgresConnector:
         
         ruta= Path(__file__).resolve().parent.parent.parent
         ruta_env= ruta / ".env"
+        #duckdb y dotenv se importan al registrar la conexion, no al importar el modulo
+        from dotenv import load_dotenv
+        import duckdb
         load_dotenv(ruta_env)
         
         duckdb.connect()
@@ -54,6 +55,7 @@ class DuckDBPostgresConnector:
     @classmethod
     def query(cls, sql: str) -> pl.DataFrame: 
         cls._secret_registro()
+        import duckdb
         try: 
             result= duckdb.sql(sql)
             logger.info('\nConsulta ejecutada con exito')
@@ -0,0 +1,93 @@
+import json
+import logging
+from typing import Dict, Any, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+#psycopg2 se importa al consultar: sin carga incremental ni checkpoint este modulo solo se importa por el config
+
+class LoadStateStore: 
+    #Marcas de agua de las cargas incrementales en Postgres, una fila por archivo fuente y tabla destino.
+    #Se escriben con el cursor de la carga para quedar en la misma transaccion que los datos
+    def __init__(self, uri: str, state_table: str='pipeline_load_state'): 
+        self.uri= uri
+        self.state_table= state_table
+    
+    def _ensure(self, cur) -> None: 
+        cur.execute(f'''CREATE TABLE IF NOT EXISTS {self.state_table} (
+            source TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            watermark JSONB NOT NULL,
+            actualizado TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (source, table_name)
+        )''')
+    
+    def get(self, source: str, table_name: str) -> Optional[Dict[str, Any]]: 
+        #Sin la tabla destino la marca de agua no sirve: se vuelve a cargar el archivo completo
+        import psycopg2
+        conn= psycopg2.connect(self.uri)
+        try: 
+            with conn.cursor() as cur: 
+                self._ensure(cur=cur)
+                cur.execute('SELECT to_regclass(%s)', (table_name,))
+                if cur.fetchone()[0] is None: 
+                    conn.commit()
+                    return None
+                
+                cur.execute(f'SELECT watermark FROM {self.state_table} WHERE source = %s AND table_name = %s', (source, table_name))
+                fila= cur.fetchone()
+            conn.commit()
+            return fila[0] if fila else None
+        finally: 
+            conn.close()
+    
+    def save(self, cur, source: str, table_name: str, watermark: Dict[str, Any], reset_table: bool=False) -> None: 
+        self._ensure(cur=cur)
+        if reset_table: 
+            #La tabla se reemplazo: las marcas de agua de otros archivos ya no tienen datos detras
+            cur.execute(f'DELETE FROM {self.state_table} WHERE table_name = %s AND source <> %s', (table_name, source))
+        
+        cur.execute(f'''INSERT INTO {self.state_table} (source, table_name, watermark) VALUES (%s, %s, %s)
+            ON CONFLICT (source, table_name) DO UPDATE SET watermark = EXCLUDED.watermark, actualizado = now()''',
+            (source, table_name, json.dumps(watermark)))
+        logger.info(f'Marca de agua de {table_name} actualizada: {watermark}')
+
+class CheckpointStore: 
+    #Ultima posicion confirmada de una corrida por streaming, se escribe antes de cada commit
+    #de la carga y se borra cuando la corrida termina
+    def __init__(self, uri: str, table: str='pipeline_checkpoints'): 
+        self.uri= uri
+        self.table= table
+    
+    def _ensure(self, cur) -> None: 
+        cur.execute(f'''CREATE TABLE IF NOT EXISTS {self.table} (
+            source TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            checkpoint JSONB NOT NULL,
+            actualizado TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (source, table_name)
+        )''')
+    
+    def get(self, source: str, table_name: str) -> Optional[Dict[str, Any]]: 
+        import psycopg2
+        conn= psycopg2.connect(self.uri)
+        try: 
+            with conn.cursor() as cur: 
+                self._ensure(cur=cur)
+                cur.execute(f'SELECT checkpoint FROM {self.table} WHERE source = %s AND table_name = %s', (source, table_name))
+                fila= cur.fetchone()
+            conn.commit()
+            return fila[0] if fila else None
+        finally: 
+            conn.close()
+    
+    def save(self, cur, source: str, table_name: str, checkpoint: Dict[str, Any]) -> None: 
+        self._ensure(cur=cur)
+        cur.execute(f'''INSERT INTO {self.table} (source, table_name, checkpoint) VALUES (%s, %s, %s)
+            ON CONFLICT (source, table_name) DO UPDATE SET checkpoint = EXCLUDED.checkpoint, actualizado = now()''',
+            (source, table_name, json.dumps(checkpoint)))
+    
+    def clear(self, cur, source: str, table_name: str) -> None: 
+        self._ensure(cur=cur)
+        cur.execute(f'DELETE FROM {self.table} WHERE source = %s AND table_name = %s', (source, table_name))
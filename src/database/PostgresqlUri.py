@@ -1,29 +1,46 @@
-from dotenv import load_dotenv
 import os
 import polars as pl
 import gc
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Union, Tuple, Optional, List, Callable
 import logging
-import psutil
 from pathlib import Path
 
-import pyarrow.csv as pv
-
-import psycopg2
 import io 
+import itertools
+import threading
+import uuid
+
+from .CopyPipeline import CopyPipeline
+from ..memory_optimizer.BatchController import AdaptiveBatchController
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
 logger= logging.getLogger(__name__)
 
+#psycopg2, dotenv, pyarrow.csv y el encoder binario (pyarrow.compute) se importan al usarse: la validacion
+#del config y la decision de carga no los necesitan
+
 class PostgresDatabase: 
-    def __init__(self, table_name: str, file_overhead: Dict[str, Any], if_table_exists: str):
+    def __init__(self, table_name: str, file_overhead: Dict[str, Any], if_table_exists: str, commit_interval: int=0, copy_format: str='binary', parallel_connections: int=1, controller: Optional[AdaptiveBatchController]=None, incremental: Optional[Any]=None, checkpoint: Optional[Any]=None):
         self.table_name= table_name
         self.file_overhead= file_overhead
         self.if_table_exists= if_table_exists
+        #Numero de batches entre commits, 0 para una sola transaccion
+        self.commit_interval= commit_interval
+        self.copy_format= copy_format
+        self.parallel_connections= parallel_connections
+        self.encoder= None
+        #Se comparte el controlador con el lector para que los batches usen la misma medicion
+        self.controller= controller if controller is not None else AdaptiveBatchController(file_overhead=file_overhead)
+        #Marca de agua de la carga incremental, se guarda en la misma transaccion que los datos
+        self.incremental= incremental
+        #Checkpoint de la corrida por streaming, se guarda antes de cada commit intermedio
+        self.checkpoint= checkpoint
     
-    def uri_database(self) -> str: 
+    @staticmethod
+    def uri_database() -> str: 
         ruta= Path(__file__).resolve().parent.parent.parent
         ruta_env= ruta / ".env"
+        from dotenv import load_dotenv
         load_dotenv(ruta_env)
         
         user= os.getenv('POSTGRES_USER')
@@ -35,83 +52,205 @@ class PostgresDatabase:
         uri= f'postgresql://{user}:{password}@{postgresql_host_localhost}:{postgresql_port}/{db}'
         return uri
     
-    def current_memory(self) -> int: 
-        process= psutil.Process()
-        return process.memory_info().rss
+    def _create_table(self, frame: pl.DataFrame, uri: str) -> None: 
+        frame.slice(0,0).write_database(
+            table_name=self.table_name, 
+            connection=uri, 
+            if_table_exists=self.if_table_exists
+        )
+    
+    def _save_state(self, conn) -> None: 
+        #Commit final: la marca de agua avanza y el checkpoint de la corrida ya no hace falta
+        with conn.cursor() as cur: 
+            if self.incremental is not None: 
+                if_table_exists= self.checkpoint.if_table_exists if self.checkpoint is not None else self.if_table_exists
+                self.incremental.save(cur=cur, if_table_exists=if_table_exists)
+            if self.checkpoint is not None: 
+                self.checkpoint.clear(cur=cur)
+    
+    def _save_checkpoint(self, conn, filas: int) -> None: 
+        if self.checkpoint is None: 
+            return
+        with conn.cursor() as cur: 
+            self.checkpoint.save(cur=cur, filas=filas)
     
-    def optimal_batch_size(self, memoria_del_proceso: int, batch_size: int=2_000_000) -> int: 
-        memoria_disponible= psutil.virtual_memory().available
+    def _encode_frame(self, frame: pl.DataFrame) -> Tuple[Optional[List[str]], io.BytesIO, int]: 
+        #Las columnas solo se regresan para COPY binario, None indica que el buffer es CSV
+        df= frame.to_arrow()
+        filas= df.num_rows
         
-        memory_pressure= memoria_del_proceso/memoria_disponible
+        if self.copy_format == 'binary' and self.encoder is not None: 
+            binary_buff= self.encoder.encode(table=df)
+            if binary_buff is not None: 
+                return (df.column_names, binary_buff, filas)
+            logger.warning(f'El schema {df.schema} no es compatible con COPY binario en la tabla {self.table_name}. Se usara CSV para el batch')
         
-        if memory_pressure >= 0.9: 
-            batch_size= 500_000
-            logger.warning(f'Alta presion en memoria {memory_pressure:.2f}. Batch size nuevo {batch_size}')
-        elif memory_pressure < 0.6: 
-            batch_size=1_000_000
-            logger.warning(f'Baja presion en memoria {memory_pressure:.2f}. Batch size nuevo {batch_size}')
-        elif memory_pressure <= 0.3: 
-            batch_size= int(batch_size*1.3)
-            logger.warning(f'Baja presion en memoria {memory_pressure:.2f}. Batch size nuevo {batch_size}')
+        import pyarrow.csv as pv
+        csv_buff= io.BytesIO()
+        pv.write_csv(df, csv_buff)
+        csv_buff.seek(0)
+        return (None, csv_buff, filas)
+    
+    def _copy_buffer(self, conn, table_name: str, columnas: Optional[List[str]], buff: io.BytesIO) -> None: 
+        if columnas is None: 
+            sql= f'COPY {table_name} FROM STDIN WITH CSV HEADER'
         else: 
-            batch_size= batch_size
+            sql= self.encoder.copy_sql(columnas=columnas, table_name=table_name)
         
-        return batch_size
+        with conn.cursor() as cur: 
+            cur.copy_expert(sql, buff)
     
     def insert_data_to_database(self, frame: pl.LazyFrame) -> None: 
-        filas_totales= self.file_overhead['total_de_filas']
+        #El plan se ejecuta una sola vez y se consume como stream de batches, 
+        #en lugar de re-escanear el archivo con un slice por cada batch. 
+        #El controlador junta los chunks en batches del tamaño que pide la memoria
+        chunks= frame.collect_batches(chunk_size=self.controller.min_rows, maintain_order=True, engine='streaming')
+        self.insert_streaming_data(batches=self._observed(chunks=self.controller.rebatch(chunks=chunks)))
+    
+    def _observed(self, chunks: Iterator[pl.DataFrame]) -> Iterator[pl.DataFrame]: 
+        #La marca de agua de la carga incremental sale de los batches que se copian, no de otro scan del archivo
+        from ..etl.Incremental import WATERMARK_COLUMN
+        for chunk in chunks: 
+            if WATERMARK_COLUMN in chunk.columns: 
+                self.incremental.observe(frame=chunk)
+                chunk= chunk.drop(WATERMARK_COLUMN)
+            yield chunk
+    
+    def _insert_single(self, conn, pipeline: CopyPipeline, batches: Iterator[pl.DataFrame]) -> int: 
+        conteo= {'filas': 0, 'batch': 0, 'sin_commit': 0}
         
+        def consume(copy: Tuple[Optional[List[str]], io.BytesIO, int]) -> None: 
+            columnas, buff, filas= copy
+            self._copy_buffer(conn=conn, table_name=self.table_name, columnas=columnas, buff=buff)
+            del buff
+            
+            conteo['filas']+=filas
+            conteo['batch']+=1
+            conteo['sin_commit']+=1
+            logger.info(f'Batch {conteo["batch"]} insertado ({filas} filas)')
+            
+            if self.commit_interval and conteo['sin_commit'] >= self.commit_interval: 
+                self._save_checkpoint(conn=conn, filas=conteo['filas'])
+                conn.commit()
+                conteo['sin_commit']= 0
+                logger.info(f'Commit realizado despues de {conteo["batch"]} batches ({conteo["filas"]} filas)')
+            gc.collect()
+        
+        pipeline.run(batches=batches, encode=self._encode_frame, consume=consume)
+        self._save_state(conn=conn)
+        conn.commit()
+        return conteo['filas']
+    
+    def _insert_parallel(self, conn, uri: str, pipeline: CopyPipeline, batches: Iterator[pl.DataFrame]) -> int: 
+        #Cada conexion carga batches disjuntos en su propia tabla UNLOGGED de staging 
+        #y al final se pasa todo a la tabla destino en una sola transaccion
+        sufijo= uuid.uuid4().hex[:8]
+        staging= [f'{self.table_name}_stg_{sufijo}_{i}' for i in range(self.parallel_connections)]
+        conexiones= []
+        conteo= {'filas': 0, 'batch': 0}
+        lock= threading.Lock()
+        
+        def _consumer(worker_conn, tabla: str) -> Callable: 
+            def consume(copy: Tuple[Optional[List[str]], io.BytesIO, int]) -> None: 
+                columnas, buff, filas= copy
+                self._copy_buffer(conn=worker_conn, table_name=tabla, columnas=columnas, buff=buff)
+                del buff
+                
+                with lock: 
+                    conteo['filas']+=filas
+                    conteo['batch']+=1
+                    logger.info(f'Batch {conteo["batch"]} insertado en {tabla} ({filas} filas)')
+            return consume
+        
+        try: 
+            with conn.cursor() as cur: 
+                for tabla in staging: 
+                    cur.execute(f'CREATE UNLOGGED TABLE {tabla} (LIKE {self.table_name} INCLUDING DEFAULTS)')
+            conn.commit()
+            
+            import psycopg2
+            conexiones= [psycopg2.connect(uri) for _ in staging]
+            consumers= [_consumer(worker_conn=worker_conn, tabla=tabla) for worker_conn, tabla in zip(conexiones, staging)]
+            pipeline.run_parallel(batches=batches, encode=self._encode_frame, consumers=consumers)
+            
+            for worker_conn in conexiones: 
+                worker_conn.commit()
+            
+            union= ' UNION ALL '.join(f'SELECT * FROM {tabla}' for tabla in staging)
+            with conn.cursor() as cur: 
+                cur.execute(f'INSERT INTO {self.table_name} {union}')
+                for tabla in staging: 
+                    cur.execute(f'DROP TABLE {tabla}')
+            self._save_state(conn=conn)
+            conn.commit()
+            logger.info(f'Se movieron {conteo["filas"]} filas de {len(staging)} tablas de staging a {self.table_name}')
+            return conteo['filas']
+        except Exception: 
+            #Se cierran primero las conexiones de staging para liberar sus locks antes del DROP
+            for worker_conn in conexiones: 
+                worker_conn.rollback()
+                worker_conn.close()
+            conexiones= []
+            
+            conn.rollback()
+            with conn.cursor() as cur: 
+                for tabla in staging: 
+                    cur.execute(f'DROP TABLE IF EXISTS {tabla}')
+            conn.commit()
+            raise
+        finally: 
+            for worker_conn in conexiones: 
+                worker_conn.close()
+    
+    def insert_streaming_data(self, batches: Iterator[pl.DataFrame]) -> int: 
+        #Un hilo recolecta y codifica el siguiente batch mientras se hace el COPY del actual, 
+        #la cola acotada por memoria limita cuantos batches viven al mismo tiempo
+        import psycopg2
         uri= self.uri_database()
         conn= None
+        batches= iter(batches)
         
         try: 
             conn= psycopg2.connect(uri)
             logger.info('\nSe conecto correctamente a la base de datos')
             
-            frame.slice(0,0).collect(engine='streaming').write_database(
-                table_name=self.table_name, 
-                connection=uri, 
-                if_table_exists=self.if_table_exists
-            )
+            primer_batch= next(batches, None)
+            if primer_batch is None: 
+                logger.warning(f'No hay batches para insertar en la tabla {self.table_name}')
+                #Las filas nuevas no pasaron los filtros, pero la marca de agua si avanza
+                self._save_state(conn=conn)
+                conn.commit()
+                return 0
             
-            offset= 0
-            batch= 0
+            self._create_table(frame=primer_batch, uri=uri)
+            if self.copy_format == 'binary': 
+                from .BinaryCopy import BinaryCopyEncoder
+                self.encoder= BinaryCopyEncoder.from_connection(conn=conn, table_name=self.table_name)
             
-            while offset < filas_totales:
-                mp= self.current_memory()
-                optimal_batch_size= self.optimal_batch_size(memoria_del_proceso=mp)
-                
-                df= frame.slice(offset, optimal_batch_size).collect(engine='streaming').to_arrow()
-                
-                csv_buff= io.BytesIO()
-                pv.write_csv(df, csv_buff)
-                csv_buff.seek(0)
-                
-                with conn.cursor() as cur: 
-                    cur.copy_expert(f'COPY {self.table_name} FROM STDIN WITH CSV HEADER', csv_buff)
-                logger.info(f'Batch {batch+1} insertado ({len(df)} filas)')
-                
-                del df
-                gc.collect()
-                
-                batch+=1
-                offset+=optimal_batch_size
-            conn.commit()
+            pipeline= CopyPipeline(queue_depth=self.controller.queue_depth())
+            batches= itertools.chain([primer_batch], batches)
+            del primer_batch
+            
+            if self.parallel_connections > 1: 
+                filas_totales= self._insert_parallel(conn=conn, uri=uri, pipeline=pipeline, batches=batches)
+            else: 
+                filas_totales= self._insert_single(conn=conn, pipeline=pipeline, batches=batches)
+            
+            logger.info(f'Se insertaron {filas_totales} filas en la tabla {self.table_name}')
+            return filas_totales
         except Exception as e: 
             logger.error(f'Ocurrio un error al querer insertar los datos a la tabla {self.table_name}.\n{e}')
-            conn.rollback()
+            if conn: 
+                conn.rollback()
             raise 
         finally: 
             if conn: 
                 conn.close()
     
-    def database_insert_data(self, frame: pl.LazyFrame) -> None: 
+    def database_insert_data(self, frame: Union[pl.LazyFrame, Iterator[pl.DataFrame]]) -> None: 
         decision= self.file_overhead['decision']
         
         if decision in ['lazy', 'eager']: 
             self.insert_data_to_database(frame= frame)
         else: 
-            logger.error('Sin soprte para ingesta de datos en streming')
-            raise 'Sin soprte para ingesta de datos en streming'
-
-
+            self.insert_streaming_data(batches= frame)
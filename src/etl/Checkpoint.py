@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+import polars as pl
+
+from ..database.LoadState import CheckpointStore
+from ..memory_optimizer.FileProfiler import FileProfiler
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+#Columna con el numero de fila del CSV que se agrega al scan para saber hasta donde se leyo
+ROW_INDEX= '__fila_fuente'
+#Bytes del inicio del archivo que identifican que es el mismo archivo de la corrida anterior
+HEAD_WINDOW= 64*1024
+
+class StreamCheckpoint: 
+    #Posicion en el archivo de cada batch entregado al loader (fila del CSV, o grupo de filas y filas ya entregadas
+    #del grupo en Parquet) y hash del schema de los batches. En cada commit se guarda la posicion del ultimo batch
+    #confirmado; si la corrida falla, la siguiente continua desde ahi con append
+    def __init__(self, archivo: Path, table_name: str, store: CheckpointStore, if_table_exists: str): 
+        self.archivo= Path(archivo)
+        self.source= str(self.archivo.resolve())
+        self.table_name= table_name
+        self.store= store
+        #Modo de la corrida original: una corrida que continua ya no reemplaza la tabla
+        self.if_table_exists= if_table_exists
+        
+        self.previo: Optional[Dict[str, Any]]= None
+        self.schema_hash: Optional[str]= None
+        self.size= self.archivo.stat().st_size
+        self.head_hash= self._head_hash()
+        self._marcas= deque()
+        self._lock= threading.Lock()
+    
+    def _head_hash(self) -> str: 
+        with open(self.archivo, 'rb') as file: 
+            return hashlib.sha256(file.read(HEAD_WINDOW)).hexdigest()
+    
+    def _reset_hint(self) -> str: 
+        return f"DELETE FROM {self.store.table} WHERE source = '{self.source}' AND table_name = '{self.table_name}'"
+    
+    def load(self) -> bool: 
+        self.previo= self.store.get(source=self.source, table_name=self.table_name)
+        if self.previo is None: 
+            return False
+        
+        if self.size < self.previo['size'] or self.head_hash != self.previo['head_hash']: 
+            logger.error(f'El archivo {self.archivo.name} cambio desde el checkpoint de la corrida anterior')
+            raise ValueError(f'El archivo {self.archivo.name} cambio desde el checkpoint de la corrida anterior. Para empezar de cero: {self._reset_hint()}')
+        
+        self.if_table_exists= self.previo['if_table_exists']
+        logger.info(f'Se continua la carga de {self.archivo.name} desde el checkpoint: {self.previo["filas"]} filas ya confirmadas')
+        return True
+    
+    def csv_position(self) -> int: 
+        return self.previo['filas_fuente'] if self.previo else 0
+    
+    def row_group_position(self) -> Tuple[int, int]: 
+        if not self.previo: 
+            return 0, 0
+        if self.previo['completo']: 
+            return self.previo['row_group']+1, 0
+        return self.previo['row_group'], self.previo['offset']
+    
+    def csv_options(self, opciones: Dict[str, Any]) -> Dict[str, Any]: 
+        #Agrega el numero de fila del archivo al scan y salta las filas ya confirmadas
+        saltar= opciones.get('skip_rows_after_header', 0)
+        opciones= {**opciones, 'row_index_name': ROW_INDEX, 'row_index_offset': saltar}
+        posicion= self.csv_position()
+        if posicion <= saltar: 
+            return opciones
+        
+        n_rows= opciones.get('n_rows')
+        opciones.update({
+            'skip_rows_after_header': posicion,
+            'row_index_offset': posicion,
+            'n_rows': None if n_rows is None else max(n_rows-(posicion-saltar), 0),
+            #Las filas restantes se leen con el schema que se infiere del inicio del archivo
+            'schema_overrides': opciones.get('schema_overrides') or dict(FileProfiler.from_path(archivo=self.archivo).sample().schema)
+        })
+        return opciones
+    
+    def verify(self, frame: pl.DataFrame) -> None: 
+        #Los batches de una corrida que continua deben tener el mismo schema que los ya confirmados
+        self.schema_hash= hashlib.sha256(str(list(frame.schema.items())).encode()).hexdigest()
+        if self.previo is not None and self.previo['schema_hash'] != self.schema_hash: 
+            logger.error(f'El schema de los batches de {self.archivo.name} no es el del checkpoint')
+            raise ValueError(f'El schema de los batches de {self.archivo.name} no es el del checkpoint. Para empezar de cero: {self._reset_hint()}')
+    
+    def mark(self, filas: int, posicion: Dict[str, Any]) -> None: 
+        #filas: filas entregadas al loader en esta corrida, incluyendo el batch de esta posicion
+        with self._lock: 
+            self._marcas.append((filas, posicion))
+    
+    def save(self, cur, filas: int) -> None: 
+        #Ultima posicion cuyos batches ya estan todos en el commit que se va a hacer
+        posicion= None
+        with self._lock: 
+            while self._marcas and self._marcas[0][0] <= filas: 
+                posicion= self._marcas.popleft()[1]
+        if posicion is None: 
+            return
+        
+        previas= self.previo['filas'] if self.previo else 0
+        self.store.save(cur=cur, source=self.source, table_name=self.table_name, checkpoint={
+            **posicion,
+            'filas': previas+filas,
+            'schema_hash': self.schema_hash,
+            'size': self.size,
+            'head_hash': self.head_hash,
+            'if_table_exists': self.if_table_exists
+        })
+        logger.info(f'Checkpoint de {self.archivo.name}: {posicion}')
+    
+    def clear(self, cur) -> None: 
+        self.store.clear(cur=cur, source=self.source, table_name=self.table_name)
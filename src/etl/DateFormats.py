@@ -0,0 +1,60 @@
+import logging
+from typing import Dict, List, Optional
+
+import polars as pl
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+#Filas de la muestra con la que se infiere el formato de fecha de cada columna string
+DATE_SAMPLE_ROWS= 1000
+#Formatos candidatos en orden de preferencia: con fechas ambiguas (dia y mes <= 12) gana el primero
+CANDIDATE_FORMATS= [
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M:%S%.f',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S%.f',
+    '%Y-%m-%d %H:%M:%S%z',
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%dT%H:%M:%S%.f%z',
+    '%Y/%m/%d',
+    '%Y/%m/%d %H:%M:%S',
+    '%d/%m/%Y',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%d-%m-%Y',
+    '%d-%m-%Y %H:%M:%S',
+    '%d.%m.%Y'
+]
+
+class DateFormatDetector: 
+    #Infiere un formato explicito por columna: el formato es valido si convierte todos los valores no nulos de la muestra
+    def __init__(self, formats: List[str]=CANDIDATE_FORMATS): 
+        self.formats= formats
+    
+    def infer(self, serie: pl.Series) -> Optional[str]: 
+        valores= serie.drop_nulls()
+        validos= []
+        for formato in self.formats: 
+            fechas= valores.str.strptime(pl.Datetime, format=formato, strict=False, exact=True)
+            if fechas.null_count() == 0: 
+                validos.append(formato)
+        
+        if not validos: 
+            return None
+        if len(validos) > 1: 
+            logger.warning(f'La columna {serie.name} admite los formatos {validos}, se usara {validos[0]}')
+        return validos[0]
+    
+    def detect(self, frame: pl.DataFrame) -> Dict[str, Optional[str]]: 
+        #None para las columnas que no son fecha; las columnas sin valores en la muestra no se deciden
+        formatos= {}
+        for col in frame.columns: 
+            if frame[col].null_count() == frame.height: 
+                continue
+            formatos[col]= self.infer(serie=frame[col])
+        return formatos
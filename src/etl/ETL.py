@@ -1,10 +1,13 @@
-import polars as pl 
-import logging 
-from typing import Union, Dict
+import polars as pl
+import logging
+import threading
+from typing import Union, Dict, List, Tuple, Any
 from pydantic import BaseModel
 #from prefect import task, flow
 
 from ..strategies.Strategies import dtype_estrategia, rename_columns_estrategia
+from .DateFormats import DateFormatDetector, DATE_SAMPLE_ROWS
+from ..validation.SchemaRegistry import DATE_FORMATS
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
 logger= logging.getLogger(__name__)
@@ -16,16 +19,22 @@ class DataTypeCleaning:
             if tipo[0] == dtype.lower(): 
                 return pl.col(col).cast(tipo[1])
     
+    @staticmethod
+    def cast_dtype(dtype: str) -> pl.DataType: 
+        for tipo in dtype_estrategia: 
+            if tipo[0] == dtype.lower(): 
+                return tipo[1]
+    
     @staticmethod
     def cast_datetime_date() -> pl.Expr: 
         return pl.selectors.by_dtype(pl.Date).cast(pl.Datetime)
     
     @staticmethod
-    def cast_datetime_string(col:str) -> pl.Expr: 
-        return pl.col(col).str.to_datetime()
+    def cast_datetime_string(expr: pl.Expr, formato: str) -> pl.Expr: 
+        return expr.str.strptime(pl.Datetime, format=formato, strict=True, exact=True)
 
-class RenameColumnsCleaning:
-    def __init__(self, frame: Union[pl.LazyFrame, pl.DataFrame]):
+class RenameColumnsCleaning: 
+    def __init__(self, frame: Union[pl.LazyFrame, pl.DataFrame]): 
         self.frame= frame
     
     def estrategia(self, estrategia: rename_columns_estrategia) -> Dict[str, str]: 
@@ -46,7 +55,13 @@ class RenameColumnsCleaning:
         return self.frame.rename(diccionario)
 
 class PipelineETL: 
-    def __init__(self, Frame: Union[pl.DataFrame, pl.LazyFrame], model: BaseModel):
+    #El config se compila una sola vez por schema de entrada en una lista de expresiones (renombrado, casts
+    #y fechas) que se aplica con un solo select. Los handlers de streaming crean un PipelineETL por batch,
+    #por lo que el plan se guarda a nivel de clase
+    _plans: Dict[Tuple[Any, ...], List[pl.Expr]]= {}
+    _lock= threading.Lock()
+    
+    def __init__(self, Frame: Union[pl.DataFrame, pl.LazyFrame], model: BaseModel): 
         self.frame= Frame
         self.model= model
         
@@ -57,51 +72,80 @@ class PipelineETL:
         self.date_format= self.model.schema_config.date_format #bool
         self.data_type= self.model.schema_config.data_type
     
-    #@task
-    def rename_columns_cleaner(self) -> Union[pl.LazyFrame, pl.DataFrame]: 
-        diccionario= self.rc.estrategia(estrategia=self.column_renaming)
-        return self.rc.rename_columns_frame(diccionario=diccionario)
+    def _schema(self) -> pl.Schema: 
+        if isinstance(self.frame, pl.DataFrame): 
+            return self.frame.schema
+        return self.frame.collect_schema()
     
-    #@task
-    def dtype_cleaning(self, frame: Union[pl.LazyFrame, pl.DataFrame]) -> Union[pl.LazyFrame, pl.DataFrame]: 
-        expresiones_cast= []
-        
-        for col, tipo in self.data_type.items(): 
-            expresiones_cast.append(self.dtype_transformer.cast_expr(col=col, dtype=tipo))
-        return frame.with_columns(expresiones_cast)
+    def _plan_key(self, schema: pl.Schema) -> Tuple[Any, ...]: 
+        #Los formatos de fecha son de la tabla destino
+        return (
+            self.model.database.table_name,
+            str(self.column_renaming),
+            str(self.date_format),
+            tuple(sorted((self.data_type or {}).items())),
+            tuple((col, str(dtype)) for col, dtype in schema.items())
+        )
     
-    #@task
-    def format_date_cleaning(self, frame: Union[pl.LazyFrame, pl.DataFrame]) -> Union[pl.LazyFrame, pl.DataFrame]: 
-        formato_expr= []
+    def _date_formats(self, casts: Dict[str, pl.Expr]) -> Dict[str, str]: 
+        #Formato de fecha de las columnas string (despues de los casts): se infiere una sola vez con una muestra
+        #y se reutiliza el guardado en el registro de schema de la tabla
+        registry= self.model.registry.schema_registry(table_name=self.model.database.table_name)
+        formatos= registry.get(kind=DATE_FORMATS) or {}
+        pendientes= {col: expr for col, expr in casts.items() if col not in formatos}
+        if pendientes: 
+            sample= self.frame.limit(DATE_SAMPLE_ROWS).select([expr.alias(col) for col, expr in pendientes.items()])
+            if isinstance(sample, pl.LazyFrame): 
+                sample= sample.collect()
+            nuevos= DateFormatDetector().detect(frame=sample)
+            if nuevos: 
+                formatos= registry.update(kind=DATE_FORMATS, valores=nuevos)
+                logger.info(f'Se registraron los formatos de fecha de la primera ingesta: {nuevos}')
+        return {col: formatos[col] for col in casts if formatos.get(col)}
+    
+    def compile(self) -> List[pl.Expr]: 
+        schema= self._schema()
+        llave= self._plan_key(schema=schema)
+        #Se compila con el lock tomado para que los batches concurrentes no infieran los formatos de fecha dos veces
+        with self._lock: 
+            plan= self._plans.get(llave)
+            if plan is not None: 
+                return plan
+            plan= self._compile(schema=schema)
+            self._plans[llave]= plan
+        return plan
+    
+    def _compile(self, schema: pl.Schema) -> List[pl.Expr]: 
+        renombrado= self.rc.estrategia(estrategia=self.column_renaming) if self.column_renaming else {}
+        data_type= self.data_type or {}
         
-        sample= frame.limit(10)
-        if isinstance(sample, pl.DataFrame): 
-            schema= sample.schema
-        else: 
-            schema= sample.collect_schema()
+        #Las columnas de data_type son las del archivo (se validan contra su schema), antes del renombrado
+        casts: Dict[str, pl.Expr]= {}
+        tipos: Dict[str, pl.DataType]= {}
+        for col, dtype in schema.items(): 
+            if col in data_type: 
+                casts[col]= self.dtype_transformer.cast_expr(col=col, dtype=data_type[col])
+                tipos[col]= self.dtype_transformer.cast_dtype(dtype=data_type[col])
+            else: 
+                casts[col]= pl.col(col)
+                tipos[col]= dtype
         
-        for col, tipo in schema.items(): 
-            try: 
-                if tipo == pl.String: 
-                    expr_str= self.dtype_transformer.cast_datetime_string(col=col)
-                    sample.with_columns(expr_str)
-                    formato_expr.append(expr_str)
-            except: 
-                continue
+        fechas= {}
+        if self.date_format: 
+            fechas= self._date_formats(casts={col: expr for col, expr in casts.items() if tipos[col] == pl.String})
+        
+        plan= []
+        for col, expr in casts.items(): 
+            if col in fechas: 
+                expr= self.dtype_transformer.cast_datetime_string(expr=expr, formato=fechas[col])
+            elif self.date_format and tipos[col] == pl.Date: 
+                expr= expr.cast(pl.Datetime)
+            plan.append(expr.alias(renombrado.get(col, col)))
         
-        formato_expr.append(self.dtype_transformer.cast_datetime_date())
-        return frame.with_columns(formato_expr)
+        logger.info(f'Se compilo el plan del ETL: {len(renombrado)} columnas renombradas, {len(data_type)} casts y {len(fechas)} columnas de fecha')
+        return plan
     
     #@flow(name='Pipeline ETL - rename and dtype transformation')
-    def etl(self) -> pl.DataFrame:
-        logger.info('\nSe van a empezar las tranformaciones de los datos para el ETL')
-        if self.column_renaming: 
-            frame= self.rename_columns_cleaner()
-            logger.info(f'Se renombraron las columnas a {self.column_renaming} correctamente')
-        if self.data_type:
-            frame= self.dtype_cleaning(frame=frame)
-            logger.info('Se limpiaron los tipos de datos correctamente')
-        if self.date_format: 
-            frame= self.format_date_cleaning(frame=frame)
-            logger.info('Se transformaron las columnas tipo string con formato de fecha a datetime')
-        return frame
+    def etl(self) -> Union[pl.DataFrame, pl.LazyFrame]: 
+        #Un solo select con todas las transformaciones en lugar de un with_columns por paso
+        return self.frame.select(self.compile())
@@ -1,57 +1,146 @@
 import polars as pl 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Union
 import logging 
 from pathlib import Path
+from pydantic import BaseModel
 
 from .ETL import PipelineETL
-from .Streaming import PipelineStreaming
 from ..validation.ReadYamlValidation import ReadSchemaValidation
 from ..memory_optimizer.PathDecisionMaker import PipelineEstimatedSizeFiles
-from ..validation.PanderaSchema import PanderaSchema
+from ..validation.PolarsSchema import PolarsSchema
 from ..database.PostgresqlUri import PostgresDatabase
+from ..memory_optimizer.Calibration import PeakMemoryMonitor
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
 logger= logging.getLogger(__name__)
 
+#Config por defecto del repositorio; python -m src acepta otro con --config
+CONFIG_PATH= Path(__file__).resolve().parent.parent.parent / 'config' / 'config.yml'
+
+#Streaming, el scheduler y el muestreo se importan en el metodo que los usa: una corrida eager de un solo
+#archivo no carga sus dependencias
+
 class EngineDecision: 
-    def __init__(self):
-        archivo= Path('/home/arbolitos7/Documents/ArbolitosMiCasita/CrescencioEnLaCiudad/postgresql-duckdb/modern-data-pipeline/config/config.yml')
-        self.model= ReadSchemaValidation(archivo=archivo).read_file()
+    def __init__(self, model: Optional[BaseModel]=None, archivo: Optional[Path]=None, config: Optional[Path]=None):
+        if model is None: 
+            model= ReadSchemaValidation(archivo=config or CONFIG_PATH).read_file()
+        self.model= model
+        
+        #Con varios archivos (directorio, glob o particiones Hive) el scheduler crea un EngineDecision por archivo
+        archivos= self.model.path.files()
+        self.archivo= Path(archivo) if archivo else archivos[0]
+        self.incremental= None
+        self.pendiente= True
+        if archivo is None and len(archivos) > 1: 
+            self.file_overhead_model= None
+        else: 
+            self.pendiente= self._plan_incremental()
+            self.file_overhead_model= self.file_overhead(archivo=self.archivo)[0] if self.pendiente else None
+    
+    def _plan_incremental(self) -> bool: 
+        #Con carga incremental solo se leen las filas posteriores a la marca de agua guardada en Postgres
+        if not self.model.incremental.enabled: 
+            return True
         
-        self.archivo= self.model.path.input_path
-        self.file_overhead_model= self.file_overhead(archivo=self.archivo)[0]
+        self.incremental= self.model.incremental.incremental_load(
+            archivo=self.archivo, 
+            table_name=self.model.database.table_name, 
+            uri=PostgresDatabase.uri_database()
+        )
+        pendiente= self.incremental.plan(if_table_exists=self.model.database.if_table_exists)
+        self.model.database.if_table_exists= self.incremental.if_table_exists
+        self.model.scan._incremental= self.incremental
+        return pendiente
     
     def file_overhead(self, archivo: str) -> Dict[str, Any]: 
         archivo= Path(archivo)
         os_margin= self.model.os_configuration.os_margin
         n_rows_sample= self.model.os_configuration.n_rows_sample
         
-        diccionario= PipelineEstimatedSizeFiles(archivo=archivo, os_margin=os_margin, n_rows_sample=n_rows_sample).estimated_size_file()
+        cache= self.model.cache.profile_cache()
+        calibration= self.model.calibration
+        
+        diccionario= PipelineEstimatedSizeFiles(
+            archivo=archivo, 
+            os_margin=os_margin, 
+            n_rows_sample=n_rows_sample, 
+            cache=cache, 
+            calibrator=calibration.memory_calibrator(), 
+            eager_ratio=calibration.eager_ratio, 
+            lazy_ratio=calibration.lazy_ratio, 
+            parquet_profiling=self.model.os_configuration.parquet_profiling, 
+            columnas=self.model.scan.pushdown().read_columns(), 
+            filas=self.incremental.new_rows if self.incremental is not None else None
+        ).estimated_size_file()
         logger.info(f'Se obtuvo el file_overhead para el archivo {self.archivo.name}')
         return diccionario, archivo
     
     def _load_eager_frame(self) -> pl.DataFrame: 
-        if self.archivo.suffix == '.csv': 
-            frame= pl.read_csv(self.archivo)
-            return frame
-        else: 
-            frame= pl.read_parquet(self.archivo)
-            return frame
+        #Sin select ni filtros se lee directo; con ellos se pasa por el scan para empujarlos al lector
+        pushdown= self.model.scan.pushdown()
+        if pushdown.is_empty(): 
+            if self.archivo.suffix == '.csv': 
+                frame= pl.read_csv(self.archivo)
+                return frame
+            else: 
+                frame= pl.read_parquet(self.archivo)
+                return frame
+        frame= pushdown.scan(archivo=self.archivo).collect()
+        pushdown.observe(frame=frame)
+        return frame
     
     def _load_lazy_frame(self) -> pl.LazyFrame: 
-        if self.archivo.suffix == '.csv': 
-            return pl.scan_csv(self.archivo)
+        #La marca de agua de la carga incremental se toma de los batches que copia el loader, sin otro scan
+        pushdown= self.model.scan.pushdown()
+        return pushdown.scan(archivo=self.archivo)
+    
+    def _validation_sample(self, frame: pl.LazyFrame) -> pl.DataFrame: 
+        #Muestra de sample_size del total de filas tomada de todo el archivo, no solo de las primeras filas
+        validation= self.model.validation_data
+        filas= max(int(self.file_overhead_model['total_de_filas']*validation.sample_size), 1)
+        logger.warning(f'El frame lazy no es recomendable cargarlo completo, por lo que se validara un {validation.sample_size*100}% del total de filas ({filas}) con muestreo {validation.sampling}')
+        
+        if validation.sampling == 'head': 
+            return frame.slice(0, filas).collect(engine='streaming')
+        
+        from ..validation.Sampling import CsvBlockSampler, RowGroupSampler
+        
+        pushdown= self.model.scan.pushdown()
+        if self.archivo.suffix == '.parquet': 
+            muestra= RowGroupSampler(
+                archivo=self.archivo, 
+                n_rows=filas, 
+                max_row_groups=validation.max_row_groups, 
+                seed=validation.seed
+            ).sample(pushdown=pushdown)
         else: 
-            return pl.scan_parquet(self.archivo)
+            #El CSV no tiene grupos de filas: se leen bloques en offsets al azar, sin recorrer el archivo
+            muestra= CsvBlockSampler(
+                archivo=self.archivo, 
+                n_rows=filas, 
+                max_blocks=validation.max_row_groups, 
+                seed=validation.seed
+            ).sample(pushdown=pushdown, rango=self.incremental.byte_range() if self.incremental else None)
+        if muestra.width == 0: 
+            return frame.clear().collect()
+        return PipelineETL(Frame=muestra, model=self.model).etl()
     
     def _run_streaming_handler(self) -> Dict[str, Any]:
         pipeline_etl= PipelineETL
         
+        from .Streaming import PipelineStreaming
         streaming= PipelineStreaming(archivo=self.archivo, file_overhead=self.file_overhead_model)
         diccionario= streaming.run_streaming_engine(ETL=pipeline_etl, model=self.model)
         return diccionario
     
-    def orquestador_pipeline(self) -> Optional[Dict[str, Any]]: 
+    def orquestador_pipeline(self) -> Optional[Union[Dict[str, Any], List[Dict[str, Any]]]]: 
+        if not self.pendiente: 
+            logger.info(f'Sin datos nuevos en {self.archivo.name}, no se ejecuta el pipeline')
+            return None
+        if self.file_overhead_model is None: 
+            from .Scheduler import FileScheduler
+            return FileScheduler(model=self.model, engine_factory=EngineDecision).run()
+        
         decision= self.file_overhead_model['decision']
         table_name= self.model.database.table_name
         if_table_exist= self.model.database.if_table_exists
@@ -59,18 +148,30 @@ class EngineDecision:
         postgres=PostgresDatabase(
             table_name=table_name, 
             file_overhead=self.file_overhead_model, 
-            if_table_exists=if_table_exist)
+            if_table_exists=if_table_exist, 
+            copy_format=self.model.database.copy_format, 
+            parallel_connections=self.model.database.parallel_connections, 
+            incremental=self.incremental)
         
         if decision == 'eager': 
-            frame= self._load_eager_frame()
-            logger.info(f'\nSe obtuvo el frame exitosamente con la decision {decision}')
+            #El pico de memoria de la carga completa es la observacion que calibra la estimacion
+            with PeakMemoryMonitor() as monitor: 
+                frame= self._load_eager_frame()
+                logger.info(f'\nSe obtuvo el frame exitosamente con la decision {decision}')
+                
+                frame= PipelineETL(Frame=frame, model=self.model).etl()
             
-            frame= PipelineETL(Frame=frame, model=self.model).etl()
-            frame.write_parquet('pandera_report.parquet')
+            if self.model.calibration.enabled: 
+                self.model.calibration.memory_calibrator().record(
+                    profile=self.file_overhead_model['perfil'], 
+                    medido=monitor.peak_rss(), 
+                    estimado=self.file_overhead_model['memoria_total_estimada'], 
+                    incremento=monitor.peak_bytes(), 
+                    duracion=monitor.seconds()
+                )
             
             logger.info(f'Se tranformo el frame exitosamente para el archivo {self.archivo.name}')
-            diccionario, archivo= self.file_overhead(archivo='pandera_report.parquet')
-            PanderaSchema(model=self.model, archivo=archivo, file_overhead=diccionario).validation_schema()
+            PolarsSchema(model=self.model).validation_schema(frame=frame)
             
             frame= frame.lazy()
             
@@ -82,18 +183,15 @@ class EngineDecision:
             frame= self._load_lazy_frame() 
             logger.info(f'\nSe obtuvo el frame exitosamente con la decision {decision}')
             
-            porcentaje= self.model.validation_data.sample_size
-            total_filas_slice= int(self.file_overhead_model['total_de_filas']*porcentaje)
-            
-            frame= PipelineETL(Frame=frame, model=self.model).etl()
-            frame.slice(0, total_filas_slice).collect(engine='streaming').write_parquet('pandera_report.parquet')
+            etl= PipelineETL(Frame=frame, model=self.model)
+            marca= self.incremental.watermark_exprs() if self.incremental is not None else []
+            carga= frame.select([*etl.compile(), *marca])
             
             logger.info(f'Se tranformo el frame exitosamente para el archivo {self.archivo.name}')
-            diccionario, archivo = self.file_overhead(archivo='pandera_report.parquet')
-            PanderaSchema(model=self.model, archivo=archivo, file_overhead=diccionario).validation_schema()   
+            PolarsSchema(model=self.model).validation_schema(frame=self._validation_sample(frame=etl.etl()))
             
             postgres.database_insert_data(
-                frame=frame
+                frame=carga
             )
             
         else:
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import logging
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import polars as pl
+
+from ..database.LoadState import LoadStateStore
+from ..memory_optimizer.FileProfiler import CsvRowCounter, FileProfiler
+from ..memory_optimizer.ParquetFooter import ParquetFooterProfiler
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+#Bytes del inicio y del final de lo ya cargado que se comparan para saber si el archivo solo crecio
+HASH_WINDOW= 64*1024
+#Copia de la columna incremental sin ETL que viaja con las filas de la decision lazy hasta el loader
+WATERMARK_COLUMN= '__marca_de_agua'
+
+class IncrementalLoad: 
+    #Plan de lectura de una carga incremental: que parte del archivo es nueva segun la marca de agua guardada
+    #(filas de un CSV, grupos de filas de un Parquet o el maximo de una columna) y la marca de agua que la sustituye
+    def __init__(self, archivo: Path, table_name: str, store: LoadStateStore, mode: str='offset', column: Optional[str]=None): 
+        self.archivo= Path(archivo)
+        self.source= str(self.archivo.resolve())
+        self.table_name= table_name
+        self.store= store
+        self.mode= mode
+        self.column= column
+        
+        self.previo: Optional[Dict[str, Any]]= None
+        self.watermark: Optional[Dict[str, Any]]= None
+        self.if_table_exists: Optional[str]= None
+        self.new_rows: Optional[int]= None
+        
+        #Ventana de lectura: filas a saltar despues del header, filas a leer y primer grupo de filas
+        self.skip_rows= 0
+        self.n_rows: Optional[int]= None
+        self.first_row_group= 0
+        self.schema: Optional[Dict[str, pl.DataType]]= None
+        
+        self._maximo_previo: Any= None
+        self._maximo: Any= None
+        self._lock= threading.Lock()
+    
+    @staticmethod
+    def _encode(valor: Any) -> Dict[str, Any]: 
+        if isinstance(valor, datetime): 
+            return {'tipo': 'datetime', 'valor': valor.isoformat()}
+        if isinstance(valor, date): 
+            return {'tipo': 'date', 'valor': valor.isoformat()}
+        return {'tipo': 'valor', 'valor': valor}
+    
+    @staticmethod
+    def _decode(valor: Optional[Dict[str, Any]]) -> Any: 
+        if not valor or valor['valor'] is None: 
+            return None
+        if valor['tipo'] == 'datetime': 
+            return datetime.fromisoformat(valor['valor'])
+        if valor['tipo'] == 'date': 
+            return date.fromisoformat(valor['valor'])
+        return valor['valor']
+    
+    def _prefix_hash(self, fin: int) -> str: 
+        #Inicio y final de lo ya cargado: si cambian, el archivo se reescribio en lugar de crecer
+        h= hashlib.sha256()
+        with open(self.archivo, 'rb') as file: 
+            h.update(file.read(min(HASH_WINDOW, fin)))
+            inicio_cola= max(fin-HASH_WINDOW, 0)
+            file.seek(inicio_cola)
+            h.update(file.read(fin-inicio_cola))
+        return h.hexdigest()
+    
+    def _rewritten(self, motivo: str) -> None: 
+        logger.error(f'El archivo {self.archivo.name} cambio desde la ultima carga incremental: {motivo}')
+        raise ValueError(
+            f'El archivo {self.archivo.name} cambio desde la ultima carga incremental: {motivo}. '
+            f"Para cargarlo completo de nuevo borrar su marca de agua: DELETE FROM {self.store.state_table} WHERE source = '{self.source}' AND table_name = '{self.table_name}'"
+        )
+    
+    def _plan_csv(self) -> int: 
+        size= self.archivo.stat().st_size
+        counter= CsvRowCounter(archivo=self.archivo)
+        
+        if self.previo is None: 
+            lineas, fin= counter.scan_range(inicio=0, fin=size)
+            filas_previas= 0
+            nuevas= max(lineas-1, 0)
+        else: 
+            fin_previo= self.previo['bytes']
+            if size < fin_previo or self._prefix_hash(fin=fin_previo) != self.previo['hash']: 
+                self._rewritten(motivo='los bytes ya cargados no coinciden')
+            #Solo se recorren los bytes agregados despues de la ultima carga
+            nuevas, fin= counter.scan_range(inicio=fin_previo, fin=size)
+            filas_previas= self.previo['filas']
+            #Las filas nuevas se leen con el schema que se infiere del inicio del archivo, igual que en la primera carga
+            self.schema= dict(FileProfiler.from_path(archivo=self.archivo).sample().schema)
+        
+        if fin < size: 
+            logger.warning(f'La ultima fila de {self.archivo.name} no termina en salto de linea, se cargara en la siguiente corrida')
+        
+        self.skip_rows= filas_previas
+        self.n_rows= nuevas
+        self.watermark= {
+            'modo': 'offset',
+            'tipo': 'csv',
+            'filas': filas_previas+nuevas,
+            'bytes': fin,
+            'hash': self._prefix_hash(fin=fin)
+        }
+        return nuevas
+    
+    def _plan_parquet(self) -> int: 
+        metadata= ParquetFooterProfiler.from_path(archivo=self.archivo).metadata
+        grupos= [(metadata.row_group(i).num_rows, metadata.row_group(i).total_byte_size) for i in range(metadata.num_row_groups)]
+        
+        def _hash(k: int) -> str: 
+            return hashlib.sha256(json.dumps(grupos[:k]).encode()).hexdigest()
+        
+        cargados= self.previo['row_groups'] if self.previo else 0
+        if self.previo is not None and (cargados > len(grupos) or _hash(cargados) != self.previo['hash']): 
+            self._rewritten(motivo='los grupos de filas ya cargados no coinciden')
+        
+        self.first_row_group= cargados
+        self.skip_rows= sum(filas for filas, _ in grupos[:cargados])
+        self.watermark= {
+            'modo': 'offset',
+            'tipo': 'parquet',
+            'row_groups': len(grupos),
+            'filas': metadata.num_rows,
+            'hash': _hash(len(grupos))
+        }
+        return metadata.num_rows - self.skip_rows
+    
+    def _plan_column(self) -> Optional[int]: 
+        #Las filas nuevas se conocen hasta leerlas: el filtro column > maximo se empuja al lector
+        self._maximo_previo= self._decode(self.previo['valor']) if self.previo else None
+        self._maximo= self._maximo_previo
+        return None
+    
+    def plan(self, if_table_exists: str) -> bool: 
+        self.previo= self.store.get(source=self.source, table_name=self.table_name)
+        if self.previo is not None and (self.previo.get('modo') != self.mode or self.previo.get('columna') != (self.column if self.mode == 'column' else None)): 
+            self._rewritten(motivo=f'la marca de agua guardada es de otro modo ({self.previo.get("modo")})')
+        
+        #Con marca de agua la tabla ya tiene lo cargado antes: solo se agrega lo nuevo
+        self.if_table_exists= 'append' if self.previo is not None else if_table_exists
+        
+        if self.mode == 'column': 
+            self.new_rows= self._plan_column()
+        elif self.archivo.suffix == '.csv': 
+            self.new_rows= self._plan_csv()
+        else: 
+            self.new_rows= self._plan_parquet()
+        
+        if self.new_rows == 0: 
+            logger.info(f'El archivo {self.archivo.name} no tiene filas nuevas desde la ultima carga')
+            return False
+        
+        logger.info(f'Carga incremental de {self.archivo.name}: {"primera carga" if self.previo is None else "desde la marca de agua " + str(self.previo)}')
+        return True
+    
+    def csv_options(self) -> Dict[str, Any]: 
+        if not self.skip_rows and self.n_rows is None: 
+            return {}
+        return {'skip_rows_after_header': self.skip_rows, 'n_rows': self.n_rows, 'schema_overrides': self.schema}
+    
+    def byte_range(self) -> Optional[Tuple[int, int]]: 
+        #Offsets de las filas nuevas de un CSV, para muestrear solo lo que se va a cargar
+        if self.watermark is None or self.watermark.get('tipo') != 'csv': 
+            return None
+        return (self.previo['bytes'] if self.previo else 0, self.watermark['bytes'])
+    
+    def filters(self) -> List[Dict[str, Any]]: 
+        if self.mode != 'column' or self._maximo_previo is None: 
+            return []
+        return [{'column': self.column, 'op': '>', 'value': self._maximo_previo}]
+    
+    def watermark_exprs(self) -> List[pl.Expr]: 
+        #En la decision lazy el ETL renombra y convierte la columna: se agrega su valor original al select
+        return [pl.col(self.column).alias(WATERMARK_COLUMN)] if self.mode == 'column' else []
+    
+    def observe(self, frame: pl.DataFrame) -> None: 
+        #Maximo de la columna en las filas que se cargan (antes del ETL, con el nombre y tipo del archivo)
+        if self.mode != 'column': 
+            return
+        columna= WATERMARK_COLUMN if WATERMARK_COLUMN in frame.columns else self.column
+        maximo= frame[columna].max() if frame.height else None
+        
+        with self._lock: 
+            if maximo is not None and (self._maximo is None or maximo > self._maximo): 
+                self._maximo= maximo
+    
+    def save(self, cur, if_table_exists: str) -> None: 
+        if self.mode == 'column': 
+            self.watermark= {'modo': 'column', 'columna': self.column, 'valor': self._encode(self._maximo)}
+        self.store.save(
+            cur=cur,
+            source=self.source,
+            table_name=self.table_name,
+            watermark=self.watermark,
+            reset_table=if_table_exists == 'replace'
+        )
@@ -0,0 +1,163 @@
+import logging
+import operator
+from functools import reduce
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import polars as pl
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+COMPARADORES= {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le
+}
+
+class ScanPushdown: 
+    #Proyeccion y filtros del config que se empujan al scan de Polars y a read_row_group,
+    #con poda de grupos de filas de Parquet por las estadisticas min/max del footer
+    def __init__(self, select: Optional[List[str]]=None, filters: Optional[List[Dict[str, Any]]]=None, partitions: Optional[Dict[str, Any]]=None, incremental: Optional[Any]=None): 
+        self.select= select
+        self.filters= filters or []
+        #Columnas de particion Hive: no existen en el archivo, se agregan como literales
+        self.partitions= partitions or {}
+        #Carga incremental (IncrementalLoad): ventana de filas o grupos de filas nuevos y filtro por la marca de agua
+        self.incremental= incremental
+        if incremental is not None: 
+            self.filters= [*self.filters, *incremental.filters()]
+    
+    def is_empty(self) -> bool: 
+        return not self.select and not self.filters and not self.partitions and self.incremental is None
+    
+    def read_columns(self) -> Optional[List[str]]: 
+        #Columnas a leer: las seleccionadas mas las que solo se usan para filtrar
+        if not self.select: 
+            return None
+        columnas= [col for col in self.select if col not in self.partitions]
+        for filtro in self.filters: 
+            if filtro['column'] not in columnas and filtro['column'] not in self.partitions: 
+                columnas.append(filtro['column'])
+        return columnas
+    
+    @staticmethod
+    def _expr(filtro: Dict[str, Any]) -> pl.Expr: 
+        col= pl.col(filtro['column'])
+        op= filtro['op']
+        valor= filtro.get('value')
+        
+        if op in COMPARADORES: 
+            return COMPARADORES[op](col, pl.lit(valor))
+        if op == 'in': 
+            return col.is_in(valor)
+        if op == 'not_in': 
+            return ~col.is_in(valor)
+        if op == 'is_null': 
+            return col.is_null()
+        return col.is_not_null()
+    
+    def predicate(self) -> Optional[pl.Expr]: 
+        if not self.filters: 
+            return None
+        return reduce(operator.and_, [self._expr(filtro) for filtro in self.filters])
+    
+    def apply(self, frame: Union[pl.LazyFrame, pl.DataFrame], keep: Optional[List[str]]=None) -> Union[pl.LazyFrame, pl.DataFrame]: 
+        #En un LazyFrame Polars empuja el filtro y la proyeccion hasta el lector
+        if self.partitions: 
+            frame= frame.with_columns([pl.lit(valor).alias(clave) for clave, valor in self.partitions.items()])
+        predicado= self.predicate()
+        if predicado is not None: 
+            frame= frame.filter(predicado)
+        if self.select: 
+            frame= frame.select([*self.select, *(keep or [])])
+        return frame
+    
+    def csv_options(self) -> Dict[str, Any]: 
+        return self.incremental.csv_options() if self.incremental is not None else {}
+    
+    def scan(self, archivo: Path) -> pl.LazyFrame: 
+        #Scan del archivo limitado a las filas nuevas de la carga incremental, con la proyeccion y filtros
+        archivo= Path(archivo)
+        if archivo.suffix == '.csv': 
+            return self.apply(pl.scan_csv(archivo, **self.csv_options()))
+        
+        frame= pl.scan_parquet(archivo)
+        if self.incremental is not None and self.incremental.skip_rows: 
+            frame= frame.slice(self.incremental.skip_rows)
+        return self.apply(frame)
+    
+    def observe(self, frame: pl.DataFrame) -> None: 
+        if self.incremental is not None: 
+            self.incremental.observe(frame=frame)
+    
+    @staticmethod
+    def _may_match(filtro: Dict[str, Any], minimo: Any, maximo: Any, nulos: Optional[int], valores: int) -> bool: 
+        op= filtro['op']
+        valor= filtro.get('value')
+        
+        if op == 'is_null': 
+            return nulos is None or nulos > 0
+        if op == 'is_not_null': 
+            return nulos is None or nulos < valores
+        if minimo is None or maximo is None: 
+            return True
+        
+        try: 
+            if op == '==': 
+                return minimo <= valor <= maximo
+            if op == '>': 
+                return maximo > valor
+            if op == '>=': 
+                return maximo >= valor
+            if op == '<': 
+                return minimo < valor
+            if op == '<=': 
+                return minimo <= valor
+            if op == 'in': 
+                return any(minimo <= v <= maximo for v in valor)
+        except TypeError: 
+            #Tipos no comparables (por ejemplo una fecha escrita como string en el config)
+            return True
+        return True
+    
+    def partition_matches(self) -> bool: 
+        #Un archivo cuyas particiones no pasan los filtros se descarta sin abrirlo
+        filtros= [filtro for filtro in self.filters if filtro['column'] in self.partitions]
+        if not filtros: 
+            return True
+        
+        frame= pl.DataFrame({clave: [valor] for clave, valor in self.partitions.items()})
+        predicado= reduce(operator.and_, [self._expr(filtro) for filtro in filtros])
+        return frame.filter(predicado).height > 0
+    
+    def row_group_matches(self, row_group) -> bool: 
+        if not self.filters: 
+            return True
+        
+        estadisticas= {}
+        for i in range(row_group.num_columns): 
+            chunk= row_group.column(i)
+            estadisticas[chunk.path_in_schema]= chunk.statistics
+        
+        for filtro in self.filters: 
+            stats= estadisticas.get(filtro['column'])
+            if stats is None: 
+                continue
+            minimo, maximo= (stats.min, stats.max) if stats.has_min_max else (None, None)
+            nulos= stats.null_count if stats.has_null_count else None
+            if not self._may_match(filtro=filtro, minimo=minimo, maximo=maximo, nulos=nulos, valores=row_group.num_rows): 
+                return False
+        return True
+    
+    def row_groups(self, metadata) -> List[int]: 
+        inicio= self.incremental.first_row_group if self.incremental is not None else 0
+        grupos= [i for i in range(inicio, metadata.num_row_groups) if self.row_group_matches(metadata.row_group(i))]
+        if inicio: 
+            logger.info(f'Se saltan {inicio} grupos de filas ya cargados')
+        if len(grupos) < metadata.num_row_groups-inicio: 
+            logger.info(f'Se podaron {metadata.num_row_groups-inicio-len(grupos)} de {metadata.num_row_groups-inicio} grupos de filas con las estadisticas del footer')
+        return grupos
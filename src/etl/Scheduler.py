@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import psutil
+from pydantic import BaseModel
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+#Fraccion del presupuesto que se reserva para un archivo lazy o streaming: su memoria la acota
+#el controlador de batches y no el tamaño del archivo
+STREAMING_SHARE= 0.5
+
+class MemoryBudget: 
+    #Presupuesto global de memoria compartido por los archivos que corren al mismo tiempo
+    def __init__(self, total: float): 
+        self.total= total
+        self.en_uso= 0.0
+        self.condicion= threading.Condition()
+    
+    def acquire(self, costo: float) -> None: 
+        with self.condicion: 
+            #Un archivo mas grande que el presupuesto corre solo
+            while self.en_uso > 0 and self.en_uso + costo > self.total: 
+                self.condicion.wait()
+            self.en_uso+= costo
+    
+    def release(self, costo: float) -> None: 
+        with self.condicion: 
+            self.en_uso-= costo
+            self.condicion.notify_all()
+
+class FileScheduler: 
+    #Perfila cada archivo, decide eager/lazy/streaming con su propia estimacion y los carga
+    #a la misma tabla. El primero corre solo (crea o reemplaza la tabla), el resto en paralelo con append
+    def __init__(self, model: BaseModel, engine_factory: Callable[..., Any], max_workers: Optional[int]=None): 
+        self.model= model
+        self.engine_factory= engine_factory
+        self.max_workers= max_workers or model.os_configuration.file_workers
+        self.archivos= model.path.files()
+    
+    def _file_model(self, archivo: Path, if_table_exists: str, calibrar: bool) -> BaseModel: 
+        modelo= self.model.model_copy(update={
+            'database': self.model.database.model_copy(update={'if_table_exists': if_table_exists}),
+            'scan': self.model.scan.model_copy(),
+            'calibration': self.model.calibration.model_copy(update={'enabled': calibrar})
+        })
+        modelo.scan._partitions= self.model.path.partitions(archivo=archivo)
+        return modelo
+    
+    def _profile(self, archivo: Path, if_table_exists: str, calibrar: bool) -> Optional[Any]: 
+        modelo= self._file_model(archivo=archivo, if_table_exists=if_table_exists, calibrar=calibrar)
+        if not modelo.scan.pushdown().partition_matches(): 
+            logger.info(f'El archivo {archivo} no pasa los filtros de particion, se omite')
+            return None
+        return self.engine_factory(model=modelo, archivo=archivo)
+    
+    def _budget(self) -> MemoryBudget: 
+        memoria= psutil.virtual_memory()
+        return MemoryBudget(total=max(memoria.available - memoria.total*self.model.os_configuration.os_margin, 1))
+    
+    @staticmethod
+    def _cost(engine: Any, presupuesto: MemoryBudget) -> float: 
+        overhead= engine.file_overhead_model
+        if overhead['decision'] == 'eager': 
+            return overhead['memoria_total_estimada']
+        return min(overhead['memoria_total_estimada'], presupuesto.total*STREAMING_SHARE)
+    
+    def _run(self, engine: Any) -> Dict[str, Any]: 
+        inicio= time.perf_counter()
+        resultado= engine.orquestador_pipeline()
+        return {
+            'archivo': str(engine.archivo),
+            'decision': engine.file_overhead_model['decision'],
+            'filas': engine.file_overhead_model['total_de_filas'],
+            'tiempo_segundos': time.perf_counter()-inicio,
+            'resultado': resultado
+        }
+    
+    def run(self) -> List[Dict[str, Any]]: 
+        logger.info(f'Se programan {len(self.archivos)} archivos con hasta {self.max_workers} en paralelo')
+        resultados= []
+        
+        #El primer archivo define la tabla con el if_table_exists del config
+        primero, resto= self.archivos[0], self.archivos[1:]
+        engine= self._profile(archivo=primero, if_table_exists=self.model.database.if_table_exists, calibrar=self.model.calibration.enabled)
+        tabla_creada= engine is not None
+        #En una carga incremental un archivo sin filas nuevas ya esta en la tabla y no se vuelve a correr
+        if engine is not None and engine.pendiente: 
+            resultados.append(self._run(engine=engine))
+        
+        #Perfilado en paralelo; con la cache de perfiles las corridas repetidas no vuelven a leer los archivos
+        modo= 'append' if tabla_creada else self.model.database.if_table_exists
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='file-profiler') as executor: 
+            engines= [e for e in executor.map(lambda archivo: self._profile(archivo=archivo, if_table_exists=modo, calibrar=False), resto) if e is not None and e.pendiente]
+        
+        if engines and not tabla_creada: 
+            #Ningun archivo habia creado la tabla: el primero que pasa los filtros corre solo
+            resultados.append(self._run(engine=engines.pop(0)))
+            for e in engines: 
+                e.model.database.if_table_exists= 'append'
+        
+        presupuesto= self._budget()
+        detener= threading.Event()
+        
+        def _task(engine: Any) -> Optional[Dict[str, Any]]: 
+            costo= self._cost(engine=engine, presupuesto=presupuesto)
+            presupuesto.acquire(costo=costo)
+            try: 
+                if detener.is_set(): 
+                    return None
+                return self._run(engine=engine)
+            except BaseException: 
+                detener.set()
+                raise
+            finally: 
+                presupuesto.release(costo=costo)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='file-loader') as executor: 
+            futuros= [executor.submit(_task, engine) for engine in engines]
+            for futuro in futuros: 
+                resultado= futuro.result()
+                if resultado is not None: 
+                    resultados.append(resultado)
+        
+        logger.info(f'Se cargaron {len(resultados)} archivos en la tabla {self.model.database.table_name}')
+        return resultados
@@ -1,20 +1,41 @@
 import logging 
 import polars as pl 
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, Iterator, Optional, Tuple
 from pathlib import Path
 from pydantic import BaseModel
 import gc
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import psutil
 import time
 import tracemalloc
 
-from..validation.PanderaSchema import PanderaSchema
-from ..memory_optimizer.PathDecisionMaker import PipelineEstimatedSizeFiles
-#from ..database.PostgresqlUri import PostgresDatabase
+from..validation.PolarsSchema import PolarsSchema
+from ..memory_optimizer.BatchController import AdaptiveBatchController
+from ..memory_optimizer.Calibration import PeakMemoryMonitor
+from ..database.PostgresqlUri import PostgresDatabase
+from .ScanPushdown import ScanPushdown
+from .Checkpoint import StreamCheckpoint, ROW_INDEX
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
 logger= logging.getLogger(__name__)
 
+def _stream_checkpoint(archivo: Path, model: BaseModel) -> Optional[StreamCheckpoint]: 
+    #Con varias conexiones todo se confirma en un solo commit al final: no hay checkpoints intermedios
+    if model.database.parallel_connections > 1: 
+        return None
+    checkpoint= model.checkpoint.stream_checkpoint(
+        archivo=archivo, 
+        table_name=model.database.table_name, 
+        uri=PostgresDatabase.uri_database(), 
+        if_table_exists=model.database.if_table_exists
+    )
+    if checkpoint is not None: 
+        checkpoint.load()
+    return checkpoint
+
 class StreamingCSVHandler: 
     def __init__(self, archivo: Path, file_overhead: Dict[str, Any], os_margin: float=0.3, n_rows_sample: int=1000):
         self.os_margin= os_margin
@@ -22,165 +43,200 @@ class StreamingCSVHandler:
         
         self.archivo= archivo
         self.file_overhead= file_overhead
+        self.controller= AdaptiveBatchController(file_overhead=file_overhead)
     
-    def _file_overhead(self, archivo: str) -> Dict[str, Any]: 
-        archivo= Path(archivo)
-        diccionario= PipelineEstimatedSizeFiles(archivo=archivo, os_margin=self.os_margin, n_rows_sample=self.n_rows_sample).estimated_size_file()
-        return diccionario, archivo
-    
-    def estimate_batch_size(self) -> float: 
-        ratio= self.file_overhead['ratio']
-        
-        if ratio > 5: 
-            return 0.15 
-        elif ratio > 2: 
-            return 0.25
-        elif ratio > 0.5: 
-            return 0.4
+    def _iter_batches(self, pushdown: ScanPushdown, checkpoint: Optional[StreamCheckpoint]=None) -> Iterator[pl.DataFrame]: 
+        #Un solo lector hacia adelante: cada batch continua donde termino el anterior 
+        #en lugar de volver a parsear el archivo desde el byte cero con skip_rows. 
+        #El controlador junta los chunks del lector en batches del tamaño que pide la memoria
+        if checkpoint is None: 
+            lector= pushdown.scan(archivo=self.archivo)
         else: 
-            return 0.7
+            #El numero de fila del archivo se lee junto con los datos para saber hasta donde llega cada batch
+            opciones= checkpoint.csv_options(opciones=pushdown.csv_options())
+            self.posicion= opciones['row_index_offset']
+            lector= pushdown.apply(pl.scan_csv(self.archivo, **opciones), keep=[ROW_INDEX])
+        
+        chunks= lector.collect_batches(chunk_size=self.controller.min_rows, maintain_order=True)
+        for chunk in self.controller.rebatch(chunks=chunks): 
+            if checkpoint is not None: 
+                if chunk.height: 
+                    self.posicion= chunk[ROW_INDEX].max()+1
+                chunk= chunk.drop(ROW_INDEX)
+            pushdown.observe(frame=chunk)
+            yield chunk
     
-    def csv_batch_size_row(self) -> int: 
-        batch_float= self.estimate_batch_size()
-        total_rows= self.file_overhead['total_de_filas']
+    def stream_batches(self, ETL: Callable, model: BaseModel, checkpoint: Optional[StreamCheckpoint]=None) -> Iterator[pl.DataFrame]: 
+        #Hacer otro engine aquí en caso de que las rows sean demasiadas para procesar en eager o lazy mode
+        schema_validado= False
+        filas_procesadas= 0
+        #Cada batch se valida completo contra el contrato de la primera ingesta
+        validador= PolarsSchema(model=model)
+        logger.info(f'\nSe empieza el procesamiento de datos por streaming para el archivo {self.archivo.name}')
         
-        batch_rows= int(total_rows*batch_float)
+        for chunk in self._iter_batches(pushdown=model.scan.pushdown(), checkpoint=checkpoint): 
+            frame= ETL(Frame=chunk, model=model).etl()
+            del chunk
+            
+            validador.validation_schema(frame=frame)
+            if not schema_validado: 
+                if checkpoint is not None: 
+                    checkpoint.verify(frame=frame)
+                schema_validado= True
+            
+            filas_procesadas+=frame.height
+            logger.info(f'Filas {frame.height} procesadas exitosamente. {filas_procesadas} filas procesadas en total')
+            if checkpoint is not None: 
+                checkpoint.mark(filas=filas_procesadas, posicion={'tipo': 'csv', 'filas_fuente': self.posicion})
+            
+            yield frame
+            
+            del frame
+            gc.collect()
         
-        batch_rows= max(batch_rows, 10000)
-        batch_rows= min(batch_rows, total_rows)
-        return batch_rows
+        if not schema_validado: 
+            logger.warning('Archivo sin filas a procesar')
     
     def run_streaming(self, ETL: Callable, model: BaseModel) -> None: 
-        #Hacer otro engine aquí en caso de que las rows sean demasiadas para procesar en eager o lazy mode
-        row_size= self.csv_batch_size_row()
-        
-        table_name= model.database.table_name
-        if_table_exists= model.database.if_table_exists
-        """postgres= PostgresDatabase(
-            table_name=table_name, 
+        #Con checkpoint de una corrida que fallo se continua con append desde el ultimo commit
+        checkpoint= _stream_checkpoint(archivo=self.archivo, model=model)
+        postgres= PostgresDatabase(
+            table_name=model.database.table_name, 
             file_overhead=self.file_overhead, 
-            if_table_exists=if_table_exists
-        )"""
-        
-        first_chunk= pl.read_csv(self.archivo, n_rows=row_size)
-        etl= ETL(Frame= first_chunk, model=model)
-        frame= etl.etl()
-        #total_filas= len(frame)
-        
-        logger.info(f'\nColumnas {frame.height} procesadas exitosamente')
-        
-        """postgres.database_insert_data(
-            StreamingCSVHandler=self.estimate_batch_size(), 
-            frame=frame.lazy(),
-            n_rows=total_filas
-        )"""
-        
-        schema= frame.schema
-        frame.write_parquet('pandera_report.parquet')
-        diccionario, archivo= self._file_overhead(archivo='pandera_report.parquet')
-        try: 
-            PanderaSchema(model=model, archivo=archivo, file_overhead=diccionario)
-        except Exception as e: 
-            logger.error(f'El schema no es compatible. Ocurrio un error en la ejecucion:\n{e}')
-            raise
-        
-        skip_chunk=row_size
-        while True: 
-            try: 
-                next_chunk= pl.read_csv(
-                    self.archivo, 
-                    skip_rows=skip_chunk, 
-                    n_rows=row_size, 
-                    schema_overrides=schema
-                )
-                #total_filas= len(next_chunk)
-                
-                if next_chunk.height==0: 
-                    logger.warning('Archivo sin más filas a procesar')
-                    return next_chunk
-                
-                frame= etl.etl()
-                """postgres.database_insert_data(
-                    StreamingCSVHandler=self.estimate_batch_size(), 
-                    frame=frame.lazy(),
-                    n_rows=total_filas
-                )"""
-                
-                logger.info(f'Columnas {frame.height} procesadas exitosamente.\n{skip_chunk} saltadas')
-                skip_chunk+=row_size
-                
-                del frame
-                gc.collect()
-            except Exception as e: 
-                logger.warning(f'Fin del archivo u ocurrio un error: \n{e}')
-                break
+            if_table_exists='append' if checkpoint is not None and checkpoint.previo else model.database.if_table_exists, 
+            commit_interval=model.database.commit_interval, 
+            copy_format=model.database.copy_format, 
+            parallel_connections=model.database.parallel_connections, 
+            controller=self.controller, 
+            incremental=model.scan.pushdown().incremental, 
+            checkpoint=checkpoint
+        )
+        
+        postgres.database_insert_data(frame=self.stream_batches(ETL=ETL, model=model, checkpoint=checkpoint))
 
 class StreamingParquetHanlder: 
-    def __init__(self, archivo: Path, file_overhead: Dict[str, Any], os_margin: float=0.3, n_rows_sample: int=1000):
+    def __init__(self, archivo: Path, file_overhead: Dict[str, Any], os_margin: float=0.3, n_rows_sample: int=1000, max_workers: Optional[int]=None):
         self.os_margin= os_margin
         self.n_rows_sample= n_rows_sample
+        self.max_workers= max_workers
         
         self.archivo= archivo
+        self.file_overhead_model= file_overhead
         self.file_overhead= file_overhead['parquet_file_pyarrow']
         self.row_group= file_overhead['parquet_file_pyarrow'].num_row_groups
+        self.controller= AdaptiveBatchController(file_overhead=file_overhead)
+        self._local= threading.local()
     
-    def _file_overhead(self, archivo: str) -> Dict[str, Any]: 
-        archivo= Path(archivo)
-        diccionario= PipelineEstimatedSizeFiles(archivo=archivo, os_margin=self.os_margin, n_rows_sample=self.n_rows_sample).estimated_size_file()
-        return diccionario, archivo
+    def parquet_workers(self) -> int: 
+        #El ratio es la memoria estimada del archivo completo entre la memoria disponible, 
+        #por lo que cada grupo de filas ocupa ratio/row_groups de la memoria disponible
+        ratio_por_grupo= self.file_overhead_model['ratio']/max(self.row_group, 1)
+        presupuesto= 1-self.os_margin
+        
+        if ratio_por_grupo <= 0: 
+            workers= self.row_group
+        else: 
+            #Se deja lugar para el grupo que se esta insertando en la base de datos
+            workers= int(presupuesto // ratio_por_grupo) - 1
+        
+        workers= min(workers, os.cpu_count() or 1, self.row_group)
+        if self.max_workers: 
+            workers= min(workers, self.max_workers)
+        workers= max(workers, 1)
+        
+        logger.info(f'Workers para grupos de filas: {workers}. Fraccion de memoria por grupo: {ratio_por_grupo:.4f}')
+        return workers
     
-    def run_streaming(self, ETL: Callable, model: BaseModel) -> None: 
-        table_name= model.database.table_name
-        if_table_exists= model.database.if_table_exists
-        """postgres= PostgresDatabase(
-            table_name=table_name, 
-            file_overhead=self.file_overhead, 
-            if_table_exists=if_table_exists
-        )"""
+    def _process_row_group(self, i: int, ETL: Callable, model: BaseModel, pushdown: ScanPushdown, validador: PolarsSchema) -> Tuple[pl.DataFrame, float]: 
+        #Cada hilo abre su propio ParquetFile para no compartir el lector entre hilos
+        parquet_file= getattr(self._local, 'parquet_file', None)
+        if parquet_file is None: 
+            import pyarrow.parquet as pp
+            parquet_file= pp.ParquetFile(self.archivo)
+            self._local.parquet_file= parquet_file
         
-        streaming_csv_handler= StreamingCSVHandler(
-            archivo=self.archivo, 
-            file_overhead=self.file_overhead, 
-            os_margin=self.os_margin, 
-            n_rows_sample=self.n_rows_sample
-        ).estimate_batch_size()
+        logger.info(f'Procesando {i+1} de {self.row_group} totales de grupos')
+        inicio= time.perf_counter()
+        #Solo se decodifican las columnas seleccionadas y las de los filtros
+        table= parquet_file.read_row_group(i, columns=pushdown.read_columns())
+        df= pushdown.apply(pl.from_arrow(table))
+        pushdown.observe(frame=df)
+        del table
         
+        transformed= ETL(Frame= df, model=model).etl()
+        del df
+        #La validacion de cada grupo corre en su hilo, un error se propaga con el resultado del futuro
+        validador.validation_schema(frame=transformed)
+        return (transformed, time.perf_counter()-inicio)
+    
+    def stream_batches(self, ETL: Callable, model: BaseModel, checkpoint: Optional[StreamCheckpoint]=None) -> Iterator[pl.DataFrame]: 
         schema_validado= False
+        filas_procesadas= 0
+        pushdown= model.scan.pushdown()
+        validador= PolarsSchema(model=model)
+        grupos= pushdown.row_groups(metadata=self.file_overhead.metadata)
+        #Se continua en el grupo del checkpoint, saltando las filas del grupo que ya se confirmaron
+        grupo_inicio, filas_inicio= checkpoint.row_group_position() if checkpoint is not None else (0, 0)
+        grupos= [grupo for grupo in grupos if grupo >= grupo_inicio]
+        workers= self.parquet_workers()
         logger.info(f'\nSe empieza el procesamiento de datos por streaming para el archivo {self.archivo.name}')
         
-        for i in range(self.row_group):
-            logger.info(f'Procesando {i+1} de {self.row_group} totales de grupos')
-            table= self.file_overhead.read_row_group(i)
-            df= pl.from_arrow(table)
-            
-            transformed= ETL(Frame= df, model=model).etl()
-            
-            row_size= len(transformed)
-            
-            """postgres.database_insert_data(
-                StreamingCSVHandler=streaming_csv_handler, 
-                frame=transformed.lazy(), 
-                n_rows=row_size
-            )"""
+        #Ventana de futuros en orden: como maximo hay `workers` grupos en proceso al mismo tiempo
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='parquet-row-group') as executor: 
+            pendientes= deque()
+            siguiente= 0
             
-            if not schema_validado: 
-                transformed.write_parquet('pandera_report.parquet')
-                diccionario, archivo= self._file_overhead(archivo='pandera_report.parquet')
-                try: 
-                    PanderaSchema(model=model, archivo=archivo, file_overhead=diccionario)
-                    logger.info('El schema se conserva igual')
-                except Exception as e: 
-                    logger.error(f'El schema no es compatible. Ocurrio un error en la ejecucion:\n{e}')
-                    raise
-                schema_validado= True
-                
-                del df
-                del transformed
-                gc.collect()
-            else: 
-                del df
-                del transformed
-                gc.collect()
+            try: 
+                while siguiente < len(grupos) or pendientes: 
+                    while siguiente < len(grupos) and len(pendientes) < workers: 
+                        pendientes.append(executor.submit(self._process_row_group, grupos[siguiente], ETL, model, pushdown, validador))
+                        siguiente+=1
+                    
+                    grupo= grupos[siguiente-len(pendientes)]
+                    transformed, elapsed= pendientes.popleft().result()
+                    
+                    if not schema_validado: 
+                        if checkpoint is not None: 
+                            checkpoint.verify(frame=transformed)
+                        schema_validado= True
+                    
+                    filas_grupo= transformed.height
+                    entregadas= 0
+                    if grupo == grupo_inicio and filas_inicio: 
+                        transformed= transformed.slice(filas_inicio)
+                        entregadas= filas_inicio
+                    
+                    #Los grupos de filas son unidades fijas, se entregan en slices del tamaño del controlador
+                    for batch in self.controller.split(frame=transformed, elapsed=elapsed): 
+                        entregadas+= batch.height
+                        filas_procesadas+= batch.height
+                        if checkpoint is not None: 
+                            checkpoint.mark(filas=filas_procesadas, posicion={'tipo': 'parquet', 'row_group': grupo, 'offset': entregadas, 'completo': entregadas >= filas_grupo})
+                        yield batch
+                    
+                    del transformed
+                    gc.collect()
+            finally: 
+                #Si el consumidor falla o cierra el generador no se procesan los grupos pendientes
+                for futuro in pendientes: 
+                    futuro.cancel()
+    
+    def run_streaming(self, ETL: Callable, model: BaseModel) -> None: 
+        #Con checkpoint de una corrida que fallo se continua con append desde el ultimo commit
+        checkpoint= _stream_checkpoint(archivo=self.archivo, model=model)
+        postgres= PostgresDatabase(
+            table_name=model.database.table_name, 
+            file_overhead=self.file_overhead_model, 
+            if_table_exists='append' if checkpoint is not None and checkpoint.previo else model.database.if_table_exists, 
+            commit_interval=model.database.commit_interval, 
+            copy_format=model.database.copy_format, 
+            parallel_connections=model.database.parallel_connections, 
+            controller=self.controller, 
+            incremental=model.scan.pushdown().incremental, 
+            checkpoint=checkpoint
+        )
+        
+        postgres.database_insert_data(frame=self.stream_batches(ETL=ETL, model=model, checkpoint=checkpoint))
 
 class PipelineStreaming:
     #Hacer otro engine aquí en caso de que las rows sean demasiadas para procesar en eager o lazy mode
@@ -198,10 +254,11 @@ class PipelineStreaming:
         tracemalloc.start()
         start_time = time.perf_counter()
         
-        if self.archivo.suffix == '.csv': 
-            StreamingCSVHandler(archivo=self.archivo, file_overhead=self.file_overhead).run_streaming(ETL=ETL, model=model)
-        else: 
-            StreamingParquetHanlder(archivo=self.archivo, file_overhead=self.file_overhead).run_streaming(ETL=ETL, model=model)
+        with PeakMemoryMonitor() as monitor: 
+            if self.archivo.suffix == '.csv': 
+                StreamingCSVHandler(archivo=self.archivo, file_overhead=self.file_overhead).run_streaming(ETL=ETL, model=model)
+            else: 
+                StreamingParquetHanlder(archivo=self.archivo, file_overhead=self.file_overhead, os_margin=self.file_overhead['os_margin'], max_workers=model.os_configuration.row_group_workers).run_streaming(ETL=ETL, model=model)
         
         elapsed_time = time.perf_counter() - start_time
         mem_after = process.memory_info().rss
@@ -218,6 +275,7 @@ class PipelineStreaming:
             'cpu_percent': cpu_after - cpu_before,
             'tracemalloc_current_mb': current / (1024**2),
             'tracemalloc_peak_mb': peak / (1024**2),
+            'memoria_rss_pico_mb': monitor.peak_bytes() / (1024**2),
             'io_read_bytes': io_counters.read_bytes,
             'io_write_bytes': io_counters.write_bytes
         }
@@ -0,0 +1,132 @@
+import psutil
+import time
+import logging
+import polars as pl
+from typing import Dict, Any, Iterator
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+class AdaptiveBatchController: 
+    #Un solo controlador para los batches de CSV, Parquet y PostgreSQL: mide los bytes por fila
+    #reales de cada batch y el crecimiento del RSS, y ajusta el siguiente batch para quedar dentro
+    #de la envolvente de memoria (definida por os_margin) y del tiempo objetivo por batch
+    def __init__(self,
+        file_overhead: Dict[str, Any],
+        min_rows: int=10_000,
+        max_rows: int=2_000_000,
+        target_seconds: float=2.0,
+        memory_fraction: float=0.1): 
+        self.os_margin= file_overhead['os_margin']
+        self.total_memory= file_overhead.get('total_memory', psutil.virtual_memory().total)
+        
+        self.min_rows= min_rows
+        self.max_rows= max_rows
+        self.target_seconds= target_seconds
+        self.memory_fraction= memory_fraction
+        
+        #Estimacion inicial de bytes por fila a partir del estimador, se reemplaza con lo medido
+        total_filas= max(file_overhead.get('total_de_filas', 0), 1)
+        self.bytes_per_row= max(file_overhead.get('memoria_total_estimada', 0)/total_filas, 1.0)
+        self.medido= False
+        
+        self.process= psutil.Process()
+        self.rss_base= self.process.memory_info().rss
+        self.batch_rows= self._clamp(self.memory_envelope()/self.bytes_per_row)
+        logger.info(f'Batch inicial de {self.batch_rows} filas ({self.bytes_per_row:.1f} bytes por fila estimados)')
+    
+    def _clamp(self, filas: float) -> int: 
+        filas= int(filas)
+        filas= max(filas, self.min_rows)
+        filas= min(filas, self.max_rows)
+        return filas
+    
+    def memory_envelope(self) -> float: 
+        #Memoria que puede ocupar un batch: lo disponible menos el margen del sistema operativo,
+        #repartido entre los batches que viven al mismo tiempo en el pipeline
+        disponible= psutil.virtual_memory().available
+        safety_memory= self.total_memory*self.os_margin
+        return max((disponible-safety_memory)*self.memory_fraction, self.min_rows*self.bytes_per_row)
+    
+    def next_batch_size(self) -> int: 
+        return self.batch_rows
+    
+    def batch_bytes(self) -> float: 
+        return self.batch_rows*self.bytes_per_row
+    
+    def observe(self, frame: pl.DataFrame, elapsed: float) -> int: 
+        filas= frame.height
+        if filas == 0: 
+            return self.batch_rows
+        
+        bytes_por_fila= max(frame.estimated_size()/filas, 1.0)
+        if self.medido: 
+            self.bytes_per_row= 0.5*self.bytes_per_row + 0.5*bytes_por_fila
+        else: 
+            self.bytes_per_row= bytes_por_fila
+            self.medido= True
+        
+        envolvente= self.memory_envelope()
+        objetivo= envolvente/self.bytes_per_row
+        
+        if elapsed > 0: 
+            filas_por_segundo= filas/elapsed
+            objetivo= min(objetivo, filas_por_segundo*self.target_seconds)
+        
+        #Si el proceso crecio mas alla de la envolvente del pipeline se reduce el batch
+        crecimiento= self.process.memory_info().rss - self.rss_base
+        if crecimiento > envolvente/self.memory_fraction: 
+            objetivo= min(objetivo, self.batch_rows*0.5)
+            logger.warning(f'El RSS crecio {crecimiento/(1024**2):.1f} MB, se reduce el batch')
+        
+        #Cambios graduales para no oscilar entre batches
+        objetivo= min(objetivo, self.batch_rows*2)
+        objetivo= max(objetivo, self.batch_rows*0.5)
+        
+        nuevo= self._clamp(objetivo)
+        if nuevo != self.batch_rows: 
+            logger.info(f'Batch ajustado de {self.batch_rows} a {nuevo} filas ({self.bytes_per_row:.1f} bytes por fila medidos)')
+        self.batch_rows= nuevo
+        return self.batch_rows
+    
+    def queue_depth(self, max_depth: int=4) -> int: 
+        disponible= psutil.virtual_memory().available - self.total_memory*self.os_margin
+        #Cada batch en cola vive como tabla de Arrow mas su buffer codificado
+        depth= int((disponible*0.5) // max(self.batch_bytes()*2, 1))
+        depth= max(depth, 1)
+        depth= min(depth, max_depth)
+        return depth
+    
+    def rebatch(self, chunks: Iterator[pl.DataFrame]) -> Iterator[pl.DataFrame]: 
+        #Junta chunks chicos de un lector hacia adelante hasta llegar al tamaño que pide el controlador
+        pendientes= []
+        filas= 0
+        inicio= time.perf_counter()
+        
+        for chunk in chunks: 
+            if chunk.height == 0: 
+                continue
+            pendientes.append(chunk)
+            filas+=chunk.height
+            
+            if filas >= self.batch_rows: 
+                frame= pl.concat(pendientes, rechunk=True) if len(pendientes) > 1 else pendientes[0]
+                pendientes= []
+                filas= 0
+                self.observe(frame=frame, elapsed=time.perf_counter()-inicio)
+                
+                yield frame
+                del frame
+                inicio= time.perf_counter()
+        
+        if pendientes: 
+            frame= pl.concat(pendientes, rechunk=True) if len(pendientes) > 1 else pendientes[0]
+            self.observe(frame=frame, elapsed=time.perf_counter()-inicio)
+            yield frame
+    
+    def split(self, frame: pl.DataFrame, elapsed: float) -> Iterator[pl.DataFrame]: 
+        #Para unidades de lectura fijas (grupos de filas de Parquet) se mide la unidad completa
+        #y se entrega en slices sin copia del tamaño que pide el controlador
+        self.observe(frame=frame, elapsed=elapsed)
+        for offset in range(0, frame.height, self.batch_rows): 
+            yield frame.slice(offset, self.batch_rows)
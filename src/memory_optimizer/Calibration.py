@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+import psutil
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+GRUPOS= ['entero', 'flotante', 'booleano', 'fecha', 'string', 'otro']
+
+#Multiplicadores a mano usados como punto de partida (y hacia donde se regulariza el ajuste)
+PRIORS= {
+    'csv': {'entero': 1.55, 'flotante': 1.65, 'booleano': 2.5, 'fecha': 1.8, 'string': 1.4, 'otro': 1.7},
+    'parquet': {'entero': 1.3, 'flotante': 1.4, 'booleano': 2.0, 'fecha': 1.5, 'string': 1.5, 'otro': 1.7}
+}
+
+def dtype_group(dtype: str) -> str: 
+    if dtype.startswith(('Int', 'UInt')): 
+        return 'entero'
+    if dtype.startswith(('Float', 'Decimal')): 
+        return 'flotante'
+    if dtype == 'Boolean': 
+        return 'booleano'
+    if dtype.startswith(('Date', 'Time', 'Duration')): 
+        return 'fecha'
+    if dtype in ('String', 'Utf8', 'Categorical'): 
+        return 'string'
+    return 'otro'
+
+class PeakMemoryMonitor: 
+    #Muestrea el RSS en un hilo para obtener el pico real (Polars y Arrow no aparecen en tracemalloc)
+    def __init__(self, interval: float=0.05): 
+        self.interval= interval
+        self.process= psutil.Process()
+        self.detener= threading.Event()
+        self.rss_base= 0
+        self.rss_pico= 0
+        self.inicio= 0.0
+        self.fin= 0.0
+    
+    def _sample(self) -> None: 
+        while not self.detener.wait(self.interval): 
+            self.rss_pico= max(self.rss_pico, self.process.memory_info().rss)
+    
+    def __enter__(self) -> 'PeakMemoryMonitor': 
+        self.rss_base= self.process.memory_info().rss
+        self.rss_pico= self.rss_base
+        self.inicio= time.perf_counter()
+        self.hilo= threading.Thread(target=self._sample, name='peak-memory-monitor', daemon=True)
+        self.hilo.start()
+        return self
+    
+    def __exit__(self, *args) -> None: 
+        self.detener.set()
+        self.hilo.join()
+        self.rss_pico= max(self.rss_pico, self.process.memory_info().rss)
+        self.fin= time.perf_counter()
+    
+    def peak_bytes(self) -> int: 
+        #Incremento sobre el RSS de entrada; si el allocator reutiliza memoria ya reservada se queda corto
+        return max(self.rss_pico - self.rss_base, 0)
+    
+    def peak_rss(self) -> int: 
+        #Pico absoluto del proceso, no depende de lo que el allocator ya tenia reservado
+        return self.rss_pico
+    
+    def seconds(self) -> float: 
+        return max(self.fin - self.inicio, 0.0)
+
+#Cota de Huber en desviaciones robustas (MAD) del residuo: las corridas mas alejadas pierden peso
+HUBER= 1.345
+
+class MemoryCalibrator: 
+    #Ajusta un coeficiente por grupo de dtype mas un termino fijo: pico_rss = fijo + sum(coef_g * bytes_arrow_g)
+    #con ridge hacia los multiplicadores a mano, y lo guarda en disco para las siguientes decisiones.
+    #La prediccion nunca baja del pico mas alto ya medido para el mismo perfil
+    def __init__(self,
+        path: str,
+        ridge: float=1.0,
+        min_observations: int=3,
+        max_observations: int=200,
+        min_seconds: float=1.0,
+        min_bytes: float=64*1024**2): 
+        self.path= Path(path)
+        self.ridge= ridge
+        self.min_observations= min_observations
+        self.max_observations= max_observations
+        self.min_seconds= min_seconds
+        self.min_bytes= min_bytes
+        self._lock= threading.Lock()
+    
+    def _load(self) -> Dict[str, Any]: 
+        if not self.path.exists(): 
+            return {'observaciones': [], 'coeficientes': {}, 'picos': {}}
+        try: 
+            with open(self.path, 'r') as file: 
+                estado= json.load(file)
+        except (OSError, json.JSONDecodeError): 
+            logger.warning(f'No se pudo leer la calibracion {self.path.name}, se empieza de cero')
+            return {'observaciones': [], 'coeficientes': {}, 'picos': {}}
+        estado.setdefault('picos', {})
+        return estado
+    
+    def _save(self, estado: Dict[str, Any]) -> None: 
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporal= self.path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(temporal, 'w') as file: 
+            json.dump(estado, file)
+        os.replace(temporal, self.path)
+    
+    @staticmethod
+    def features(profile: Dict[str, Any]) -> Optional[Dict[str, float]]: 
+        #Bytes de Arrow del archivo completo por grupo de dtype, a partir de la muestra del perfil
+        bytes_por_columna= profile.get('bytes_por_columna')
+        schema= profile.get('schema')
+        if not bytes_por_columna or not schema: 
+            return None
+        
+        filas= profile['total_de_filas']
+        grupos= dict.fromkeys(GRUPOS, 0.0)
+        for col, bytes_col in bytes_por_columna.items(): 
+            grupos[dtype_group(schema.get(col, ''))]+= bytes_col*filas
+        return grupos
+    
+    @staticmethod
+    def profile_key(features: Dict[str, float]) -> str: 
+        return hashlib.sha256(json.dumps(features, sort_keys=True).encode()).hexdigest()[:16]
+    
+    def _fit(self, tipo: str, observaciones: List[Dict[str, Any]]) -> Dict[str, float]: 
+        import numpy as np
+        prior= np.array([PRIORS[tipo][g] for g in GRUPOS])
+        x= np.array([[obs['features'][g] for g in GRUPOS] for obs in observaciones])
+        y= np.array([obs['medido'] for obs in observaciones], dtype=float)
+        
+        #Columna de unos para el termino fijo (interprete, librerias y buffers); su prior es la mediana de lo
+        #que los multiplicadores a mano no explican, asi el RSS base no se reparte entre los grupos
+        fijo= max(float(np.median(y - x @ prior)), 0.0)
+        x= np.hstack([x, np.ones((len(y), 1))])
+        prior= np.append(prior, fijo)
+        
+        #Error absoluto en bytes con columnas normalizadas: el ridge pesa igual en cada grupo y los grupos
+        #sin datos se quedan en el prior
+        escala= np.sqrt(np.maximum((x**2).mean(axis=0), 1e-12))
+        z= x/escala
+        objetivo= prior*escala
+        pesos= np.ones_like(y)
+        for _ in range(20): 
+            a= z.T @ (pesos[:, None]*z) + self.ridge*np.eye(z.shape[1])
+            b= z.T @ (pesos*y) + self.ridge*objetivo
+            beta= np.linalg.solve(a, b)
+            residuo= y - z @ beta
+            #Pesos de Huber: una corrida ruidosa no arrastra los coeficientes
+            mad= 1.4826*np.median(np.abs(residuo - np.median(residuo)))
+            if mad <= 0: 
+                break
+            nuevos= np.minimum(1.0, HUBER*mad/np.maximum(np.abs(residuo), 1e-12))
+            if np.allclose(nuevos, pesos): 
+                break
+            pesos= nuevos
+        
+        coef= beta/escala
+        coeficientes= dict(zip(GRUPOS, np.clip(coef[:-1], 1.0, 10.0).tolist()))
+        coeficientes['fijo']= max(float(coef[-1]), 0.0)
+        return coeficientes
+    
+    def coefficients(self, tipo: str) -> Optional[Dict[str, float]]: 
+        return self._load()['coeficientes'].get(tipo)
+    
+    def predict(self, profile: Dict[str, Any]) -> Optional[float]: 
+        coef= self.coefficients(tipo=profile['tipo'])
+        features= self.features(profile=profile)
+        if coef is None or features is None: 
+            return None
+        
+        estimada= coef.get('fijo', 0.0) + sum(coef[g]*features[g] for g in GRUPOS)
+        pico= self._load()['picos'].get(self.profile_key(features=features), 0.0)
+        return max(estimada, pico)
+    
+    def _valid(self, incremento: Optional[float], duracion: Optional[float]) -> bool: 
+        #Corridas muy cortas o chicas son ruido del muestreo del RSS: cuentan para el pico pero no para el ajuste
+        if duracion is not None and duracion < self.min_seconds: 
+            return False
+        return incremento is None or incremento >= self.min_bytes
+    
+    def record(self, profile: Dict[str, Any], medido: float, estimado: float, incremento: Optional[float]=None, duracion: Optional[float]=None) -> None: 
+        #medido es el pico absoluto del RSS, el termino fijo del ajuste absorbe el RSS base del proceso
+        features= self.features(profile=profile)
+        if features is None or medido <= 0: 
+            return
+        
+        tipo= profile['tipo']
+        llave= self.profile_key(features=features)
+        with self._lock: 
+            estado= self._load()
+            estado['picos'][llave]= max(estado['picos'].pop(llave, 0.0), medido)
+            estado['picos']= dict(list(estado['picos'].items())[-self.max_observations:])
+            
+            if not self._valid(incremento=incremento, duracion=duracion): 
+                self._save(estado=estado)
+                logger.info(f'Calibracion: la corrida ({duracion or 0:.2f} s, {(incremento or 0)/(1024**2):.1f} MB) es muy corta o chica, solo se guarda su pico')
+                return
+            
+            estado['observaciones'].append({
+                'tipo': tipo,
+                'features': features,
+                'medido': medido,
+                'estimado': estimado
+            })
+            estado['observaciones']= estado['observaciones'][-self.max_observations:]
+            
+            observaciones= [obs for obs in estado['observaciones'] if obs['tipo'] == tipo]
+            if len(observaciones) >= self.min_observations: 
+                estado['coeficientes'][tipo]= self._fit(tipo=tipo, observaciones=observaciones)
+                logger.info(f'Coeficientes de memoria calibrados para {tipo}: {estado["coeficientes"][tipo]}')
+            self._save(estado=estado)
+        
+        logger.info(f'Calibracion: memoria estimada {estimado/(1024**2):.1f} MB, pico medido {medido/(1024**2):.1f} MB')
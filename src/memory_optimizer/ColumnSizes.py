@@ -0,0 +1,108 @@
+import logging
+from typing import Dict, List, Any, Optional, TYPE_CHECKING
+
+import polars as pl
+
+#Solo para la anotacion: pyarrow se importa al medir una muestra
+if TYPE_CHECKING: 
+    import pyarrow as pa
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+class ColumnSizeTable: 
+    #Tabla de bytes por fila de cada columna de la muestra a partir de los buffers reales de Arrow
+    #(datos, offsets y bitmap de validez), calculada en una sola pasada sobre el schema
+    def __init__(self, table: pl.DataFrame, rows: int): 
+        self.table= table
+        self.rows= max(rows, 1)
+    
+    @classmethod
+    def from_frame(cls, frame: pl.DataFrame) -> 'ColumnSizeTable': 
+        return cls(table=cls._build(frame=frame), rows=frame.height)
+    
+    @staticmethod
+    def _buffer_sizes(columna: 'pa.ChunkedArray') -> Dict[str, int]: 
+        #pyarrow se importa hasta medir una muestra; con el perfil en cache no se carga
+        import pyarrow as pa
+        validez= 0
+        offsets= 0
+        total= 0
+        con_offsets= (
+            pa.types.is_string(columna.type) or pa.types.is_large_string(columna.type)
+            or pa.types.is_binary(columna.type) or pa.types.is_large_binary(columna.type)
+            or pa.types.is_list(columna.type) or pa.types.is_large_list(columna.type)
+        )
+        
+        for chunk in columna.chunks: 
+            #nbytes incluye hijos y diccionario
+            total+= chunk.nbytes
+            buffers= chunk.buffers()
+            if buffers[0] is not None: 
+                validez+= buffers[0].size
+            if con_offsets and buffers[1] is not None: 
+                offsets+= buffers[1].size
+        
+        return {
+            'bytes_validez': validez,
+            'bytes_offsets': offsets,
+            'bytes_datos': max(total-validez-offsets, 0)
+        }
+    
+    @classmethod
+    def _build(cls, frame: pl.DataFrame) -> pl.DataFrame: 
+        filas= max(frame.height, 1)
+        tabla= frame.to_arrow()
+        
+        #Medianas de longitud de todos los strings en una sola consulta
+        medianas= frame.select(pl.col(pl.String).str.len_bytes().median())
+        medianas= medianas.row(0, named=True) if medianas.width else {}
+        
+        registros: List[Dict[str, Any]]= []
+        for (col, dtype), columna in zip(frame.schema.items(), tabla.columns): 
+            tamaños= cls._buffer_sizes(columna=columna)
+            registros.append({
+                'columna': col,
+                'tipo': str(dtype.base_type()),
+                **tamaños,
+                'bytes_por_fila': sum(tamaños.values())/filas,
+                'longitud_mediana': medianas.get(col)
+            })
+        
+        return cls.frame_from_records(registros=registros)
+    
+    @staticmethod
+    def frame_from_records(registros: List[Dict[str, Any]]) -> pl.DataFrame: 
+        return pl.DataFrame(registros, schema={
+            'columna': pl.String,
+            'tipo': pl.String,
+            'bytes_validez': pl.Int64,
+            'bytes_offsets': pl.Int64,
+            'bytes_datos': pl.Int64,
+            'bytes_por_fila': pl.Float64,
+            'longitud_mediana': pl.Float64
+        })
+    
+    def factors(self, factores: Dict[str, float], default: float, string: float) -> pl.Series: 
+        #Multiplicador por columna segun su tipo base, sin cadenas de if/elif por columna
+        return self.table.select(
+            pl.when(pl.col('tipo') == 'String')
+            .then(pl.lit(string))
+            .otherwise(pl.col('tipo').replace_strict(factores, default=default, return_dtype=pl.Float64))
+        ).to_series()
+    
+    def string_columns(self) -> pl.DataFrame: 
+        return self.table.filter(pl.col('tipo') == 'String')
+    
+    def avg_string_len(self) -> Optional[float]: 
+        #Largo promedio por valor de las columnas string (el buffer de datos es la suma de sus len_bytes)
+        string_columns= self.string_columns()
+        if string_columns.is_empty(): 
+            return None
+        return string_columns['bytes_datos'].sum() / (string_columns.height*self.rows)
+    
+    def bytes_per_row(self) -> float: 
+        return self.table['bytes_por_fila'].sum()
+    
+    def column_bytes(self) -> Dict[str, float]: 
+        return dict(zip(self.table['columna'], self.table['bytes_por_fila']))
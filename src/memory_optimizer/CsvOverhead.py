@@ -1,21 +1,36 @@
-import subprocess
 from pathlib import Path
-import polars as pl 
+from typing import Dict
+
+from .FileProfiler import FileProfiler
+from .ColumnSizes import ColumnSizeTable
+
+#Multiplicador de memoria por tipo base de Polars, los tipos no listados usan 1.7
+CSV_TYPE_OVERHEAD= {
+    'Int8': 1.4, 
+    'Int16': 1.45, 
+    'Int32': 1.5, 
+    'Int64': 1.55, 
+    'Float32': 1.6, 
+    'Float64': 1.65, 
+    'Boolean': 2.5, 
+    'Date': 1.8, 
+    'Datetime': 1.85, 
+    'Categorical': 1.6, 
+    'List': 2.5, 
+    'Struct': 2.8
+}
 
 class CsvOverhead: 
-    def __init__(self, path: str, n_rows_sample: int=1000):
+    def __init__(self, path: str, sizes: ColumnSizeTable):
         self.path= Path(path)
-        
-        self.frame_sample= pl.read_csv(path, n_rows=n_rows_sample)
-        self.str_columns= [col for col in self.frame_sample.columns if self.frame_sample[col].dtype == pl.String]
+        self.sizes= sizes
     
     def string_csv_overhead(self) -> float: 
-        if not self.str_columns: 
+        medianas= self.sizes.string_columns()['longitud_mediana'].drop_nulls()
+        if medianas.is_empty(): 
             return 1.0
         
-        avg_len= sum(
-            self.frame_sample[col].str.len_bytes().median() for col in self.str_columns
-        ) / len(self.str_columns)
+        avg_len= medianas.mean()
         
         if avg_len <= 1: 
             return 2.0 
@@ -30,133 +45,24 @@ class CsvOverhead:
         else: 
             return 1.1
     
+    def overhead_by_column(self) -> Dict[str, float]: 
+        #El overhead de string se calcula una sola vez para todas las columnas
+        factores= self.sizes.factors(factores=CSV_TYPE_OVERHEAD, default=1.7, string=self.string_csv_overhead())
+        return dict(zip(self.sizes.table['columna'], factores))
+    
     def overhead_csv(self) -> float: 
-        col_type_overhead=[]
-        csv_overhead= self.string_csv_overhead()
-        
-        for col in self.frame_sample.columns:
-            if self.frame_sample[col].dtype == pl.Int8: 
-                col_type_overhead.append(1.4)        
-            elif self.frame_sample[col].dtype == pl.Int16: 
-                col_type_overhead.append(1.45)
-            elif self.frame_sample[col].dtype == pl.Int32: 
-                col_type_overhead.append(1.5)
-            elif self.frame_sample[col].dtype == pl.Int64: 
-                col_type_overhead.append(1.55)
-            elif self.frame_sample[col].dtype == pl.Float32: 
-                col_type_overhead.append(1.6)
-            elif self.frame_sample[col].dtype == pl.Float64: 
-                col_type_overhead.append(1.65)
-            elif self.frame_sample[col].dtype == pl.Boolean: 
-                col_type_overhead.append(2.5)
-            elif self.frame_sample[col].dtype == pl.Date: 
-                col_type_overhead.append(1.8)
-            elif self.frame_sample[col].dtype == pl.Datetime: 
-                col_type_overhead.append(1.85)
-            elif self.frame_sample[col].dtype == pl.Categorical: 
-                col_type_overhead.append(1.6)
-            elif self.frame_sample[col].dtype == pl.List: 
-                col_type_overhead.append(2.5)
-            elif self.frame_sample[col].dtype == pl.Struct: 
-                col_type_overhead.append(2.8)
-            elif self.frame_sample[col].dtype == pl.String: 
-                col_type_overhead.append(csv_overhead)
-            else: 
-                col_type_overhead.append(1.7)
-        
-        return sum(col_type_overhead)/len(col_type_overhead)
+        factores= self.overhead_by_column()
+        return sum(factores.values())/len(factores)
 
 class CsvOverheadEstimator: 
-    def __init__(self, archivo: Path, n_rows_sample: int=1000):
+    def __init__(self, archivo: Path, profiler: FileProfiler):
         self.archivo = archivo
-        self.frame= pl.read_csv(self.archivo, n_rows=n_rows_sample)
-    
-    def string_csv_bytes(self) -> float: 
-        string_columns= [col for col in self.frame.columns if self.frame[col].dtype == pl.String]
-        
-        longitudes= []
-        
-        for col in string_columns: 
-            long_col=self.frame[col].str.len_bytes().drop_nulls()
-            if len(long_col) > 0: 
-                longitudes.append(long_col.median())
-        
-        return max(sum(longitudes), 32)
-    
-    def estimated_bytes(self) -> int:
-        bytes_estimados=[]
-        string_bytes=self.string_csv_bytes()
-        
-        for col in self.frame.columns: 
-            if self.frame[col].dtype == pl.Int8: 
-                bytes_estimados.append(1)
-            elif self.frame[col].dtype == pl.Int16: 
-                bytes_estimados.append(2)
-            elif self.frame[col].dtype == pl.Int32: 
-                bytes_estimados.append(4)
-            elif self.frame[col].dtype == pl.Int64: 
-                bytes_estimados.append(8)
-            elif self.frame[col].dtype == pl.Float32: 
-                bytes_estimados.append(4)
-            elif self.frame[col].dtype == pl.Float64: 
-                bytes_estimados.append(8)
-            elif self.frame[col].dtype == pl.Datetime: 
-                bytes_estimados.append(8)
-            elif self.frame[col].dtype == pl.Date: 
-                bytes_estimados.append(4)
-            elif self.frame[col].dtype == pl.Boolean: 
-                bytes_estimados.append(1)
-            elif self.frame[col].dtype == pl.String:
-                bytes_estimados.append(string_bytes)  
-            else:
-                bytes_estimados.append(16)
-        
-        return sum(bytes_estimados)/len(self.frame.columns)
+        self.profiler= profiler
+        self.sizes= profiler.column_sizes()
     
     def csv_bytes_per_column(self) -> float: 
-        bytes_per_column= 0
-        string_bytes=self.string_csv_bytes()
-        avg_string=self.estimated_bytes()
-        
-        for col in self.frame.columns: 
-            #Entero
-            if self.frame[col].dtype == pl.Int8: 
-                bytes_per_column+=1
-            elif self.frame[col].dtype == pl.Int16: 
-                bytes_per_column+=2
-            elif self.frame[col].dtype == pl.Int32: 
-                bytes_per_column+=4
-            elif self.frame[col].dtype == pl.Int64: 
-                bytes_per_column+=8
-            #Flotante 
-            elif self.frame[col].dtype == pl.Float32: 
-                bytes_per_column+=4
-            elif self.frame[col].dtype == pl.Float64: 
-                bytes_per_column+=8
-            #Datetime 
-            elif self.frame[col].dtype == pl.Datetime: 
-                bytes_per_column+=8
-            #Time
-            elif self.frame[col].dtype == pl.Date: 
-                bytes_per_column+=4
-            elif self.frame[col].dtype == pl.Boolean: 
-                bytes_per_column+=1
-            #string
-            elif self.frame[col].dtype == pl.String: 
-                bytes_per_column+=string_bytes
-            #Other
-            else: 
-                bytes_per_column+=avg_string
-        
-        return bytes_per_column
+        #Bytes por fila medidos en los buffers de Arrow (datos, offsets y validez) de cada columna
+        return self.sizes.bytes_per_row()
     
     def total_rows_csv(self) -> int: 
-        try: 
-            result=subprocess.run(
-                ['wc', '-l', self.archivo], 
-                capture_output=True, text=True
-            )
-            return int(result.stdout.split()[0] )-1
-        except: 
-            with open(self.archivo, 'r', encoding='utf-8') as file: 
-                return sum(1 for _ in file) -1
+        return self.profiler.total_rows()
@@ -0,0 +1,176 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import polars as pl
+
+from .ColumnSizes import ColumnSizeTable
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+class CsvRowCounter: 
+    #Cuenta filas con un solo recorrido en bloques del archivo, ignorando los saltos de linea
+    #que estan dentro de un campo entre comillas
+    CHUNK_SIZE= 8*1024*1024
+    
+    def __init__(self, archivo: Path, quote_char: bytes=b'"'): 
+        self.archivo= Path(archivo)
+        self.quote= ord(quote_char)
+    
+    def count_lines(self) -> int: 
+        #numpy se importa hasta contar filas; con el perfil en cache no se carga
+        import numpy as np
+        lineas= 0
+        dentro_de_comillas= 0
+        ultimo_byte= b''
+        
+        with open(self.archivo, 'rb') as file: 
+            while True: 
+                chunk= file.read(self.CHUNK_SIZE)
+                if not chunk: 
+                    break
+                
+                if self.quote in chunk: 
+                    arr= np.frombuffer(chunk, dtype=np.uint8)
+                    #La paridad del acumulado de comillas indica si cada byte esta dentro de un campo,
+                    #un acumulado en uint8 se desborda pero conserva la paridad
+                    paridad= (np.cumsum(arr == self.quote, dtype=np.uint8) + dentro_de_comillas) & 1
+                    lineas+= int(np.count_nonzero((arr == 10) & (paridad == 0)))
+                    dentro_de_comillas= int(paridad[-1])
+                elif not dentro_de_comillas: 
+                    lineas+= chunk.count(b'\n')
+                
+                ultimo_byte= chunk[-1:]
+        
+        #Ultima fila sin salto de linea al final
+        if ultimo_byte and ultimo_byte != b'\n': 
+            lineas+= 1
+        return lineas
+    
+    def count_rows(self, has_header: bool=True) -> int: 
+        lineas= self.count_lines()
+        return max(lineas-1, 0) if has_header else lineas
+    
+    def scan_range(self, inicio: int, fin: int) -> Tuple[int, int]: 
+        #Filas terminadas en salto de linea entre dos offsets (inicio debe ser el comienzo de una fila)
+        #y el offset donde termina la ultima; una fila a medio escribir al final no se cuenta
+        import numpy as np
+        lineas= 0
+        dentro_de_comillas= 0
+        fin_de_fila= inicio
+        posicion= inicio
+        
+        with open(self.archivo, 'rb') as file: 
+            file.seek(inicio)
+            while posicion < fin: 
+                chunk= file.read(min(self.CHUNK_SIZE, fin-posicion))
+                if not chunk: 
+                    break
+                
+                arr= np.frombuffer(chunk, dtype=np.uint8)
+                paridad= (np.cumsum(arr == self.quote, dtype=np.uint8) + dentro_de_comillas) & 1
+                saltos= np.flatnonzero((arr == 10) & (paridad == 0))
+                if saltos.size: 
+                    lineas+= int(saltos.size)
+                    fin_de_fila= posicion + int(saltos[-1]) + 1
+                
+                dentro_de_comillas= int(paridad[-1])
+                posicion+= len(chunk)
+        return lineas, fin_de_fila
+
+class FileProfiler: 
+    #Lee una sola vez la muestra del archivo y la comparte entre la validacion del config
+    #y los estimadores de memoria. Se reutiliza por ruta, tamaño y fecha de modificacion; solo se
+    #guardan los MAX_PROFILES perfiles usados mas recientemente para no retener las muestras de todos los archivos
+    MAX_SAMPLE_ROWS= 1000
+    MAX_PROFILES= 32
+    PREFIX_BYTES= 1024*1024
+    _profiles: 'OrderedDict[Tuple[str, int, int], FileProfiler]'= OrderedDict()
+    _lock= threading.Lock()
+    
+    def __init__(self, archivo: Path, n_rows_sample: int=MAX_SAMPLE_ROWS): 
+        self.archivo= Path(archivo)
+        self.n_rows_sample= n_rows_sample
+        self.frame_sample= self._read_sample()
+        self._total_rows: Optional[int]= None
+        self._column_sizes: Optional[ColumnSizeTable]= None
+    
+    @classmethod
+    def from_path(cls, archivo: Path, n_rows_sample: int=MAX_SAMPLE_ROWS) -> 'FileProfiler': 
+        archivo= Path(archivo)
+        stat= archivo.stat()
+        llave= (str(archivo.resolve()), stat.st_size, stat.st_mtime_ns)
+        
+        with cls._lock: 
+            profiler= cls._profiles.get(llave)
+            if profiler is not None and profiler.n_rows_sample >= n_rows_sample: 
+                cls._profiles.move_to_end(llave)
+                return profiler
+            
+            #Siempre se lee la muestra maxima para que las siguientes consultas no vuelvan a leer
+            profiler= cls(archivo=archivo, n_rows_sample=max(n_rows_sample, cls.MAX_SAMPLE_ROWS))
+            #Un perfil del mismo archivo con otro tamaño o fecha (o con una muestra menor) ya no se vuelve a usar
+            for vieja in [k for k in cls._profiles if k[0] == llave[0]]: 
+                del cls._profiles[vieja]
+            cls._profiles[llave]= profiler
+            while len(cls._profiles) > cls.MAX_PROFILES: 
+                cls._profiles.popitem(last=False)
+            return profiler
+    
+    def _committed_prefix(self) -> bytes: 
+        #Inicio del CSV con las filas de la muestra, cortado en el ultimo salto de linea fuera de comillas como
+        #lo hace el plan de la carga incremental: una fila a medio escribir al final no rompe la lectura
+        counter= CsvRowCounter(archivo=self.archivo)
+        size= self.archivo.stat().st_size
+        prefijo= self.PREFIX_BYTES
+        while True: 
+            fin= min(prefijo, size)
+            lineas, fin_de_fila= counter.scan_range(inicio=0, fin=fin)
+            if lineas > self.n_rows_sample or fin == size: 
+                break
+            prefijo*= 4
+        
+        with open(self.archivo, 'rb') as file: 
+            datos= file.read(fin)
+        #Sin filas completas despues del header (una sola fila sin salto de linea) se lee lo que haya
+        if fin == size and lineas <= 1: 
+            return datos
+        return datos[:fin_de_fila]
+    
+    def _read_sample(self) -> pl.DataFrame: 
+        if self.archivo.suffix == '.csv': 
+            frame= pl.read_csv(io.BytesIO(self._committed_prefix()), n_rows=self.n_rows_sample)
+        else: 
+            frame= pl.read_parquet(self.archivo, n_rows=self.n_rows_sample)
+        logger.info(f'Se leyo la muestra de {frame.height} filas del archivo {self.archivo.name}')
+        return frame
+    
+    def sample(self, n_rows: Optional[int]=None) -> pl.DataFrame: 
+        if n_rows is None: 
+            return self.frame_sample
+        return self.frame_sample.head(n_rows)
+    
+    def schema(self) -> Dict[str, str]: 
+        return {col: str(dtype) for col, dtype in self.frame_sample.schema.items()}
+    
+    def column_sizes(self) -> ColumnSizeTable: 
+        #Se calcula una sola vez por muestra y la reutilizan todos los estimadores
+        if self._column_sizes is None: 
+            self._column_sizes= ColumnSizeTable.from_frame(frame=self.frame_sample)
+        return self._column_sizes
+    
+    def column_bytes(self) -> Dict[str, float]: 
+        return self.column_sizes().column_bytes()
+    
+    def total_rows(self) -> int: 
+        if self._total_rows is None: 
+            if self.archivo.suffix == '.csv': 
+                self._total_rows= CsvRowCounter(archivo=self.archivo).count_rows()
+            else: 
+                self._total_rows= pl.scan_parquet(self.archivo).select(pl.len()).collect().item()
+            logger.info(f'Total de filas del archivo {self.archivo.name}: {self._total_rows}')
+        return self._total_rows
@@ -0,0 +1,188 @@
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import polars as pl
+
+from .ColumnSizes import ColumnSizeTable
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+class ParquetFooterProfiler: 
+    #Perfil de un Parquet solo con el footer (y las banderas de page index), sin descomprimir paginas.
+    #Expone la misma interfaz que FileProfiler para los estimadores y la validacion del config.
+    #Como en FileProfiler, solo se guardan los MAX_PROFILES footers usados mas recientemente
+    MAX_PROFILES= 32
+    _profiles: 'OrderedDict[Tuple[str, int, int], ParquetFooterProfiler]'= OrderedDict()
+    _lock= threading.Lock()
+    
+    def __init__(self, archivo: Path): 
+        #pyarrow.parquet se importa hasta perfilar un Parquet, las corridas de CSV no lo cargan
+        import pyarrow.parquet as pp
+        self.archivo= Path(archivo)
+        self.parquet_file= pp.ParquetFile(self.archivo)
+        self.metadata= self.parquet_file.metadata
+        self.arrow_schema= self.parquet_file.schema_arrow
+        self.polars_schema= pl.DataFrame(self.arrow_schema.empty_table()).schema
+        self._stats: Optional[pl.DataFrame]= None
+        self._column_sizes: Optional[ColumnSizeTable]= None
+    
+    @classmethod
+    def from_path(cls, archivo: Path) -> 'ParquetFooterProfiler': 
+        archivo= Path(archivo)
+        stat= archivo.stat()
+        llave= (str(archivo.resolve()), stat.st_size, stat.st_mtime_ns)
+        
+        with cls._lock: 
+            profiler= cls._profiles.get(llave)
+            if profiler is not None: 
+                cls._profiles.move_to_end(llave)
+                return profiler
+            
+            profiler= cls(archivo=archivo)
+            #Un footer del mismo archivo con otro tamaño o fecha ya no se vuelve a usar
+            for vieja in [k for k in cls._profiles if k[0] == llave[0]]: 
+                del cls._profiles[vieja]
+            cls._profiles[llave]= profiler
+            while len(cls._profiles) > cls.MAX_PROFILES: 
+                cls._profiles.popitem(last=False)
+            return profiler
+    
+    def total_rows(self) -> int: 
+        return self.metadata.num_rows
+    
+    def uncompressed_data_size(self) -> int: 
+        return self.column_stats()['bytes_descomprimidos'].sum()
+    
+    def schema(self) -> Dict[str, str]: 
+        return {col: str(dtype) for col, dtype in self.polars_schema.items()}
+    
+    def column_stats(self) -> pl.DataFrame: 
+        #Una fila por columna de primer nivel, agregando sus hojas y todos los grupos de filas
+        if self._stats is not None: 
+            return self._stats
+        
+        columnas: Dict[str, Dict[str, Any]]= {
+            field.name: {
+                'columna': field.name,
+                'valores': 0,
+                'nulos': 0,
+                'bytes_descomprimidos': 0,
+                'bytes_comprimidos': 0,
+                'diccionario': False,
+                'column_index': True,
+                'offset_index': True,
+                'min': None,
+                'max': None
+            }
+            for field in self.arrow_schema
+        }
+        
+        for rg in range(self.metadata.num_row_groups): 
+            row_group= self.metadata.row_group(rg)
+            for i in range(row_group.num_columns): 
+                chunk= row_group.column(i)
+                hojas= chunk.path_in_schema.split('.')
+                info= columnas[hojas[0]]
+                
+                info['valores']+= chunk.num_values
+                info['bytes_descomprimidos']+= chunk.total_uncompressed_size
+                info['bytes_comprimidos']+= chunk.total_compressed_size
+                info['diccionario']|= chunk.has_dictionary_page or any('DICTIONARY' in enc for enc in chunk.encodings)
+                info['column_index']&= chunk.has_column_index
+                info['offset_index']&= chunk.has_offset_index
+                
+                stats= chunk.statistics
+                if stats is None or len(hojas) > 1: 
+                    continue
+                if stats.has_null_count: 
+                    info['nulos']+= stats.null_count
+                if stats.has_min_max: 
+                    info['min']= stats.min if info['min'] is None else min(info['min'], stats.min)
+                    info['max']= stats.max if info['max'] is None else max(info['max'], stats.max)
+        
+        self._stats= pl.DataFrame(
+            [{**info, 'min': None if info['min'] is None else str(info['min']), 'max': None if info['max'] is None else str(info['max'])}
+            for info in columnas.values()],
+            schema={
+                'columna': pl.String,
+                'valores': pl.Int64,
+                'nulos': pl.Int64,
+                'bytes_descomprimidos': pl.Int64,
+                'bytes_comprimidos': pl.Int64,
+                'diccionario': pl.Boolean,
+                'column_index': pl.Boolean,
+                'offset_index': pl.Boolean,
+                'min': pl.String,
+                'max': pl.String
+            }
+        )
+        self._min_max= {info['columna']: (info['min'], info['max']) for info in columnas.values()}
+        logger.info(f'Se perfilo el archivo {self.archivo.name} con el footer: {self.metadata.num_row_groups} grupos de filas y {self.metadata.num_rows} filas')
+        return self._stats
+    
+    def column_sizes(self) -> ColumnSizeTable: 
+        #Bytes en memoria por columna: ancho fijo de Arrow para tipos numericos y de fecha,
+        #largo promedio de los valores para strings (plain o min/max si esta en diccionario)
+        if self._column_sizes is not None: 
+            return self._column_sizes
+        
+        import pyarrow as pa
+        filas= max(self.total_rows(), 1)
+        registros: List[Dict[str, Any]]= []
+        for info, field in zip(self.column_stats().iter_rows(named=True), self.arrow_schema): 
+            tipo= field.type
+            no_nulos= max(filas-info['nulos'], 0)
+            validez= (filas+7)//8 if info['nulos'] else 0
+            offsets= 0
+            mediana= None
+            
+            if pa.types.is_boolean(tipo): 
+                datos= (filas+7)//8
+            elif pa.types.is_string(tipo) or pa.types.is_large_string(tipo) or pa.types.is_binary(tipo) or pa.types.is_large_binary(tipo): 
+                minimo, maximo= self._min_max[info['columna']]
+                if info['diccionario'] and minimo is not None: 
+                    #Con diccionario el tamaño descomprimido no refleja el largo de los valores
+                    mediana= (len(minimo)+len(maximo))/2
+                else: 
+                    #Plain guarda 4 bytes de largo por valor
+                    mediana= max(info['bytes_descomprimidos'] - 4*no_nulos, 0)/max(no_nulos, 1)
+                datos= int(mediana*no_nulos)
+                offsets= (filas+1)*8
+            else: 
+                try: 
+                    datos= filas*tipo.byte_width
+                except ValueError: 
+                    datos= info['bytes_descomprimidos']
+            
+            registros.append({
+                'columna': info['columna'],
+                'tipo': str(self.polars_schema[info['columna']].base_type()),
+                'bytes_validez': validez,
+                'bytes_offsets': offsets,
+                'bytes_datos': datos,
+                'bytes_por_fila': (validez+offsets+datos)/filas,
+                'longitud_mediana': mediana
+            })
+        
+        self._column_sizes= ColumnSizeTable(table=ColumnSizeTable.frame_from_records(registros=registros), rows=filas)
+        return self._column_sizes
+    
+    def column_bytes(self) -> Dict[str, float]: 
+        return self.column_sizes().column_bytes()
+    
+    def sample(self, n_rows: Optional[int]=None) -> pl.DataFrame: 
+        #Sin leer datos: un frame de dos filas con el minimo y maximo de cada columna segun el footer,
+        #suficiente para probar los casts de data_type
+        self.column_stats()
+        datos= {}
+        for col, dtype in self.polars_schema.items(): 
+            minimo, maximo= self._min_max[col]
+            try: 
+                datos[col]= pl.Series(col, [minimo, maximo], dtype=dtype, strict=False)
+            except Exception: 
+                datos[col]= pl.Series(col, [None, None], dtype=dtype)
+        return pl.DataFrame(datos)
@@ -1,108 +1,92 @@
 from pathlib import Path
-import polars as pl 
-from typing import Dict, Any
-import pyarrow.parquet as pp
-import pyarrow as pa
+from typing import Dict, Optional, Union
 
-from pathlib import Path
+from .FileProfiler import FileProfiler
+from .ParquetFooter import ParquetFooterProfiler
+
+#Multiplicador de memoria por tipo base de Polars para overhead_parquet, los tipos no listados usan 1.7
+PARQUET_TYPE_OVERHEAD= {
+    'Int8': 1.2, 
+    'Int16': 1.25, 
+    'Int32': 1.3, 
+    'Int64': 1.35, 
+    'Float32': 1.4, 
+    'Float64': 1.45, 
+    'Boolean': 2.0, 
+    'Date': 1.5, 
+    'Datetime': 1.55, 
+    'Categorical': 1.1, 
+    'List': 2.2, 
+    'Struct': 2.5
+}
+
+#Factores del algoritmo por tipo base, los tipos no listados usan overhead_parquet
+PARQUET_ALGORITHM_OVERHEAD= {
+    **{tipo: 1.3 for tipo in ['Int8', 'Int16', 'Int32', 'Int64', 'UInt8', 'UInt16', 'UInt32', 'UInt64']}, 
+    'Float32': 1.4, 
+    'Float64': 1.4, 
+    'Boolean': 2.0, 
+    'Date': 1.5, 
+    'Datetime': 1.5, 
+    'List': 2.2
+}
 
 class ParquetOverheadEstimator: 
-    def __init__(self, archivo: Path, n_rows_sample: int=1000):
+    def __init__(self, archivo: Path, profiler: Union[FileProfiler, ParquetFooterProfiler]):
         self.path = archivo
-        self.n_rows_sample= n_rows_sample
-        self.parquet_file= pp.ParquetFile(self.path)
+        self.profiler= profiler
+        self.sizes= profiler.column_sizes()
+        if isinstance(profiler, ParquetFooterProfiler): 
+            self.parquet_file= profiler.parquet_file
+        else: 
+            import pyarrow.parquet as pp
+            self.parquet_file= pp.ParquetFile(self.path)
         self.metadata = self.parquet_file.metadata
-        self.schema= self.metadata.schema.to_arrow_schema()
+        self._string_overhead: Optional[float]= None
     
     def string_overhead(self) -> float: 
-        sample_median=pl.read_parquet(self.path, n_rows=self.n_rows_sample)
-        string_columns= [col for col in sample_median.columns if sample_median[col].dtype == pl.String]
-        
-        if not string_columns: 
-            return 1.0
+        if self._string_overhead is not None: 
+            return self._string_overhead
         
-        avg_string_len=sum([
-            sample_median[col].str.len_bytes().sum() for col in string_columns
-        ]) / len(string_columns)
+        avg_string_len= self.sizes.avg_string_len()
+        if avg_string_len is None: 
+            self._string_overhead= 1.0
+            return self._string_overhead
         
         avg_string_len= max(1.0, avg_string_len)
         
         base= 1.0+4.0 / avg_string_len
         if avg_string_len < 5: 
-            return min(base+0.4, 2.2)
-        if avg_string_len < 10: 
-            return base + 0.2
+            self._string_overhead= min(base+0.4, 2.2)
+        elif avg_string_len < 10: 
+            self._string_overhead= base + 0.2
         elif avg_string_len < 20: 
-            return base + 0.1
+            self._string_overhead= base + 0.1
         else: 
-            return base + 0.05
+            self._string_overhead= base + 0.05
+        return self._string_overhead
     
     def overhead_parquet(self) -> float: 
-        promedio_overhead= []
-        
-        for valor in self.schema: 
-            dtype= valor.type
-            if pa.types.is_int8(dtype):
-                promedio_overhead.append(1.2)
-            elif pa.types.is_int16(dtype): 
-                promedio_overhead.append(1.25)
-            elif pa.types.is_int32(dtype): 
-                promedio_overhead.append(1.3)
-            elif pa.types.is_int64(dtype): 
-                promedio_overhead.append(1.35)
-            elif pa.types.is_float32(dtype): 
-                promedio_overhead.append(1.4)
-            elif pa.types.is_float64(dtype): 
-                promedio_overhead.append(1.45)
-            elif pa.types.is_boolean(dtype): 
-                promedio_overhead.append(2.0)
-            elif pa.types.is_date(dtype): 
-                promedio_overhead.append(1.5)
-            elif pa.types.is_timestamp(dtype): 
-                promedio_overhead.append(1.55)
-            elif pa.types.is_dictionary(dtype): 
-                promedio_overhead.append(1.1)
-            elif pa.types.is_list(dtype): 
-                promedio_overhead.append(2.2)
-            elif pa.types.is_struct(dtype): 
-                promedio_overhead.append(2.5)
-            elif pa.types.is_string(dtype) or pa.types.is_large_string(dtype): 
-                promedio_overhead.append(self.string_overhead())
-            else: 
-                promedio_overhead.append(1.7)
-        
-        return sum(promedio_overhead)/len(promedio_overhead)
+        factores= self.sizes.factors(factores=PARQUET_TYPE_OVERHEAD, default=1.7, string=self.string_overhead())
+        return factores.mean()
     
-    def parquet_algorithm_overhead(self) -> Dict[str, Any]: 
-        factores= []
-        overhead_default= self.overhead_parquet()
-        string_parquet_overhead=self.string_overhead()
-        
-        for col in self.schema: 
-            tipo= col.type
-            #Entero 
-            if pa.types.is_integer(tipo): 
-                factores.append(1.3)
-            #Flotante 
-            elif pa.types.is_floating(tipo): 
-                factores.append(1.4)
-            #String 
-            elif pa.types.is_string(tipo) or pa.types.is_large_string(tipo): 
-                factores.append(string_parquet_overhead)
-            #Boleano 
-            elif pa.types.is_boolean(tipo): 
-                factores.append(2.0)
-            #Timestamp o fecha
-            elif pa.types.is_timestamp(tipo) or pa.types.is_date(tipo):
-                factores.append(1.5)
-            #Lista de types
-            elif pa.types.is_list(tipo): 
-                factores.append(2.2)
-            #Otro 
-            else: 
-                factores.append(overhead_default)
-        
-        return sum(factores) / len(factores)
+    def algorithm_overhead_by_column(self) -> Dict[str, float]: 
+        factores= self.sizes.factors(factores=PARQUET_ALGORITHM_OVERHEAD, default=self.overhead_parquet(), string=self.string_overhead())
+        return dict(zip(self.sizes.table['columna'], factores))
+    
+    def parquet_algorithm_overhead(self) -> float: 
+        factores= self.algorithm_overhead_by_column()
+        return sum(factores.values())/len(factores)
+    
+    def uncompressed_by_column(self) -> Dict[str, int]: 
+        #Las columnas anidadas suman todas sus hojas
+        columnas= dict.fromkeys(self.parquet_file.schema_arrow.names, 0)
+        for rg in range(self.metadata.num_row_groups): 
+            row_group= self.metadata.row_group(rg)
+            for col in range(row_group.num_columns): 
+                chunk= row_group.column(col)
+                columnas[chunk.path_in_schema.split('.')[0]]+= chunk.total_uncompressed_size
+        return columnas
     
     def uncompressed_data_size(self) -> int: 
         uncompressed_data_size = sum([
@@ -1,28 +1,113 @@
 import psutil
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Literal, Union, List
 import logging 
 from pathlib import Path
 
 from .CsvOverhead import CsvOverhead, CsvOverheadEstimator
 from .ParquetOverhead import ParquetOverheadEstimator
+from .FileProfiler import FileProfiler
+from .ProfileCache import ProfileCache
+from .Calibration import MemoryCalibrator
+from .ParquetFooter import ParquetFooterProfiler
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
 logger= logging.getLogger(__name__)
 
 class FileSizeEstimator: 
-    def __init__(self, os_margin: float=0.3, n_rows_sample: int=1000):
+    def __init__(self, os_margin: float=0.3, n_rows_sample: int=1000, calibrator: Optional[MemoryCalibrator]=None):
         self.os_margin= os_margin
         self.n_rows_sample= n_rows_sample
+        self.calibrator= calibrator
     
-    def estimate_parquet_size(self, 
-        class_overhead_parquet) -> Dict[str, Any]: 
-        #file overhead and unconmpressed
+    def _calibrated(self, profile: Dict[str, Any], estimated_memory: float) -> float: 
+        if self.calibrator is None: 
+            return estimated_memory
+        
+        calibrada= self.calibrator.predict(profile=profile)
+        if calibrada is None: 
+            return estimated_memory
+        
+        logger.info(f'Memoria estimada con coeficientes calibrados: {calibrada} (sin calibrar: {estimated_memory})')
+        return calibrada
+    
+    def parquet_profile(self, 
+        class_overhead_parquet, 
+        profiler: Union[FileProfiler, ParquetFooterProfiler], 
+        modo: str='sample') -> Dict[str, Any]: 
+        #Lo que solo depende del archivo y se puede guardar en cache
         uncompressed_data_size= class_overhead_parquet.uncompressed_data_size()
         overhead_estimated= class_overhead_parquet.parquet_algorithm_overhead()
         total_filas= class_overhead_parquet.metadata.num_rows
         
+        return {
+            'tipo': 'parquet', 
+            'modo': modo, 
+            'n_rows_sample': self.n_rows_sample, 
+            'archivo_descomprimido': uncompressed_data_size, 
+            'overhead_estimado': overhead_estimated, 
+            'total_de_filas': total_filas, 
+            'descomprimido_por_columna': class_overhead_parquet.uncompressed_by_column(), 
+            'overhead_por_columna': class_overhead_parquet.algorithm_overhead_by_column(), 
+            'bytes_por_columna': profiler.column_bytes(), 
+            'schema': profiler.schema()
+        }
+    
+    def csv_profile(self, 
+        csv_overhead_estimator_class, 
+        csv_overhead_class, 
+        profiler: FileProfiler) -> Dict[str, Any]: 
+        return {
+            'tipo': 'csv', 
+            'n_rows_sample': self.n_rows_sample, 
+            'total_de_filas': csv_overhead_estimator_class.total_rows_csv(), 
+            'bytes_por_fila': csv_overhead_estimator_class.csv_bytes_per_column(), 
+            'csv_overhead': csv_overhead_class.overhead_csv(), 
+            'overhead_por_columna': csv_overhead_class.overhead_by_column(), 
+            'bytes_por_columna': profiler.column_bytes(), 
+            'schema': profiler.schema()
+        }
+    
+    def project(self, profile: Dict[str, Any], columnas: Optional[List[str]]) -> Dict[str, Any]: 
+        #Perfil restringido a las columnas que se van a leer (scan.select mas las de los filtros)
+        if not columnas: 
+            return profile
+        
+        overheads= [profile['overhead_por_columna'][col] for col in columnas]
+        proyectado= {
+            **profile, 
+            'bytes_por_columna': {col: profile['bytes_por_columna'][col] for col in columnas}, 
+            'schema': {col: profile['schema'][col] for col in columnas}
+        }
+        if profile['tipo'] == 'csv': 
+            proyectado['bytes_por_fila']= sum(proyectado['bytes_por_columna'].values())
+            proyectado['csv_overhead']= sum(overheads)/len(overheads)
+        else: 
+            proyectado['archivo_descomprimido']= sum(profile['descomprimido_por_columna'][col] for col in columnas)
+            proyectado['overhead_estimado']= sum(overheads)/len(overheads)
+        
+        logger.info(f'Se estima la memoria solo para {len(columnas)} de {len(profile["schema"])} columnas')
+        return proyectado
+    
+    def restrict_rows(self, profile: Dict[str, Any], filas: Optional[int]) -> Dict[str, Any]: 
+        #Perfil restringido a las filas nuevas de una carga incremental
+        if filas is None or filas >= profile['total_de_filas']: 
+            return profile
+        
+        restringido= {**profile, 'total_de_filas': filas}
+        if profile['tipo'] == 'parquet': 
+            restringido['archivo_descomprimido']= profile['archivo_descomprimido']*filas/max(profile['total_de_filas'], 1)
+        logger.info(f'Se estima la memoria solo para {filas} de {profile["total_de_filas"]} filas')
+        return restringido
+    
+    def estimate_parquet_size(self, 
+        profile: Dict[str, Any]) -> Dict[str, Any]: 
+        #file overhead and unconmpressed
+        uncompressed_data_size= profile['archivo_descomprimido']
+        overhead_estimated= profile['overhead_estimado']
+        total_filas= profile['total_de_filas']
+        
         #resources available and estimated
-        estimated_memory= (overhead_estimated*uncompressed_data_size)
+        estimated_memory= self._calibrated(profile=profile, estimated_memory=overhead_estimated*uncompressed_data_size)
         memoria_disponible=psutil.virtual_memory().available
         total_memory=psutil.virtual_memory().total
         
@@ -52,15 +137,14 @@ class FileSizeEstimator:
         }
     
     def estimate_csv_size(self, 
-        csv_overhead_estimator_class, 
-        csv_overhead_class) -> Dict[str, Any]: 
+        profile: Dict[str, Any]) -> Dict[str, Any]: 
         #bytes and num rows
-        num_rows= csv_overhead_estimator_class.total_rows_csv()
-        bytes_per_column= csv_overhead_estimator_class.csv_bytes_per_column()
-        csv_overhead= csv_overhead_class.overhead_csv()
+        num_rows= profile['total_de_filas']
+        bytes_per_column= profile['bytes_por_fila']
+        csv_overhead= profile['csv_overhead']
         
         #resources and estimated resources
-        estimated_memory= (num_rows*csv_overhead*bytes_per_column) 
+        estimated_memory= self._calibrated(profile=profile, estimated_memory=num_rows*csv_overhead*bytes_per_column)
         memoria_disponible= psutil.virtual_memory().available
         total_memory=psutil.virtual_memory().total
         
@@ -88,42 +172,99 @@ class FileSizeEstimator:
         }
 
 class PipelineEstimatedSizeFiles: 
-    def __init__(self, archivo: str, os_margin: float=0.3, n_rows_sample: int=1000):
+    def __init__(self, 
+        archivo: str, 
+        os_margin: float=0.3, 
+        n_rows_sample: int=1000, 
+        cache: Optional[ProfileCache]=None, 
+        calibrator: Optional[MemoryCalibrator]=None, 
+        eager_ratio: float=0.65, 
+        lazy_ratio: float=2.0, 
+        parquet_profiling: Literal['sample', 'metadata']='sample', 
+        columnas: Optional[List[str]]=None, 
+        filas: Optional[int]=None):
         self.archivo= Path(archivo)
+        self.columnas= columnas
+        #Filas que se van a leer en una carga incremental, None para el archivo completo
+        self.filas= filas
+        self.parquet_profiling= parquet_profiling
         self.n_rows_sample= n_rows_sample
-        self.estimator=FileSizeEstimator(os_margin=os_margin, n_rows_sample=n_rows_sample)
+        self.cache= cache
+        self.eager_ratio= eager_ratio
+        self.lazy_ratio= lazy_ratio
+        self.estimator=FileSizeEstimator(os_margin=os_margin, n_rows_sample=n_rows_sample, calibrator=calibrator)
     
-    def estimated_size_file(self) -> Dict[str, Any]: 
+    def _cached_profile(self) -> Optional[Dict[str, Any]]: 
+        if self.cache is None: 
+            return None
+        
+        entrada= self.cache.get(archivo=self.archivo)
+        if not entrada or 'perfil' not in entrada: 
+            return None
+        
+        perfil= entrada['perfil']
+        if 'overhead_por_columna' not in perfil: 
+            return None
+        if self.archivo.suffix == '.parquet' and perfil.get('modo', 'sample') != self.parquet_profiling: 
+            logger.info(f'El perfil en cache no es de modo {self.parquet_profiling}, se vuelve a perfilar')
+            return None
+        if perfil.get('n_rows_sample') != self.n_rows_sample: 
+            logger.info('El perfil en cache se calculo con otro n_rows_sample, se vuelve a perfilar')
+            return None
+        
+        logger.info(f'Se uso el perfil en cache del archivo {self.archivo.name}')
+        return perfil
+    
+    def file_profile(self) -> Dict[str, Any]: 
+        perfil= self._cached_profile()
+        if perfil is not None: 
+            return perfil
+        
         if self.archivo.suffix == '.csv': 
-            overhead_csv_class= CsvOverheadEstimator(archivo=self.archivo, n_rows_sample=self.n_rows_sample)
-            overhead_csv= CsvOverhead(path=self.archivo, n_rows_sample=self.n_rows_sample)
-            resources_csv= self.estimator.estimate_csv_size(csv_overhead_class=overhead_csv, csv_overhead_estimator_class=overhead_csv_class)
-            
-            resources_csv['tamaño_archivo']=self.archivo.stat().st_size
-            if resources_csv['ratio'] <= 0.65: 
-                resources_csv['decision']= 'eager'
-                logger.info('Decision: "eager"')
-            elif resources_csv['ratio'] <= 2.0:
-                resources_csv['decision']= 'lazy'
-                logger.info('Decision: "lazy"')
-            else: 
-                resources_csv['decision']= 'streaming'
-                logger.info('Decision: "streaming"')
-            return resources_csv
+            #Una sola lectura de la muestra para todos los estimadores y la validacion del config
+            profiler= FileProfiler.from_path(archivo=self.archivo, n_rows_sample=self.n_rows_sample)
+            overhead_csv_class= CsvOverheadEstimator(archivo=self.archivo, profiler=profiler)
+            overhead_csv= CsvOverhead(path=self.archivo, sizes=profiler.column_sizes())
+            perfil= self.estimator.csv_profile(csv_overhead_class=overhead_csv, csv_overhead_estimator_class=overhead_csv_class, profiler=profiler)
         else: 
-            overhead_parquet= ParquetOverheadEstimator(archivo=self.archivo, n_rows_sample=self.n_rows_sample)
-            resources_parquet=self.estimator.estimate_parquet_size(class_overhead_parquet=overhead_parquet)
-            
-            resources_parquet['parquet_file_pyarrow']= overhead_parquet.parquet_file
-            resources_parquet['tamaño_archivo']=self.archivo.stat().st_size
-            if resources_parquet['ratio'] <= 0.65: 
-                resources_parquet['decision']= 'eager'
-                logger.info('Decision: "eager"')
-            elif resources_parquet['ratio'] <= 2.0:
-                resources_parquet['decision']= 'lazy'
-                logger.info('Decision: "lazy"')
+            if self.parquet_profiling == 'metadata': 
+                #Solo el footer, sin leer ni descomprimir paginas de datos
+                profiler= ParquetFooterProfiler.from_path(archivo=self.archivo)
             else: 
-                resources_parquet['decision']= 'streaming'
-                logger.info('Decision: "streaming"')
-            return resources_parquet
-
+                profiler= FileProfiler.from_path(archivo=self.archivo, n_rows_sample=self.n_rows_sample)
+            overhead_parquet= ParquetOverheadEstimator(archivo=self.archivo, profiler=profiler)
+            perfil= self.estimator.parquet_profile(class_overhead_parquet=overhead_parquet, profiler=profiler, modo=self.parquet_profiling)
+        
+        if self.cache is not None: 
+            self.cache.update(archivo=self.archivo, perfil=perfil, schema=perfil['schema'])
+            logger.info(f'Se guardo el perfil del archivo {self.archivo.name} en cache')
+        return perfil
+    
+    def _decision(self, resources: Dict[str, Any], perfil: Dict[str, Any]) -> Dict[str, Any]: 
+        resources['tamaño_archivo']=self.archivo.stat().st_size
+        resources['perfil']= perfil
+        if resources['ratio'] <= self.eager_ratio: 
+            resources['decision']= 'eager'
+            logger.info('Decision: "eager"')
+        elif resources['ratio'] <= self.lazy_ratio:
+            resources['decision']= 'lazy'
+            logger.info('Decision: "lazy"')
+        else: 
+            resources['decision']= 'streaming'
+            logger.info('Decision: "streaming"')
+        return resources
+    
+    def estimated_size_file(self) -> Dict[str, Any]: 
+        #El perfil sale de cache o de la muestra; el ratio y la decision se recalculan con la memoria actual
+        perfil= self.estimator.project(profile=self.file_profile(), columnas=self.columnas)
+        perfil= self.estimator.restrict_rows(profile=perfil, filas=self.filas)
+        
+        if self.archivo.suffix == '.csv': 
+            resources_csv= self.estimator.estimate_csv_size(profile=perfil)
+            return self._decision(resources=resources_csv, perfil=perfil)
+        else: 
+            resources_parquet=self.estimator.estimate_parquet_size(profile=perfil)
+            #Solo lee el footer del archivo
+            import pyarrow.parquet as pp
+            resources_parquet['parquet_file_pyarrow']= pp.ParquetFile(self.archivo)
+            return self._decision(resources=resources_parquet, perfil=perfil)
@@ -0,0 +1,119 @@
+import json
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+class ProfileCache: 
+    #Cache en disco del perfil de cada archivo (filas, bytes por columna, overheads y schema).
+    #La llave es la ruta, el tamaño y la fecha de modificacion; en Parquet tambien el hash del footer
+    def __init__(self, directory: str, max_entries: int=256, ttl_days: float=30): 
+        self.directory= Path(directory)
+        self.max_entries= max_entries
+        self.ttl_seconds= ttl_days*24*60*60
+    
+    @staticmethod
+    def _parquet_footer_hash(archivo: Path) -> str: 
+        #Footer: metadata + largo de la metadata (4 bytes) + 'PAR1'
+        with open(archivo, 'rb') as file: 
+            file.seek(-8, os.SEEK_END)
+            largo= int.from_bytes(file.read(4), 'little')
+            file.seek(-(8+largo), os.SEEK_END)
+            return hashlib.sha256(file.read(largo)).hexdigest()
+    
+    def fingerprint(self, archivo: Path) -> Dict[str, Any]: 
+        archivo= Path(archivo).resolve()
+        stat= archivo.stat()
+        huella= {
+            'archivo': str(archivo),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        }
+        if archivo.suffix == '.parquet': 
+            huella['footer_hash']= self._parquet_footer_hash(archivo=archivo)
+        return huella
+    
+    def _key(self, huella: Dict[str, Any]) -> str: 
+        return hashlib.sha256(json.dumps(huella, sort_keys=True).encode()).hexdigest()
+    
+    @staticmethod
+    def _file_prefix(huella: Dict[str, Any]) -> str: 
+        #Prefijo por ruta del archivo: las entradas viejas del mismo archivo se encuentran por nombre sin leerlas
+        return hashlib.sha256(huella['archivo'].encode()).hexdigest()[:16]
+    
+    def _entry_path(self, huella: Dict[str, Any]) -> Path: 
+        return self.directory / f'{self._file_prefix(huella)}-{self._key(huella)}.json'
+    
+    def get(self, archivo: Path) -> Optional[Dict[str, Any]]: 
+        try: 
+            huella= self.fingerprint(archivo=archivo)
+        except (OSError, ValueError): 
+            return None
+        
+        ruta= self._entry_path(huella)
+        if not ruta.exists(): 
+            return None
+        
+        try: 
+            with open(ruta, 'r') as file: 
+                entrada= json.load(file)
+        except FileNotFoundError: 
+            #Otro hilo la desalojo despues del exists
+            return None
+        except (OSError, json.JSONDecodeError): 
+            logger.warning(f'La entrada de cache {ruta.name} esta corrupta, se elimina')
+            ruta.unlink(missing_ok=True)
+            return None
+        
+        if time.time() - entrada.get('creado', 0) > self.ttl_seconds: 
+            logger.info(f'La entrada de cache del archivo {Path(archivo).name} expiro')
+            ruta.unlink(missing_ok=True)
+            return None
+        
+        #Se actualiza la fecha de acceso para el desalojo LRU
+        try: 
+            os.utime(ruta)
+        except FileNotFoundError: 
+            pass
+        return entrada
+    
+    def update(self, archivo: Path, **campos: Any) -> None: 
+        huella= self.fingerprint(archivo=archivo)
+        ruta= self._entry_path(huella)
+        entrada= self.get(archivo=archivo) or {**huella, 'creado': time.time()}
+        entrada.update(campos)
+        
+        self.directory.mkdir(parents=True, exist_ok=True)
+        #Los hilos del scheduler comparten el pid
+        temporal= ruta.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(temporal, 'w') as file: 
+            json.dump(entrada, file)
+        os.replace(temporal, ruta)
+        
+        self._invalidate_stale(huella=huella, vigente=ruta)
+        self._evict()
+    
+    def _invalidate_stale(self, huella: Dict[str, Any], vigente: Path) -> None: 
+        #Entradas del mismo archivo con otra huella ya no son validas (el archivo cambio)
+        for ruta in self.directory.glob(f'{self._file_prefix(huella)}-*.json'): 
+            if ruta != vigente: 
+                ruta.unlink(missing_ok=True)
+    
+    def _evict(self) -> None: 
+        #Otro hilo puede borrar una entrada entre el glob y el stat
+        entradas= []
+        for ruta in self.directory.glob('*.json'): 
+            try: 
+                entradas.append((ruta.stat().st_mtime, ruta))
+            except FileNotFoundError: 
+                continue
+        entradas.sort()
+        for _, ruta in entradas[:max(len(entradas)-self.max_entries, 0)]: 
+            ruta.unlink(missing_ok=True)
+            logger.info(f'Se desalojo la entrada de cache {ruta.name}')
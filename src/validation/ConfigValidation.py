@@ -1,25 +1,68 @@
-from pydantic import BaseModel, field_validator, model_validator, Field
+from pydantic import BaseModel, field_validator, model_validator, Field, PrivateAttr
 import polars as pl 
 import logging
+import re
 from pathlib import Path
-from typing import Dict, Optional, Literal, Any
-import pickle
+from typing import Dict, Optional, Literal, Any, List
 
 from ..strategies.Strategies import rename_columns_estrategia, dtype_estrategia
 from ..etl.ETL import DataTypeCleaning
+from ..etl.ScanPushdown import ScanPushdown
+from ..etl.Incremental import IncrementalLoad
+from ..etl.Checkpoint import StreamCheckpoint
+from ..database.LoadState import LoadStateStore, CheckpointStore
+from ..memory_optimizer.FileProfiler import FileProfiler
+from ..memory_optimizer.ParquetFooter import ParquetFooterProfiler
+from ..memory_optimizer.ProfileCache import ProfileCache
+from ..memory_optimizer.Calibration import MemoryCalibrator
+from .SchemaRegistry import SchemaRegistry, config_entry, CONFIG
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
 logger= logging.getLogger(__name__)
 
+DATA_DIR= Path(__file__).resolve().parent.parent.parent / 'data'
+GLOB_CHARS= ('*', '?', '[')
+
+def _partition_value(valor: str) -> Any: 
+    for tipo in (int, float): 
+        try: 
+            return tipo(valor)
+        except ValueError: 
+            continue
+    return valor
+
 class path_validation(BaseModel): 
+    #input_path puede ser un archivo, un directorio (incluyendo arboles particionados estilo Hive, clave=valor)
+    #o un patron glob, relativo a data/ o absoluto
     input_path: str
     
+    @staticmethod
+    def _expand(path: Path) -> List[Path]: 
+        if any(c in str(path) for c in GLOB_CHARS): 
+            #El glob parte de la parte sin comodines de la ruta, dentro de data/ o absoluta
+            partes= path.parts
+            i= next(i for i, parte in enumerate(partes) if any(c in parte for c in GLOB_CHARS))
+            candidatos= Path(*partes[:i]).glob(str(Path(*partes[i:])))
+        elif path.is_dir(): 
+            candidatos= path.rglob('*')
+        else: 
+            return [path]
+        return sorted(p for p in candidatos if p.is_file() and p.suffix in ['.csv', '.parquet'])
+    
     @field_validator('input_path')
     def validate_path(cls, v): 
-        path = Path(__file__).resolve().parent.parent.parent / 'data' / v
+        path = DATA_DIR / v
         nombre = path.name
         terminacion = path.suffix
         
+        if any(c in v for c in GLOB_CHARS) or path.is_dir(): 
+            archivos= cls._expand(path)
+            if not archivos: 
+                logger.info(f'No hay archivos .csv o .parquet en {v}')
+                raise FileNotFoundError(f'No hay archivos .csv o .parquet en {v}')
+            logger.info(f'Se encontraron {len(archivos)} archivos en {v}')
+            return path
+        
         if not path.exists(): 
             logger.info(f'El archivo {nombre} no existe')
             raise FileNotFoundError(f'El archivo {nombre} no existe')
@@ -28,6 +71,42 @@ class path_validation(BaseModel):
             logger.info((f'El archivo {nombre} no debe tener una terminacion .csv o .parquet'))
             raise ValueError(f'El archivo {nombre} no debe tener una terminacion .csv o .parquet')
         return path
+    
+    def files(self) -> List[Path]: 
+        return self._expand(Path(self.input_path))
+    
+    def base_dir(self) -> Path: 
+        #Parte del input_path sin comodines, de donde empiezan las particiones
+        path= Path(self.input_path)
+        while any(c in path.name for c in GLOB_CHARS): 
+            path= path.parent
+        return path if path.is_dir() else path.parent
+    
+    def partitions(self, archivo: Path) -> Dict[str, Any]: 
+        #Valores de particion Hive (clave=valor) de los directorios entre base_dir y el archivo
+        try: 
+            partes= Path(archivo).parent.relative_to(self.base_dir()).parts
+        except ValueError: 
+            return {}
+        particiones= {}
+        for parte in partes: 
+            if '=' in parte: 
+                clave, valor= parte.split('=', 1)
+                particiones[clave]= _partition_value(valor)
+        return particiones
+    
+    def table_stem(self) -> str: 
+        path= Path(self.input_path)
+        if path.is_dir(): 
+            #Un directorio de particiones (anio=2021) toma el nombre del directorio de arriba de ellas
+            while '=' in path.name and path.parent != path: 
+                path= path.parent
+            return path.name
+        nombre= path.stem
+        for c in [*GLOB_CHARS, ']']: 
+            nombre= nombre.replace(c, '')
+        nombre= nombre.strip('_-. ')
+        return nombre or path.parent.name
 
 class schema_config_validation(BaseModel): 
     column_naming: Optional[rename_columns_estrategia]
@@ -71,6 +150,12 @@ class schema_config_validation(BaseModel):
 class os_configuration_validation(BaseModel): 
     os_margin: float= Field(ge=0.1, le=0.5)
     n_rows_sample: int
+    parquet_profiling: Literal['sample', 'metadata']= 'sample'
+    file_workers: int= Field(default=4, ge=1)
+    #Hilos por archivo Parquet en streaming; None los decide el presupuesto de memoria
+    row_group_workers: Optional[int]= Field(default=None, ge=1)
+    #Directorio de los archivos de trabajo de la corrida (cache, calibracion y registro de schema)
+    scratch_dir: Optional[str]= None
     
     @field_validator('n_rows_sample')
     def n_rows_rample_validation(cls, v): 
@@ -87,6 +172,9 @@ class os_configuration_validation(BaseModel):
 class database_validation(BaseModel): 
     table_name: str
     if_table_exists: Optional[Literal['append', 'replace', 'fail']]
+    commit_interval: int= Field(default=0, ge=0)
+    copy_format: Literal['binary', 'csv']= 'binary'
+    parallel_connections: int= Field(default=1, ge=1, le=32)
     
     @field_validator('if_table_exists')
     def if_table_exists_validation(cls, v): 
@@ -129,8 +217,119 @@ class database_validation(BaseModel):
                 logger.info(f'Se obtuvo exitosamente el nuevo nombre de la tabla.\nEl nuevo nombre de la tabla es: "{v}"')
                 return v
 
+class validation_rule_validation(BaseModel): 
+    nullable: Optional[bool]= None
+    min: Any= None
+    max: Any= None
+    categories: Optional[List[Any]]= None
+
 class validation_data_validation(BaseModel): 
     sample_size: float = Field(gt=0.0, le=1.0)
+    sampling: Literal['random', 'head']= 'random'
+    max_row_groups: int= Field(default=16, ge=1)
+    seed: Optional[int]= None
+    #Reglas por columna (nombres despues del renombrado) que se suman al contrato de la primera ingesta
+    rules: Optional[Dict[str, validation_rule_validation]]= None
+
+class cache_validation(BaseModel): 
+    enabled: bool= True
+    directory: str= '.cache/profiles'
+    max_entries: int= Field(default=256, ge=1)
+    ttl_days: float= Field(default=30, gt=0)
+    
+    def profile_cache(self) -> Optional[ProfileCache]: 
+        if not self.enabled: 
+            return None
+        return ProfileCache(directory=self.directory, max_entries=self.max_entries, ttl_days=self.ttl_days)
+
+class calibration_validation(BaseModel): 
+    enabled: bool= False
+    path: str= '.cache/calibration.json'
+    ridge: float= Field(default=1.0, ge=0)
+    min_observations: int= Field(default=3, ge=1)
+    min_seconds: float= Field(default=1.0, ge=0)
+    min_peak_mb: float= Field(default=64, ge=0)
+    eager_ratio: float= Field(default=0.65, gt=0)
+    lazy_ratio: float= Field(default=2.0, gt=0)
+    
+    @model_validator(mode='after')
+    def ratio_validation(self): 
+        if self.lazy_ratio <= self.eager_ratio: 
+            logger.error(f'lazy_ratio ({self.lazy_ratio}) debe ser mayor que eager_ratio ({self.eager_ratio})')
+            raise ValueError(f'lazy_ratio ({self.lazy_ratio}) debe ser mayor que eager_ratio ({self.eager_ratio})')
+        return self
+    
+    def memory_calibrator(self) -> MemoryCalibrator: 
+        return MemoryCalibrator(path=self.path, ridge=self.ridge, min_observations=self.min_observations, min_seconds=self.min_seconds, min_bytes=self.min_peak_mb*1024**2)
+
+class scan_filter_validation(BaseModel): 
+    column: str
+    op: Literal['==', '!=', '>', '>=', '<', '<=', 'in', 'not_in', 'is_null', 'is_not_null']
+    value: Any= None
+    
+    @model_validator(mode='after')
+    def value_validation(self): 
+        if self.op in ('in', 'not_in') and not isinstance(self.value, list): 
+            logger.error(f'El filtro "{self.op}" de la columna {self.column} necesita una lista de valores')
+            raise ValueError(f'El filtro "{self.op}" de la columna {self.column} necesita una lista de valores')
+        if self.op not in ('is_null', 'is_not_null') and self.value is None: 
+            logger.error(f'El filtro "{self.op}" de la columna {self.column} necesita un valor')
+            raise ValueError(f'El filtro "{self.op}" de la columna {self.column} necesita un valor')
+        return self
+
+class scan_validation(BaseModel): 
+    select: Optional[List[str]]= None
+    filters: Optional[List[scan_filter_validation]]= None
+    #Valores de particion Hive del archivo en proceso, los asigna el scheduler
+    _partitions: Dict[str, Any]= PrivateAttr(default_factory=dict)
+    #Plan de la carga incremental del archivo en proceso, lo asigna EngineDecision
+    _incremental: Optional[IncrementalLoad]= PrivateAttr(default=None)
+    
+    def pushdown(self) -> ScanPushdown: 
+        filtros= [filtro.model_dump() for filtro in self.filters or []]
+        return ScanPushdown(select=self.select, filters=filtros, partitions=self._partitions, incremental=self._incremental)
+
+class incremental_validation(BaseModel): 
+    enabled: bool= False
+    mode: Literal['offset', 'column']= 'offset'
+    column: Optional[str]= None
+    state_table: str= 'pipeline_load_state'
+    
+    @model_validator(mode='after')
+    def column_validation(self): 
+        if self.mode == 'column' and not self.column: 
+            logger.error('El modo incremental "column" necesita el nombre de la columna de la marca de agua')
+            raise ValueError('El modo incremental "column" necesita el nombre de la columna de la marca de agua')
+        return self
+    
+    def incremental_load(self, archivo: Path, table_name: str, uri: str) -> IncrementalLoad: 
+        return IncrementalLoad(
+            archivo=archivo, 
+            table_name=table_name, 
+            store=LoadStateStore(uri=uri, state_table=self.state_table), 
+            mode=self.mode, 
+            column=self.column
+        )
+
+class checkpoint_validation(BaseModel): 
+    enabled: bool= False
+    table: str= 'pipeline_checkpoints'
+    
+    def stream_checkpoint(self, archivo: Path, table_name: str, uri: str, if_table_exists: str) -> Optional[StreamCheckpoint]: 
+        if not self.enabled: 
+            return None
+        return StreamCheckpoint(
+            archivo=archivo, 
+            table_name=table_name, 
+            store=CheckpointStore(uri=uri, table=self.table), 
+            if_table_exists=if_table_exists
+        )
+
+class registry_validation(BaseModel): 
+    path: str= '.cache/schema_registry.sqlite'
+    
+    def schema_registry(self, table_name: str) -> SchemaRegistry: 
+        return SchemaRegistry(path=self.path, table_name=table_name)
 
 class validation_yaml(BaseModel): 
     path: path_validation
@@ -138,68 +337,147 @@ class validation_yaml(BaseModel):
     validation_data: validation_data_validation
     os_configuration: os_configuration_validation
     database: database_validation
+    cache: cache_validation= Field(default_factory=cache_validation)
+    calibration: calibration_validation= Field(default_factory=calibration_validation)
+    scan: scan_validation= Field(default_factory=scan_validation)
+    incremental: incremental_validation= Field(default_factory=incremental_validation)
+    checkpoint: checkpoint_validation= Field(default_factory=checkpoint_validation)
+    registry: registry_validation= Field(default_factory=registry_validation)
+    
+    def _columns_validation(self, schema: Dict[str, Any]) -> None: 
+        data_type= self.schema_config.data_type or {}
+        select= self.scan.select
+        filtros= [filtro.column for filtro in self.scan.filters or []]
+        if self.incremental.enabled and self.incremental.mode == 'column': 
+            filtros.append(self.incremental.column)
+        
+        particiones= self.path.partitions(archivo=self.path.files()[0])
+        for col in [*data_type, *(select or []), *filtros]: 
+            if col not in schema and col not in particiones: 
+                logger.error(f'La columna {col} no se encuentra en el DataFrame del archivo\n')
+                raise ValueError(f'La columna {col} no se encuentra en el DataFrame del archivo\n')
+        
+        if select: 
+            for col in data_type: 
+                if col not in select: 
+                    logger.error(f'La columna {col} de data_type no esta en scan.select\n')
+                    raise ValueError(f'La columna {col} de data_type no esta en scan.select')
+            #El maximo de la marca de agua se toma de las filas leidas
+            if self.incremental.enabled and self.incremental.mode == 'column' and self.incremental.column not in select: 
+                logger.error(f'La columna {self.incremental.column} de la carga incremental no esta en scan.select\n')
+                raise ValueError(f'La columna {self.incremental.column} de la carga incremental no esta en scan.select')
+    
+    @model_validator(mode='after')
+    def scratch_dir_validation(self): 
+        #Va primero: la validacion de columnas ya usa la cache de perfiles. Las rutas absolutas no se mueven
+        scratch_dir= self.os_configuration.scratch_dir
+        if scratch_dir is None: 
+            return self
+        
+        scratch= Path(scratch_dir).expanduser().resolve()
+        scratch.mkdir(parents=True, exist_ok=True)
+        if not Path(self.cache.directory).is_absolute(): 
+            self.cache.directory= str(scratch / self.cache.directory)
+        if not Path(self.calibration.path).is_absolute(): 
+            self.calibration.path= str(scratch / self.calibration.path)
+        if not Path(self.registry.path).is_absolute(): 
+            self.registry.path= str(scratch / self.registry.path)
+        logger.info(f'Archivos de trabajo de la corrida en {scratch}')
+        return self
+    
+    @model_validator(mode='after')
+    def checkpoint_config_validation(self): 
+        if self.checkpoint.enabled and self.database.commit_interval == 0: 
+            logger.warning('Con commit_interval 0 la carga por streaming hace un solo commit al final y no deja checkpoints intermedios')
+        if self.checkpoint.enabled and self.database.parallel_connections > 1: 
+            logger.warning('Con parallel_connections mayor a 1 los datos se confirman en una sola transaccion al final y no hay checkpoints intermedios')
+        return self
     
     @model_validator(mode='after')
     def column_type_validation(self): 
-        archivo= Path(self.path.input_path)
-        frame= pl.read_csv(archivo, n_rows=1000) if archivo.suffix=='.csv' else pl.read_parquet(archivo, n_rows=1000)
+        #Con varios archivos se valida contra el primero, el resto se valida al ingestarse
+        archivo= self.path.files()[0]
+        data_type= self.schema_config.data_type
+        
+        #Con el archivo sin cambios se valida contra el schema en cache y sin volver a leer la muestra
+        cache= self.cache.profile_cache()
+        entrada= cache.get(archivo=archivo) if cache else None
+        if entrada and 'schema' in entrada: 
+            self._columns_validation(schema=entrada['schema'])
+            if not data_type or entrada.get('casts_validados') == data_type: 
+                logger.info(f'Se valido data_type con el schema en cache del archivo {archivo.name}')
+                return self
+        
+        if archivo.suffix == '.parquet' and self.os_configuration.parquet_profiling == 'metadata': 
+            #Los casts se prueban sobre el minimo y maximo del footer, sin leer filas
+            frame= ParquetFooterProfiler.from_path(archivo=archivo).sample()
+        else: 
+            frame= FileProfiler.from_path(archivo=archivo).sample()
         schema= frame.schema
         
         #Validar columnas y conversion de tipo de datos para data_type 
-        data_type= self.schema_config.data_type
+        self._columns_validation(schema=schema)
         if data_type: 
-            for col in data_type: 
-                if col not in schema: 
-                    logger.error(f'La columna {col} no se encuentra en el DataFrame del archivo\n')
-                    raise ValueError(f'La columna {col} no se encuentra en el DataFrame del archivo\n')
-            
             for col, tipo in data_type.items(): 
                 try:
                     frame.with_columns(DataTypeCleaning().cast_expr(col=col, dtype=tipo))
                 except Exception: 
                     logger.error(f'Ocurrio un error al querer tranformar la columna {col} a el tipo de dato {tipo}\n')
                     raise ValueError(f'currio un error al querer tranformar la columna {col} a el tipo de dato {tipo}')
+        
+        if cache: 
+            cache.update(archivo=archivo, schema={col: str(dtype) for col, dtype in schema.items()}, casts_validados=data_type)
         return self
     
     @model_validator(mode='after')
-    def schema_config_validation(self):
-        column_naming= self.schema_config.column_naming
-        date_format= self.schema_config.date_format
-        data_type= self.schema_config.data_type
-        decimal_precision= self.schema_config.decimal_precision
-        
-        def _primera_ingesta() -> Optional[Dict[str, Any]]:
-            path= Path('schema_config.pkl')
-            if path.exists(): 
-                try: 
-                    with open(path, 'rb') as f: 
-                        schema_config= pickle.load(f)
-                        logger.info(f'Se cargo correctamente el archivo {path.name}')
-                except Exception as e: 
-                    logger.error(f'Ocurrio un error al querer cargar el archivo {path.name}')
-                return schema_config
+    def table_name(self): 
+        archivo= self.path.table_stem()
+        
+        if self.database.table_name=='new_table': 
+            self.database.table_name= archivo.lower()
+            self.database.table_name= self.database.table_name.lower()
+            len_v= len(self.database.table_name)
+            self.database.table_name= self.database.table_name.strip()
+            len_v_later= len(self.database.table_name)
+            if not(len_v == len_v_later): 
+                logger.warning('Se quitaron los espacios de inicio y fin de la palabra')
+            
+            if '-' in self.database.table_name: 
+                self.database.table_name= self.database.table_name.replace('-', '_')
+                logger.warning('Se remplazaron los caracteres - por _')
+            
+            if ' ' in self.database.table_name: 
+                self.database.table_name= self.database.table_name.replace(' ', '')
+                logger.warning('Se quitaron los espacios en blanco entre las palabras')
             
-            if not path.exists():
-                diccionario={
-                    'column_naming':column_naming,
-                    'date_format':date_format,
-                    'data_type':data_type, 
-                    'decimal_precision':decimal_precision
-                }
-                logger.info('Se obtuvo el primer schema para la configuracion')
-                
-                try: 
-                    with open(path, 'wb') as f: 
-                        pickle.dump(diccionario, f)
-                        logger.info('Se creo la primera ingetsa de schema')
-                except Exception as e: 
-                    logger.error(f'Ocurrio un error al querer escribir la primera ingesta de datos:\n{e}')
-                    raise ValueError(f'Ocurrio un error al querer escribir la primera ingesta de datos:\n{e}')
-        
-        diccionario= _primera_ingesta()
-        if not diccionario: 
+            #Identificador sin comillas de Postgres: solo [a-z0-9_] y sin empezar con digito
+            nombre= re.sub(r'[^a-z0-9_]', '_', self.database.table_name)
+            if not nombre or nombre[0].isdigit(): 
+                nombre= f't_{nombre}'
+            if nombre != self.database.table_name: 
+                logger.warning(f'El nombre de tabla {self.database.table_name} se cambio a {nombre} para que sea un identificador valido')
+                self.database.table_name= nombre
+            
+        return self
+    
+    @model_validator(mode='after')
+    def schema_config_validation(self):
+        #Se valida despues de table_name: la primera ingesta se registra por tabla destino
+        registry= self.registry.schema_registry(table_name=self.database.table_name)
+        registry.migrate_legacy()
+        
+        actual= config_entry(diccionario={
+            'column_naming': self.schema_config.column_naming,
+            'date_format': self.schema_config.date_format,
+            'data_type': self.schema_config.data_type,
+            'decimal_precision': self.schema_config.decimal_precision
+        })
+        diccionario= registry.register(kind=CONFIG, valor=actual)
+        if SchemaRegistry.fingerprint(valor=diccionario) == SchemaRegistry.fingerprint(valor=actual): 
+            logger.info('Se valido la consistencia de datos')
             return self
         
+        column_naming, date_format, data_type, decimal_precision= actual['column_naming'], actual['date_format'], actual['data_type'], actual['decimal_precision']
         column_naming_cls= diccionario.get('column_naming')
         date_format_cls= diccionario.get('date_format')
         data_type_cls= diccionario.get('data_type')
@@ -213,40 +491,14 @@ class validation_yaml(BaseModel):
             raise ValueError(f'El formato de fecha no debe de ser diferente en caso de existir columnas tipo fecha pasar de {date_format} a {date_format_cls}')
         elif data_type_cls != data_type: 
             logger.error(f'''El tipo de dato no puede ser diferente. 
-                {'Cambiar de None al Diccionario antiguo' if isinstance(data_type, None)
+                {'Cambiar de None al Diccionario antiguo' if data_type is None
                 else 'Cambiar de Diccionario a None'
                 }''')
             raise ValueError(f'''El tipo de dato no puede ser diferente. 
-                {'Cambiar de None al Diccionario antiguo' if isinstance(data_type, None)
+                {'Cambiar de None al Diccionario antiguo' if data_type is None
                 else 'Cambiar de Diccionario a None'
                 }''')
         elif decimal_precision_cls != decimal_precision: 
             logger.error(f'La presicion de decimal no debe de ser diferente de {decimal_precision_cls}')
             raise ValueError(f'La presicion de decimal no debe de ser diferente de {decimal_precision_cls}')
-        else: 
-            logger.info('Se valido la consistencia de datos')
-            return self
     
-    @model_validator(mode='after')
-    def table_name(self): 
-        archivo= self.path.input_path.stem
-        
-        if self.database.table_name=='new_table': 
-            self.database.table_name= archivo.lower()
-            self.database.table_name= self.database.table_name.lower()
-            len_v= len(self.database.table_name)
-            self.database.table_name= self.database.table_name.strip()
-            len_v_later= len(self.database.table_name)
-            if not(len_v == len_v_later): 
-                logger.warning('Se quitaron los espacios de inicio y fin de la palabra')
-            
-            if '-' in self.database.table_name: 
-                self.database.table_name= self.database.table_name.replace('-', '_')
-                logger.warning('Se remplazaron los caracteres - por _')
-            
-            if ' ' in self.database.table_name: 
-                self.database.table_name= self.database.table_name.replace(' ', '')
-                logger.warning('Se quitaron los espacios en blanco entre las palabras')
-            
-        return self
-
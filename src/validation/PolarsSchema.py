@@ -0,0 +1,105 @@
+import polars as pl
+from pydantic import BaseModel
+from typing import Dict, Any, List, Union, Optional
+import logging
+
+from .SchemaRegistry import CONTRACT
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+#Separador entre columna y regla en los nombres de las agregaciones
+SEP= '|'
+
+class PolarsSchema: 
+    #Contrato de la primera ingesta (columnas, tipos y nulos) mas las reglas del config (rangos y categorias)
+    #compilado en expresiones de Polars. Cada frame se valida con una sola consulta de agregacion que cuenta
+    #las filas que rompen cada regla, sin materializar las filas que fallan
+    def __init__(self, model: BaseModel): 
+        self.rules= model.validation_data.rules or {}
+        #El contrato se guarda en el registro de schema de la tabla destino
+        self.registry= model.registry.schema_registry(table_name=model.database.table_name)
+        self.contract: Optional[Dict[str, Any]]= None
+        self._plan: Optional[List[pl.Expr]]= None
+    
+    def _first_ingest(self, frame: Union[pl.DataFrame, pl.LazyFrame]) -> Dict[str, Any]: 
+        #Tipos del schema y columnas con nulos en los datos de la primera ingesta
+        schema= frame.schema if isinstance(frame, pl.DataFrame) else frame.collect_schema()
+        nulos= frame.select(pl.all().null_count())
+        if isinstance(nulos, pl.LazyFrame): 
+            nulos= nulos.collect(engine='streaming')
+        
+        contrato= self.registry.register(kind=CONTRACT, valor={
+            'columns': {col: {'dtype': str(dtype), 'nullable': nulos[col].item() > 0} for col, dtype in schema.items()}
+        })
+        logger.info('Se guardo la primera ingesta de datos para el schema exitosamente.')
+        return contrato
+    
+    def _contract(self, frame: Union[pl.DataFrame, pl.LazyFrame]) -> Dict[str, Any]: 
+        if self.contract is None: 
+            self.contract= self.registry.get(kind=CONTRACT) or self._first_ingest(frame=frame)
+        return self.contract
+    
+    def _compile(self, columnas: Dict[str, Dict[str, Any]]) -> List[pl.Expr]: 
+        for col in self.rules: 
+            if col not in columnas: 
+                logger.warning(f'La regla de validacion de la columna {col} no aplica, la columna no existe en la primera ingesta')
+        
+        plan= []
+        for col, regla in columnas.items(): 
+            config= self.rules.get(col)
+            nullable= regla['nullable'] if config is None or config.nullable is None else config.nullable
+            if not nullable: 
+                plan.append(pl.col(col).null_count().alias(f'{col}{SEP}nulos'))
+            if config is None: 
+                continue
+            
+            if config.min is not None: 
+                plan.append((pl.col(col) < config.min).sum().alias(f'{col}{SEP}menor_a_{config.min}'))
+            if config.max is not None: 
+                plan.append((pl.col(col) > config.max).sum().alias(f'{col}{SEP}mayor_a_{config.max}'))
+            if config.categories is not None: 
+                plan.append((pl.col(col).is_not_null() & ~pl.col(col).is_in(config.categories)).sum().alias(f'{col}{SEP}fuera_de_categorias'))
+        return plan
+    
+    def _schema_violations(self, schema: pl.Schema, columnas: Dict[str, Dict[str, Any]]) -> Dict[str, str]: 
+        #Columnas y tipos se comparan contra el schema, sin leer datos
+        errores= {}
+        for col in columnas: 
+            if col not in schema: 
+                errores[col]= 'columna faltante'
+            elif str(schema[col]) != columnas[col]['dtype']: 
+                errores[col]= f'tipo {schema[col]} en lugar de {columnas[col]["dtype"]}'
+        for col in schema: 
+            if col not in columnas: 
+                errores[col]= 'columna nueva'
+        return errores
+    
+    def violations(self, frame: Union[pl.DataFrame, pl.LazyFrame]) -> Dict[str, Any]: 
+        #Un batch vacio no tiene filas que validar ni sirve para inferir los nulos de la primera ingesta
+        if isinstance(frame, pl.DataFrame) and frame.height == 0: 
+            return {}
+        columnas= self._contract(frame=frame)['columns']
+        schema= frame.schema if isinstance(frame, pl.DataFrame) else frame.collect_schema()
+        errores= self._schema_violations(schema=schema, columnas=columnas)
+        if errores: 
+            return errores
+        
+        if self._plan is None: 
+            self._plan= self._compile(columnas=columnas)
+        if not self._plan: 
+            return {}
+        
+        conteos= frame.select(self._plan)
+        if isinstance(conteos, pl.LazyFrame): 
+            conteos= conteos.collect(engine='streaming')
+        return {regla: conteos[regla].item() for regla in conteos.columns if conteos[regla].item()}
+    
+    def validation_schema(self, frame: Union[pl.DataFrame, pl.LazyFrame]) -> None: 
+        #Un LazyFrame se valida completo con el engine de streaming; la decision lazy pasa una muestra
+        errores= self.violations(frame=frame)
+        if errores: 
+            resumen= ', '.join(f'{regla}: {valor}' for regla, valor in errores.items())
+            logger.error(f'\nLos datos de ingesta han cambiado. Reglas con errores: {resumen}')
+            raise ValueError(f'Los datos de ingesta han cambiado. Reglas con errores: {resumen}')
+        logger.info('Validacion exitosa. Los datos siguen el schema original')
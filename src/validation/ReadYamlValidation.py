@@ -2,6 +2,7 @@ import yaml
 import tomli
 from pathlib import Path
 import logging
+from typing import Dict, Any, Optional
 from pydantic import BaseModel
 
 from .ConfigValidation import validation_yaml
@@ -10,15 +11,22 @@ logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(mess
 logger= logging.getLogger(__name__)
 
 class ReadSchemaValidation: 
-    def __init__(self, archivo: str):
+    def __init__(self, archivo: str, overrides: Optional[Dict[str, Dict[str, Any]]]=None):
         self.archivo= Path(archivo)
+        #Valores por seccion que reemplazan a los del archivo antes de validar, p. ej. los de la linea de comandos
+        self.overrides= overrides or {}
+    
+    def _merge(self, lectura: Dict[str, Any]) -> Dict[str, Any]: 
+        for seccion, valores in self.overrides.items(): 
+            lectura[seccion]= {**(lectura.get(seccion) or {}), **valores}
+        return lectura
     
     def read_yaml(self) -> BaseModel: 
         try: 
             with open(self.archivo, 'r') as file: 
                 lectura= yaml.safe_load(file)
                 logger.info(f'\nSe leyó correctamente el archivo {self.archivo.name}')
-            validacion= validation_yaml(**lectura)
+            validacion= validation_yaml(**self._merge(lectura=lectura))
             logger.info(f'Se validó correctamente el schema del yaml para el archivo {self.archivo.name}')
             return validacion
         except yaml.YAMLError: 
@@ -33,7 +41,7 @@ class ReadSchemaValidation:
             with open(self.archivo, 'r') as file: 
                 lectura= tomli.load(file)
                 logger.info(f'\nSe leyó correctamente el archivo {self.archivo.name}')
-            validacion= validation_yaml(**lectura)
+            validacion= validation_yaml(**self._merge(lectura=lectura))
             logger.info(f'Se validó correctamente el schema del toml para el archivo {self.archivo.name}')
             return validacion
         except tomli.TOMLDecodeError: 
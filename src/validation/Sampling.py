@@ -0,0 +1,152 @@
+import io
+import logging
+import math
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import polars as pl
+
+from ..etl.ScanPushdown import ScanPushdown
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+class CsvBlockSampler: 
+    #Muestra de un CSV sin recorrerlo: el rango de bytes se parte en max_blocks franjas y de cada una se lee un
+    #bloque en un offset al azar. Se descarta la fila cortada al inicio y al final de cada bloque (se resincroniza
+    #en el salto de linea) y se toman filas al azar en proporcion. Se leen unas pocas veces los bytes de la muestra.
+    #Un bloque con filas que no son del schema inferido del inicio del archivo es un error, no se descarta
+    HEAD_BYTES= 64*1024
+    #Saltos de linea que se prueban para resincronizar un bloque que empezo dentro de un campo entre comillas
+    RESYNC_ATTEMPTS= 8
+    
+    def __init__(self, archivo: Path, n_rows: int, max_blocks: int=16, seed: Optional[int]=None): 
+        self.archivo= Path(archivo)
+        self.n_rows= max(int(n_rows), 1)
+        self.max_blocks= max_blocks
+        self.rng= np.random.default_rng(seed)
+    
+    def _head(self) -> Tuple[bytes, int, float]: 
+        #Header, offset de la primera fila y bytes promedio por fila en el inicio del archivo
+        with open(self.archivo, 'rb') as file: 
+            inicio= file.read(self.HEAD_BYTES)
+        fin_header= inicio.find(b'\n')+1
+        if fin_header == 0: 
+            return inicio, len(inicio), float(max(len(inicio), 1))
+        cuerpo= inicio[fin_header:]
+        return inicio[:fin_header], fin_header, len(cuerpo)/max(cuerpo.count(b'\n'), 1)
+    
+    @staticmethod
+    def _complete_rows(bloque: bytes) -> bytes: 
+        #Hasta el ultimo salto de linea fuera de comillas, suponiendo que el bloque empieza en una fila;
+        #una fila a medio escribir al final o cortada por el tamaño del bloque no se lee
+        arr= np.frombuffer(bloque, dtype=np.uint8)
+        paridad= np.cumsum(arr == ord('"'), dtype=np.uint8) & 1
+        saltos= np.flatnonzero((arr == 10) & (paridad == 0))
+        return bloque[:int(saltos[-1])+1] if saltos.size else b''
+    
+    def _parse(self, header: bytes, bloque: bytes, schema: pl.Schema, offset: int, resync: bool) -> Optional[pl.DataFrame]: 
+        #Si el offset cayo dentro de un campo entre comillas con saltos de linea se prueba desde el siguiente salto.
+        #Un bloque que no se puede leer con ningun inicio tiene filas que no son del schema: es un error de validacion
+        error= None
+        for _ in range(self.RESYNC_ATTEMPTS if resync else 1): 
+            if resync: 
+                bloque= bloque[bloque.find(b'\n')+1:]
+            filas= self._complete_rows(bloque=bloque)
+            if not filas: 
+                continue
+            try: 
+                return pl.read_csv(io.BytesIO(header+filas), schema=schema)
+            except (pl.exceptions.ComputeError, pl.exceptions.ShapeError) as e: 
+                error= str(e).splitlines()[0]
+        if error is None: 
+            return None
+        logger.error(f'El bloque en el byte {offset} de {self.archivo.name} no sigue el schema del archivo: {error}')
+        raise ValueError(f'El bloque en el byte {offset} de {self.archivo.name} no sigue el schema del archivo: {error}')
+    
+    def sample(self, pushdown: Optional[ScanPushdown]=None, rango: Optional[Tuple[int, int]]=None) -> pl.DataFrame: 
+        #rango son los offsets de las filas a muestrear (la carga incremental solo valida lo nuevo)
+        header, primera_fila, bytes_por_fila= self._head()
+        inicio, fin= rango or (primera_fila, self.archivo.stat().st_size)
+        inicio= max(inicio, primera_fila)
+        if fin <= inicio: 
+            return pl.DataFrame()
+        #Mismo schema que infiere el scan de la carga
+        schema= pl.scan_csv(self.archivo).collect_schema()
+        
+        bloques= min(self.max_blocks, self.n_rows)
+        cuota= math.ceil(self.n_rows/bloques)
+        #Margen para las dos filas cortadas y filas mas largas que las del inicio
+        tamano= int((cuota+2)*bytes_por_fila*2)
+        if tamano*bloques >= fin-inicio: 
+            offsets, tamano, cuota= [inicio], fin-inicio, self.n_rows
+        else: 
+            franja= (fin-inicio)/bloques
+            offsets= [int(inicio + k*franja + self.rng.uniform(0, max(franja-tamano, 0))) for k in range(bloques)]
+        
+        muestras= []
+        leidos= 0
+        with open(self.archivo, 'rb') as file: 
+            for offset in offsets: 
+                file.seek(offset)
+                bloque= file.read(min(tamano, fin-offset))
+                frame= self._parse(header=header, bloque=bloque, schema=schema, offset=offset, resync=offset != inicio)
+                if frame is None: 
+                    continue
+                leidos+= 1
+                if pushdown is not None: 
+                    frame= pushdown.apply(frame)
+                if frame.height > cuota: 
+                    frame= frame.sample(n=cuota, seed=int(self.rng.integers(2**32)))
+                muestras.append(frame)
+        
+        #Con bytes por leer una muestra vacia validaria sin datos; los filtros del scan si pueden dejarla sin filas
+        if leidos == 0: 
+            logger.error(f'No se pudo leer ninguna fila completa entre los bytes {inicio} y {fin} de {self.archivo.name}')
+            raise ValueError(f'No se pudo leer ninguna fila completa entre los bytes {inicio} y {fin} de {self.archivo.name}')
+        muestra= pl.concat(muestras, how='vertical_relaxed')
+        logger.info(f'Muestra por bloques de {self.archivo.name}: {muestra.height} filas de {leidos} bloques de {tamano} bytes')
+        return muestra
+
+class RowGroupSampler: 
+    #Muestra estratificada por grupo de filas de un Parquet: se leen como maximo max_row_groups grupos repartidos
+    #a lo largo del archivo (incluyendo el primero y el ultimo) y de cada uno se toman filas al azar en proporcion
+    #a su tamaño. Asi se ven los datos del final del archivo leyendo una cantidad acotada de grupos
+    def __init__(self, archivo: Path, n_rows: int, max_row_groups: int=16, seed: Optional[int]=None): 
+        self.archivo= Path(archivo)
+        self.n_rows= max(int(n_rows), 1)
+        self.max_row_groups= max_row_groups
+        self.rng= np.random.default_rng(seed)
+    
+    def _strata(self, grupos: List[int]) -> List[int]: 
+        if len(grupos) <= self.max_row_groups: 
+            return grupos
+        posiciones= np.linspace(0, len(grupos)-1, num=self.max_row_groups).round().astype(int)
+        return [grupos[i] for i in sorted(set(posiciones.tolist()))]
+    
+    def sample(self, pushdown: Optional[ScanPushdown]=None) -> pl.DataFrame: 
+        #Los estratos son los grupos que quedan despues de la poda por estadisticas y de la marca de agua
+        import pyarrow.parquet as pp
+        parquet_file= pp.ParquetFile(self.archivo)
+        metadata= parquet_file.metadata
+        grupos= pushdown.row_groups(metadata=metadata) if pushdown is not None else list(range(metadata.num_row_groups))
+        columnas= pushdown.read_columns() if pushdown is not None else None
+        estratos= self._strata(grupos=grupos)
+        filas_estratos= sum(metadata.row_group(i).num_rows for i in estratos)
+        if not estratos or filas_estratos == 0: 
+            return pl.DataFrame()
+        
+        muestras= []
+        for i in estratos: 
+            cuota= math.ceil(self.n_rows*metadata.row_group(i).num_rows/filas_estratos)
+            frame= pl.from_arrow(parquet_file.read_row_group(i, columns=columnas))
+            if pushdown is not None: 
+                frame= pushdown.apply(frame)
+            if frame.height > cuota: 
+                frame= frame.sample(n=cuota, seed=int(self.rng.integers(2**32)))
+            muestras.append(frame)
+        
+        muestra= pl.concat(muestras, how='vertical_relaxed')
+        logger.info(f'Muestra estratificada de {self.archivo.name}: {muestra.height} filas de {len(estratos)} de {len(grupos)} grupos de filas')
+        return muestra
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(levelname)s-%(asctime)s-%(message)s')
+logger= logging.getLogger(__name__)
+
+#Tipos de entrada del registro por tabla
+CONFIG= 'config'
+DATE_FORMATS= 'date_formats'
+CONTRACT= 'contract'
+
+#Pickles de versiones anteriores en el directorio de trabajo, se importan a la primera tabla que corre
+LEGACY_CONFIG= Path('schema_config.pkl')
+LEGACY_CONTRACT= Path('primer_ingesta_schema.pkl')
+
+def config_entry(diccionario: Dict[str, Any]) -> Dict[str, Any]: 
+    #schema_config en valores de JSON: la estrategia de renombrado por su valor y date_format como texto
+    return {
+        'column_naming': getattr(diccionario.get('column_naming'), 'value', diccionario.get('column_naming')),
+        'date_format': str(diccionario.get('date_format')),
+        'data_type': diccionario.get('data_type'),
+        'decimal_precision': diccionario.get('decimal_precision')
+    }
+
+class SchemaRegistry: 
+    #Registro de la primera ingesta por tabla destino en SQLite: config de schema_config, formatos de fecha
+    #y contrato de columnas y tipos. Cada cambio agrega una version; la lectura es la ultima version por
+    #llave primaria. Varias tablas y corridas al mismo tiempo comparten el archivo sin pisarse
+    def __init__(self, path: Path, table_name: str): 
+        self.path= Path(path)
+        self.table_name= table_name
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+    
+    def _connect(self) -> sqlite3.Connection: 
+        conn= sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS schema_registry (
+            table_name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            valor TEXT NOT NULL,
+            creado TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (table_name, kind, version)
+        )''')
+        return conn
+    
+    @staticmethod
+    def fingerprint(valor: Dict[str, Any]) -> str: 
+        return hashlib.sha256(json.dumps(valor, sort_keys=True, default=str).encode()).hexdigest()
+    
+    def _latest(self, conn: sqlite3.Connection, kind: str) -> Optional[Dict[str, Any]]: 
+        fila= conn.execute(
+            'SELECT version, fingerprint, valor FROM schema_registry WHERE table_name = ? AND kind = ? ORDER BY version DESC LIMIT 1',
+            (self.table_name, kind)
+        ).fetchone()
+        if fila is None: 
+            return None
+        return {'version': fila[0], 'fingerprint': fila[1], 'valor': json.loads(fila[2])}
+    
+    def _insert(self, conn: sqlite3.Connection, kind: str, valor: Dict[str, Any], version: int) -> None: 
+        conn.execute(
+            'INSERT INTO schema_registry (table_name, kind, version, fingerprint, valor) VALUES (?, ?, ?, ?, ?)',
+            (self.table_name, kind, version, self.fingerprint(valor=valor), json.dumps(valor, default=str))
+        )
+        logger.info(f'Registro de schema de {self.table_name}: {kind} version {version}')
+    
+    def entry(self, kind: str) -> Optional[Dict[str, Any]]: 
+        conn= self._connect()
+        try: 
+            return self._latest(conn=conn, kind=kind)
+        finally: 
+            conn.close()
+    
+    def get(self, kind: str) -> Optional[Dict[str, Any]]: 
+        ultima= self.entry(kind=kind)
+        return ultima['valor'] if ultima else None
+    
+    def register(self, kind: str, valor: Dict[str, Any]) -> Dict[str, Any]: 
+        #Primera ingesta: si otra corrida ya registro la entrada se usa esa
+        conn= self._connect()
+        try: 
+            conn.execute('BEGIN IMMEDIATE')
+            ultima= self._latest(conn=conn, kind=kind)
+            if ultima is None: 
+                self._insert(conn=conn, kind=kind, valor=valor, version=1)
+            conn.execute('COMMIT')
+            return ultima['valor'] if ultima else valor
+        except Exception: 
+            conn.execute('ROLLBACK')
+            raise
+        finally: 
+            conn.close()
+    
+    def update(self, kind: str, valores: Dict[str, Any]) -> Dict[str, Any]: 
+        #Agrega llaves a la ultima version; si cambia algo se guarda como una version nueva
+        conn= self._connect()
+        try: 
+            conn.execute('BEGIN IMMEDIATE')
+            ultima= self._latest(conn=conn, kind=kind)
+            valor= {**(ultima['valor'] if ultima else {}), **valores}
+            if ultima is None or self.fingerprint(valor=valor) != ultima['fingerprint']: 
+                self._insert(conn=conn, kind=kind, valor=valor, version=ultima['version']+1 if ultima else 1)
+            conn.execute('COMMIT')
+            return valor
+        except Exception: 
+            conn.execute('ROLLBACK')
+            raise
+        finally: 
+            conn.close()
+    
+    @staticmethod
+    def _convert_contract(contrato: Any) -> Dict[str, Any]: 
+        #pa.DataFrameSchema de versiones con pandera: cada pa.Column tiene el tipo de Polars y si admite nulos
+        if isinstance(contrato, dict): 
+            return contrato
+        return {'columns': {col: {'dtype': str(columna.dtype.type), 'nullable': bool(columna.nullable)} for col, columna in contrato.columns.items()}}
+    
+    def migrate_legacy(self) -> None: 
+        #Los pickles no tenian tabla: se importan a la tabla que corre primero y se renombran para no repetirlo
+        if not LEGACY_CONFIG.exists() and not LEGACY_CONTRACT.exists(): 
+            return
+        
+        if LEGACY_CONFIG.exists(): 
+            with open(LEGACY_CONFIG, 'rb') as f: 
+                diccionario= pickle.load(f)
+            formatos= diccionario.pop('date_formats', None)
+            self.register(kind=CONFIG, valor=config_entry(diccionario=diccionario))
+            if formatos: 
+                self.update(kind=DATE_FORMATS, valores=formatos)
+            LEGACY_CONFIG.rename(LEGACY_CONFIG.with_suffix('.pkl.migrado'))
+        
+        if LEGACY_CONTRACT.exists(): 
+            with open(LEGACY_CONTRACT, 'rb') as f: 
+                contrato= pickle.load(f)
+            self.register(kind=CONTRACT, valor=self._convert_contract(contrato=contrato))
+            LEGACY_CONTRACT.rename(LEGACY_CONTRACT.with_suffix('.pkl.migrado'))
+        logger.info(f'Se migraron los pickles de la primera ingesta al registro de schema de la tabla {self.table_name}')
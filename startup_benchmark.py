@@ -0,0 +1,53 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+#Dependencias pesadas que no deberian cargarse solo por importar el pipeline
+MODULOS_PESADOS= ['polars', 'pydantic', 'yaml', 'numpy', 'pyarrow', 'pyarrow.parquet', 'pyarrow.csv', 'pyarrow.compute', 'psycopg2', 'duckdb', 'pandera', 'dotenv', 'psutil']
+
+#Se mide dentro de un interprete nuevo para no reutilizar modulos ya importados
+CODIGO= '''
+import json, sys, time
+inicio= time.perf_counter()
+import {modulo}
+importacion= time.perf_counter()-inicio
+print(json.dumps({{'importacion': importacion, 'modulos': [m for m in {pesados} if m in sys.modules]}}))
+'''
+
+def medir(modulo: str, corridas: int) -> dict: 
+    codigo= CODIGO.format(modulo=modulo, pesados=MODULOS_PESADOS)
+    raiz= Path(__file__).resolve().parent
+    totales, importaciones= [], []
+    modulos= []
+    
+    for _ in range(corridas): 
+        inicio= time.perf_counter()
+        salida= subprocess.run([sys.executable, '-c', codigo], cwd=raiz, capture_output=True, text=True, check=True)
+        totales.append(time.perf_counter()-inicio)
+        resultado= json.loads(salida.stdout.strip().splitlines()[-1])
+        importaciones.append(resultado['importacion'])
+        modulos= resultado['modulos']
+    
+    return {
+        'modulo': modulo,
+        'corridas': corridas,
+        'proceso_mediana_ms': statistics.median(totales)*1000,
+        'importacion_mediana_ms': statistics.median(importaciones)*1000,
+        'importacion_min_ms': min(importaciones)*1000,
+        'modulos_pesados': modulos
+    }
+
+if __name__ == '__main__': 
+    parser= argparse.ArgumentParser(description='Tiempo de arranque del pipeline: importacion en un interprete nuevo')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--module', action='append', default=None, help='Modulo a importar, se puede repetir')
+    args= parser.parse_args()
+    
+    for modulo in args.module or ['src.etl.EngineDecision']: 
+        resultado= medir(modulo=modulo, corridas=args.runs)
+        print(f"{resultado['modulo']}: proceso {resultado['proceso_mediana_ms']:.0f} ms, importacion {resultado['importacion_mediana_ms']:.0f} ms (min {resultado['importacion_min_ms']:.0f} ms) en {resultado['corridas']} corridas")
+        print(f"  dependencias cargadas: {', '.join(resultado['modulos_pesados'])}")